@@ -3,42 +3,216 @@ from gevent import monkey
 monkey.patch_all()
 
 import os
-import io
+import hmac
 import base64
 import re
-import requests
+import json
 import logging
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response
 from flask_socketio import SocketIO, emit, join_room
-from menu_config import menu_config
+from menu_config import MENU_FILE, load_menu_config
+from menu_index import MenuStore
+from state_backend import make_state_backend, page_history
+from sessions import SessionRegistry
+from chat_log import ChatLog
+from admin_feed import AdminFeed, PresenceList, ADMIN_ROOM
 from datetime import datetime, timezone
 import uuid
+import atexit
+import time
 
 # PDF generation
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
+from pdf_render import create_pdf_bytes
+from summary_jobs import SummaryJobQueue, ProcessOffloader, JobCancelled
+from http_client import UpstreamClient, CircuitBreaker
+from summary_cache import SummaryCache
+from summary_prompt import PromptBuilder, map_reduce_summary
+from sentiment import LocalSentiment
+from email_outbox import EmailOutbox, PermanentDeliveryError
+from artifact_cache import ArtifactCache, artifact_key
+from metrics import Registry, HandlerMetrics, LoopMonitor
+from profiling import Tracer, BlockingMonitor, SamplingProfiler, ProfilerBusy
+from summary_trace import TraceBuffer, payload_size
+from contextlib import nullcontext
+import gevent
+from gevent.pool import Pool
 
 # --- Config basic logging ---
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("build-a-chat")
 
+
+def run_native(fn, *args):
+    """Corre fn en el threadpool nativo del hub: fsync y sqlite bloquean el hilo, no el loop."""
+    return gevent.get_hub().threadpool.apply(fn, args)
+
+
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('FLASK_SECRET', 'secret!')
 
+# Con REDIS_URL el estado y los emits (broadcast/rooms) se comparten entre workers y nodos
+REDIS_URL = os.environ.get('REDIS_URL')
+# Con varios workers (o nodos detrás de REDIS_URL) y sin sticky sessions, cada request del
+# long-polling puede caer en otro proceso y el handshake se rompe: ahí los clientes usan sólo
+# websocket. Con un solo worker se conserva el fallback a polling (proxies sin websocket).
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', '1'))
+if WEB_CONCURRENCY > 1 and not REDIS_URL:
+    # sin Redis cada worker tendría su propio estado, presencia y bitácora (ver Procfile)
+    raise RuntimeError("WEB_CONCURRENCY > 1 requiere REDIS_URL")
+SOCKET_TRANSPORTS = ['websocket'] if REDIS_URL or WEB_CONCURRENCY > 1 else ['polling', 'websocket']
+
 # allow CORS for socket connections (use more strict origins in production if puedes)
-socketio = SocketIO(app, async_mode='gevent', manage_session=False, cors_allowed_origins="*")
+socketio = SocketIO(app, async_mode='gevent', manage_session=False, cors_allowed_origins="*",
+                    message_queue=REDIS_URL)
 
 # Config / secrets from env
 GEMMA_API_KEY = os.environ.get('GEMMA_API_KEY')
 GEMMA_MODEL = os.environ.get('GEMMA_MODEL', 'gemma2-9b-it')
+GEMMA_API_BASE = os.environ.get('GEMMA_API_BASE', 'https://generativelanguage.googleapis.com')  # stand-in local en pruebas de carga
+GEMMA_STREAM = os.environ.get('GEMMA_STREAM', '1') == '1'  # summary_chunk mientras se genera
 SENTIMENT_API_URL = os.environ.get('SENTIMENT_API_URL')  
+# 'remote' (default) = la API de SENTIMENT_API_URL; 'local' = modelo sklearn en proceso, opt-in,
+# cargado de SENTIMENT_MODEL_PATH (artefacto evaluado de train_sentiment.py; la API queda de respaldo)
+SENTIMENT_BACKEND = os.environ.get('SENTIMENT_BACKEND', 'remote')
+SENTIMENT_MODEL_PATH = os.environ.get('SENTIMENT_MODEL_PATH')
 RESEND_API_KEY = os.environ.get('RESEND_API_KEY')
 RESEND_FROM = os.environ.get('RESEND_FROM', 'onboarding@resend.dev')
 RESEND_API_URL = os.environ.get('RESEND_API_URL', 'https://api.resend.com/emails')
+MENU_RELOAD_INTERVAL = float(os.environ.get('MENU_RELOAD_INTERVAL', '5'))  # segundos; 0 desactiva
+MENU_SEARCH = os.environ.get('MENU_SEARCH', '1') != '0'  # responder texto libre con el nodo del menú más parecido
+MAX_TELEMETRY_BATCH = 50  # selecciones por evento 'menu_telemetry'
+AUTOCOMPLETE_LIMIT = 8          # sugerencias por defecto en 'menu_autocomplete'
+MAX_AUTOCOMPLETE = 20
+MAX_AUTOCOMPLETE_QUERY = 64     # caracteres de la consulta que se consideran
+CHAT_MAX_MESSAGES = int(os.environ.get('CHAT_MAX_MESSAGES', '200'))            # por conversación
+CHAT_MAX_BYTES = int(os.environ.get('CHAT_MAX_BYTES', str(256 * 1024)))        # por conversación
+CHAT_MEMORY_BUDGET = int(os.environ.get('CHAT_MEMORY_BUDGET', str(64 * 1024 * 1024)))  # total
+# Bitácora durable en disco (CHAT_LOG_DIR vacío la desactiva). Con REDIS_URL el historial
+# ya vive fuera del proceso y varios workers no pueden compartir los mismos segmentos; sin
+# él corre un solo worker, y un segundo proceso sobre el mismo directorio no arranca (LOCK).
+CHAT_LOG_DIR = os.environ.get('CHAT_LOG_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'chat_log'))
+# La bitácora retiene más mensajes que los que se muestran: los resúmenes leen todo lo
+# retenido. Sin bitácora (REDIS_URL o CHAT_LOG_DIR vacío) el resumen sólo ve lo que guarda
+# el estado, es decir los últimos CHAT_MAX_MESSAGES (y CHAT_MAX_BYTES).
+SUMMARY_MAX_MESSAGES = int(os.environ.get('SUMMARY_MAX_MESSAGES', '2000'))   # por conversación
+CHAT_LOG_FLUSH_INTERVAL = float(os.environ.get('CHAT_LOG_FLUSH_INTERVAL', '0.05'))  # group commit
+CHAT_LOG_COMPACT_INTERVAL = float(os.environ.get('CHAT_LOG_COMPACT_INTERVAL', '300'))
+HISTORY_PAGE_SIZE = int(os.environ.get('HISTORY_PAGE_SIZE', '50'))  # mensajes por página de historial
+SUMMARY_WORKERS = int(os.environ.get('SUMMARY_WORKERS', '4'))         # resúmenes simultáneos
+SUMMARY_QUEUE_SIZE = int(os.environ.get('SUMMARY_QUEUE_SIZE', '100'))  # resúmenes en espera
+PDF_PROCESSES = int(os.environ.get('PDF_PROCESSES', '2'))              # 0 = render en el propio worker
+PDF_MAX_MESSAGES = int(os.environ.get('PDF_MAX_MESSAGES', '100'))      # mensajes transcritos en el PDF
+ARTIFACT_CACHE_BYTES = int(os.environ.get('ARTIFACT_CACHE_BYTES', str(32 * 1024 * 1024)))  # PDFs en memoria
+ARTIFACT_SPILL_DIR = os.environ.get('ARTIFACT_SPILL_DIR', '')  # vacío = sin spill a disco
+ARTIFACT_SPILL_BYTES = int(os.environ.get('ARTIFACT_SPILL_BYTES', str(256 * 1024 * 1024)))
+SUMMARY_CACHE_SIZE = int(os.environ.get('SUMMARY_CACHE_SIZE', '500'))     # conversaciones
+SUMMARY_CACHE_TTL = float(os.environ.get('SUMMARY_CACHE_TTL', '3600'))     # segundos
+SUMMARY_TOKEN_BUDGET = int(os.environ.get('SUMMARY_TOKEN_BUDGET', '6000'))  # tokens por prompt a Gemma
+SUMMARY_MAP_CONCURRENCY = int(os.environ.get('SUMMARY_MAP_CONCURRENCY', '4'))  # trozos resumidos a la vez
+UPSTREAM_CONNECT_TIMEOUT = float(os.environ.get('UPSTREAM_CONNECT_TIMEOUT', '3.05'))
+UPSTREAM_RETRIES = int(os.environ.get('UPSTREAM_RETRIES', '2'))
+UPSTREAM_BREAKER_THRESHOLD = int(os.environ.get('UPSTREAM_BREAKER_THRESHOLD', '5'))  # fallos seguidos
+UPSTREAM_BREAKER_RESET = float(os.environ.get('UPSTREAM_BREAKER_RESET', '30'))        # segundos abierto
+# Bandeja de salida de correos (SQLite): el resumen se encola y un despachador lo entrega
+OUTBOX_DB = os.environ.get('OUTBOX_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'outbox.sqlite3'))
+OUTBOX_WORKERS = int(os.environ.get('OUTBOX_WORKERS', '4'))          # entregas simultáneas
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', '6'))
+OUTBOX_INTERVAL = float(os.environ.get('OUTBOX_INTERVAL', '1'))       # segundos entre lotes
+OUTBOX_LEASE = float(os.environ.get('OUTBOX_LEASE', '300'))  # un 'sending' más viejo se da por huérfano
+ADMIN_BATCH_INTERVAL = float(os.environ.get('ADMIN_BATCH_INTERVAL', '0.075'))  # tick del feed admin
+SESSION_IDLE_TTL = float(os.environ.get('SESSION_IDLE_TTL', '300'))  # segundos sin socket antes de expirar la sesión
+SESSION_SECRET = os.environ.get('SESSION_SECRET')  # firma los tokens; fijo para reanudar tras un reinicio
+LOOP_LAG_LIMIT = float(os.environ.get('LOOP_LAG_LIMIT', '1.0'))  # segundos de loop bloqueado -> /healthz 503
+BLOCKING_THRESHOLD = float(os.environ.get('BLOCKING_THRESHOLD', '0.25'))  # bloqueo del hub que se registra; 0 = off
+SLOW_SPAN_THRESHOLD = float(os.environ.get('SLOW_SPAN_THRESHOLD', '0.5'))  # spans más lentos se loguean
+SUMMARY_TRACE_KEEP = int(os.environ.get('SUMMARY_TRACE_KEEP', '200'))  # trazas de resumen en memoria
+# ADMIN_TOKEN protege el panel (los sockets del admin lo mandan en el handshake), /metrics y los
+# endpoints /admin/* de diagnóstico. Sin token el panel y /metrics quedan abiertos y el diagnóstico
+# desactivado.
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+if not ADMIN_TOKEN:
+    logger.warning("ADMIN_TOKEN no configurado: el panel del admin no pide autenticación")
+
+# Métricas (/metrics, formato Prometheus)
+METRICS = Registry()
+HANDLER_METRICS = HandlerMetrics(METRICS)
+UPSTREAM_SECONDS = METRICS.histogram('upstream_request_seconds',
+                                     'Duración de cada intento HTTP a Gemma / polaridad / Resend',
+                                     ('upstream', 'outcome'))
+
+# Spans por handler y por llamada saliente; bloqueos del hub con su pila
+TRACER = Tracer(slow_threshold=SLOW_SPAN_THRESHOLD)
+BLOCKING_MONITOR = BlockingMonitor(TRACER, BLOCKING_THRESHOLD)
+if BLOCKING_THRESHOLD > 0:
+    BLOCKING_MONITOR.install()
+PROFILER = SamplingProfiler()
+
+def socket_event(event):
+    """@socketio.on con latencia y errores por evento en /metrics y un span por llamada."""
+    def decorator(fn):
+        traced = TRACER.instrument(f'socket.{event}', lambda: {'event': event, 'user_id': current_user()})(fn)
+        return socketio.on(event)(HANDLER_METRICS.instrument(event)(traced))
+    return decorator
+
+# Clientes HTTP salientes: pool keep-alive, reintentos y circuit breaker por upstream
+def _upstream(name, read_timeout):
+    return UpstreamClient(
+        name,
+        connect_timeout=UPSTREAM_CONNECT_TIMEOUT,
+        read_timeout=read_timeout,
+        retries=UPSTREAM_RETRIES,
+        breaker=CircuitBreaker(UPSTREAM_BREAKER_THRESHOLD, UPSTREAM_BREAKER_RESET),
+        observer=lambda upstream, outcome, seconds: UPSTREAM_SECONDS.observe(seconds, upstream, outcome),
+        tracer=TRACER,
+    )
 
-# In-memory data
-chats = {}  # { user_id: [ messageObj, ... ] }
-clientes_conectados = {}  # { user_id: { "name": str } }
+GEMMA_HTTP = _upstream('gemma', 30)
+SENTIMENT_HTTP = _upstream('sentiment', 15)
+RESEND_HTTP = _upstream('resend', 30)
+UPSTREAMS = (GEMMA_HTTP, SENTIMENT_HTTP, RESEND_HTTP)
+
+# Menú precompilado (valida ids duplicados al arrancar) y recargable en caliente
+MENU_STORE = MenuStore(MENU_FILE, load_menu_config)
+if MENU_RELOAD_INTERVAL > 0:
+    socketio.start_background_task(MENU_STORE.watch, MENU_RELOAD_INTERVAL, socketio.sleep)
+
+# Estado del chat: historiales { user_id: [ messageObj, ... ] } y clientes { user_id: { "name": str } }
+STATE = make_state_backend(REDIS_URL, CHAT_MAX_MESSAGES, CHAT_MAX_BYTES, CHAT_MEMORY_BUDGET)
+
+CHAT_LOG = ChatLog(CHAT_LOG_DIR, max_records=max(SUMMARY_MAX_MESSAGES, CHAT_MAX_MESSAGES),
+                   offload=run_native) \
+    if CHAT_LOG_DIR and not REDIS_URL else None
+if CHAT_LOG:
+    socketio.start_background_task(CHAT_LOG.run_flusher, CHAT_LOG_FLUSH_INTERVAL, socketio.sleep)
+    socketio.start_background_task(CHAT_LOG.run_compactor, CHAT_LOG_COMPACT_INTERVAL, socketio.sleep)
+    atexit.register(CHAT_LOG.close)
+
+# Polaridad en proceso: el modelo se carga una vez y se comparte entre peticiones
+SENTIMENT_ENGINE = None
+if SENTIMENT_BACKEND == 'local':
+    try:
+        SENTIMENT_ENGINE = LocalSentiment.load(SENTIMENT_MODEL_PATH)
+    except Exception:
+        logger.exception("No se pudo cargar el modelo de polaridad local (SENTIMENT_MODEL_PATH=%s); "
+                         "se usará SENTIMENT_API_URL", SENTIMENT_MODEL_PATH)
+
+# Eventos para admins: sólo a la sala 'admins' y agrupados por tick
+ADMIN_FEED = AdminFeed(socketio, interval=ADMIN_BATCH_INTERVAL)
+PRESENCE = PresenceList()
+socketio.start_background_task(ADMIN_FEED.run, socketio.sleep)
+
+def _expire_session(user_id):
+    # la sesión pasó SESSION_IDLE_TTL sin socket y ningún worker la retomó desde el detach
+    # (el registro lo verifica con el marcador en STATE): ahora sí se libera la conversación
+    if STATE.get_client(user_id) is not None:
+        STATE.remove_client(user_id)
+        PRESENCE.removed(user_id)
+        actualizar_lista_admin()
+    STATE.drop_chat(user_id)
+
+# Sesiones reanudables: el token de register_name reasocia un socket nuevo con su conversación
+SESSIONS = SessionRegistry(SESSION_SECRET, SESSION_IDLE_TTL, _expire_session, shared=STATE)
+socketio.start_background_task(SESSIONS.run, socketio.sleep)
 
 # Utilities
 EMAIL_REGEX = re.compile(r"^[^@]+@[^@]+\.[^@]+$")
@@ -59,21 +233,70 @@ def make_message(text=None, sender=None, audio_url=None, extra=None):
         msg.update(extra)
     return msg
 
-def actualizar_lista_admin():
-    emit('update_chat_list', [
+def current_user():
+    """Conversación del socket actual: la de su sesión si la reanudó, si no su sid."""
+    return SESSIONS.user_for(request.sid)
+
+# sockets de este worker que se autenticaron como admin en el handshake
+ADMIN_SIDS = set()
+
+def admin_token_valid(token):
+    return bool(ADMIN_TOKEN) and isinstance(token, str) and \
+        hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8'))
+
+def is_admin_socket():
+    """La sala de admins no cuenta: se entra con admin_join, lo que importa es el handshake."""
+    return not ADMIN_TOKEN or request.sid in ADMIN_SIDS
+
+def client_name(user_id):
+    return (STATE.get_client(user_id) or {}).get('name', 'Invitado')
+
+def record_messages(user_id, *messages):
+    """
+    Guarda mensajes del chat en un solo lugar: la bitácora durable si está activa
+    (acotada por SUMMARY_MAX_MESSAGES) o, si no, el estado (CHAT_MAX_MESSAGES y bytes).
+    """
+    if CHAT_LOG:
+        CHAT_LOG.append(user_id, *messages)
+    else:
+        STATE.append_messages(user_id, *messages)
+
+def chat_history(user_id):
+    # la bitácora sobrevive a desconexiones y reinicios; el estado en memoria no
+    return CHAT_LOG.read(user_id, CHAT_MAX_MESSAGES) if CHAT_LOG else STATE.get_history(user_id)
+
+def summary_history(user_id):
+    """Todo lo retenido de la conversación (no sólo lo que se muestra) para el resumen."""
+    return CHAT_LOG.read(user_id) if CHAT_LOG else STATE.get_history(user_id)
+
+MAX_CURSOR_LENGTH = 64   # los message_id son uuid hex; cualquier otra cosa no es un cursor
+
+def history_cursor(value):
+    """message_id recibido del cliente como cursor; None si no es un texto razonable."""
+    return value if isinstance(value, str) and 0 < len(value) <= MAX_CURSOR_LENGTH else None
+
+def history_page_payload(user_id, before=None, since=None, with_polarity=False):
+    page = page_history(chat_history(user_id), before=before, since=since, limit=HISTORY_PAGE_SIZE)
+    page['user_id'] = user_id
+    if with_polarity and SENTIMENT_ENGINE:
+        # { message_id: polaridad } de la página, puntuada en un solo lote
+        analysis = SENTIMENT_ENGINE.analyze_conversation(page['messages'])
+        page['polarity'] = analysis['messages'] if analysis else {}
+    return page
+
+def chat_list_payload():
+    return [
         {'user_id': uid, 'name': info['name']}
-        for uid, info in clientes_conectados.items()
-    ], broadcast=True)
+        for uid, info in STATE.list_clients()
+    ]
+
+def actualizar_lista_admin():
+    # los cambios del tick salen juntos como un solo 'chat_list_delta'
+    ADMIN_FEED.publish_latest('chat_list_delta', PRESENCE.take_delta)
 
 def top_level_menu_payload():
-    top = []
-    for key, item in menu_config.items():
-        top.append({
-            "id": item.get("id", key),
-            "label": item.get("label", key),
-            "type": item.get("type", "info")
-        })
-    return top
+    # lista precalculada para la versión vigente del menú
+    return MENU_STORE.index.top_level
 
 # -----------------------
 #    Rutas web
@@ -84,46 +307,210 @@ def login_page():
 
 @app.route('/cliente')
 def client_page():
-    return render_template('index.html')
+    return render_template('index.html', socket_transports=SOCKET_TRANSPORTS)
 
 @app.route('/admin')
 def admin_page():
-    return render_template('admin.html')
+    return render_template('admin.html', socket_transports=SOCKET_TRANSPORTS)
+
+@app.route('/menu.json')
+def menu_bundle():
+    # árbol compilado completo; el cliente navega localmente y revalida con ETag
+    index = MENU_STORE.index
+    resp = Response(index.bundle_json, mimetype='application/json')
+    resp.set_etag(index.version)
+    resp.headers['Cache-Control'] = 'no-cache'
+    return resp.make_conditional(request)
+
+@app.route('/metrics')
+def metrics():
+    # con ADMIN_TOKEN el scraper manda el mismo Bearer (authorization en Prometheus); sin token
+    # queda abierto como el panel: sólo expone contadores agregados, ningún user_id ni texto
+    if ADMIN_TOKEN and not _admin_authorized():
+        return jsonify({"error": "no autorizado"}), 403
+    return Response(METRICS.render(), mimetype='text/plain; version=0.0.4')
+
+def _admin_authorized():
+    """Token sólo en headers (nunca en la URL: queda en logs y en el historial del navegador)."""
+    auth = request.headers.get('Authorization', '')
+    token = auth[7:] if auth.startswith('Bearer ') else request.headers.get('X-Admin-Token')
+    return admin_token_valid(token)
+
+@app.route('/admin/profile')
+def admin_profile():
+    """
+    Perfil por muestreo de `seconds` segundos (máx. 60) a `hz` muestras/s; devuelve
+    pilas colapsadas listas para flamegraph.pl o speedscope. Requiere ADMIN_TOKEN.
+    """
+    if not _admin_authorized():
+        return jsonify({"error": "no autorizado"}), 403
+    seconds = min(max(request.args.get('seconds', 10, type=float), 0.1), 60)
+    hz = min(max(request.args.get('hz', 97, type=int), 1), 1000)
+    try:
+        samples = PROFILER.profile(seconds, hz, socketio.sleep)
+    except ProfilerBusy as e:
+        return jsonify({"error": str(e)}), 409
+    resp = Response(SamplingProfiler.collapsed(samples), mimetype='text/plain')
+    resp.headers['Content-Disposition'] = f'attachment; filename="profile-{int(time.time())}.collapsed"'
+    return resp
+
+@app.route('/admin/blocking')
+def admin_blocking():
+    """Bloqueos recientes del loop (con pila y span en curso) y los spans más lentos."""
+    if not _admin_authorized():
+        return jsonify({"error": "no autorizado"}), 403
+    return jsonify({
+        "threshold": BLOCKING_THRESHOLD,
+        "blocked": BLOCKING_MONITOR.recent(),
+        "slow_spans": TRACER.slowest(request.args.get('limit', 20, type=int)),
+    })
+
+@app.route('/admin/traces')
+@app.route('/admin/traces/<trace_id>')
+def admin_traces(trace_id=None):
+    """
+    Trazas recientes del resumen. ?sort=slowest (por su etapa más lenta, o por
+    ?stage=gemma|email_send|...) o ?sort=recent; ?status=ok|error|cancelled; ?limit=.
+    Incluye p50/p95/p99 por etapa sobre el buffer.
+    """
+    if not _admin_authorized():
+        return jsonify({"error": "no autorizado"}), 403
+    if trace_id:
+        trace = SUMMARY_TRACES.get(trace_id)
+        if trace is None:
+            return jsonify({"error": "traza no encontrada"}), 404
+        return jsonify(trace.as_dict())
+    return jsonify({
+        "stages": SUMMARY_TRACES.stage_stats(),
+        "traces": SUMMARY_TRACES.query(request.args.get('sort', 'slowest'), request.args.get('stage'),
+                                       request.args.get('status'),
+                                       min(request.args.get('limit', 50, type=int), SUMMARY_TRACE_KEEP)),
+    })
 
 @app.route('/healthz')
 def healthz():
-    return jsonify({"ok": True}), 200
+    """
+    Liveness barato y sin datos internos: 503 si el loop estuvo bloqueado más de
+    LOOP_LAG_LIMIT (el worker no atiende sockets); 'degraded' con breakers abiertos:
+    el chat funciona, los resúmenes no. El detalle está en /admin/stats.
+    """
+    loop_lag = max(LOOP_MONITOR.lag, LOOP_MONITOR.stalled_for())
+    ready = loop_lag < LOOP_LAG_LIMIT
+    breakers = {u.name: 'open' if u.breaker.is_open() else 'closed' for u in UPSTREAMS}
+    status = ("ok" if 'open' not in breakers.values() else "degraded") if ready else "unavailable"
+    return jsonify({"ok": ready, "status": status, "breakers": breakers}), 200 if ready else 503
+
+@app.route('/admin/stats')
+def admin_stats():
+    """Uso del estado, upstreams, caches, bandeja de salida y sesiones. Requiere ADMIN_TOKEN."""
+    if not _admin_authorized():
+        return jsonify({"error": "no autorizado"}), 403
+    return jsonify({
+        "loop_lag": round(max(LOOP_MONITOR.lag, LOOP_MONITOR.stalled_for()), 4),
+        "loop_max_lag": round(LOOP_MONITOR.max_lag, 4),
+        "state": STATE.usage(),
+        "chat_log": CHAT_LOG.stats() if CHAT_LOG else None,
+        "upstreams": {u.name: u.stats() for u in UPSTREAMS},
+        "summary_cache": SUMMARY_CACHE.stats(),
+        "artifact_cache": ARTIFACT_CACHE.stats(),
+        "outbox": EMAIL_OUTBOX.stats(),
+        "sessions": SESSIONS.stats(),
+        "sentiment": "local" if SENTIMENT_ENGINE else ("remote" if SENTIMENT_API_URL else None),
+    })
 
 # -----------------------
 #    Socket handlers
 # -----------------------
-@socketio.on('connect')
-def handle_connect():
-    emit('connected', {'user_id': request.sid})
+@socket_event('connect')
+def handle_connect(auth=None):
+    """
+    Con {token, since} en el handshake se reanuda la sesión: el socket vuelve a su
+    conversación y recibe sólo los mensajes posteriores a `since`.
+    """
+    auth = auth if isinstance(auth, dict) else {}
+    if 'admin_token' in auth:
+        if not admin_token_valid(auth['admin_token']):
+            raise ConnectionRefusedError('admin no autorizado')
+        ADMIN_SIDS.add(request.sid)
+        emit('connected', {'user_id': request.sid, 'admin': True})
+        return
+    session = None
+    if auth.get('token'):
+        session = SESSIONS.resume(request.sid, auth['token'],
+                                  lambda uid: (STATE.get_client(uid) or {}).get('name'))
+    if session is None:
+        emit('connected', {'user_id': request.sid, 'resumed': False})
+        return
 
-@socketio.on('disconnect')
+    user_id = session.user_id
+    join_room(user_id)
+    if STATE.get_client(user_id) is None:
+        # la conversación sigue viva pero el estado no la conoce (p. ej. se limpió): se re-registra
+        STATE.set_client(user_id, {'name': session.name})
+        PRESENCE.added(user_id, session.name)
+        actualizar_lista_admin()
+    emit('connected', {'user_id': user_id, 'resumed': True, 'name': session.name})
+    since = history_cursor(auth.get('since'))
+    emit('chat_history', history_page_payload(user_id, since=since), room=request.sid)
+    ADMIN_FEED.publish('message_admin', {
+        'user_id': user_id,
+        'message': {
+            'message_id': uuid.uuid4().hex,
+            'text': f'{session.name} se ha reconectado.',
+            'timestamp': current_timestamp(),
+            'sender': 'Sistema'
+        }
+    })
+
+@socket_event('disconnect')
 def handle_disconnect():
-    user_id = request.sid
-    clientes_conectados.pop(user_id, None)
-    chats.pop(user_id, None)
-    actualizar_lista_admin()
+    if request.sid in ADMIN_SIDS:
+        ADMIN_SIDS.discard(request.sid)
+        return
+    user_id = current_user()
+    if SESSIONS.get(user_id) is not None:
+        # la conversación espera una reconexión hasta SESSION_IDLE_TTL (ver _expire_session)
+        SESSIONS.detach(request.sid)
+        return
+    _expire_session(user_id)
 
-@socketio.on('join')
-def handle_join():
-    user_id = request.sid
+@socket_event('join')
+def handle_join(data=None):
+    user_id = current_user()
     join_room(user_id)
-    chats.setdefault(user_id, [])
-    emit('chat_history', chats[user_id], room=user_id)
+    # con 'since' el cliente sólo recibe lo que se perdió; sin él, la última página
+    since = history_cursor(data.get('since')) if isinstance(data, dict) else None
+    emit('chat_history', history_page_payload(user_id, since=since), room=user_id)
 
-@socketio.on('admin_join')
+@socket_event('admin_join')
 def handle_admin_join():
-    actualizar_lista_admin()
+    if not is_admin_socket():
+        emit('admin_auth_required', room=request.sid)
+        return
+    join_room(ADMIN_ROOM)
+    emit('chat_list_snapshot', PRESENCE.snapshot(chat_list_payload()), room=request.sid)
+
+@socket_event('request_chat_list')
+def handle_request_chat_list():
+    # el admin detectó un hueco en la secuencia de deltas
+    if not is_admin_socket():
+        return
+    emit('chat_list_snapshot', PRESENCE.snapshot(chat_list_payload()), room=request.sid)
 
-@socketio.on('register_name')
+@socket_event('register_name')
 def handle_register_name(data):
-    user_id = request.sid
     name = (data or {}).get('name', 'Invitado')
-    clientes_conectados[user_id] = {'name': name}
+    session, token = SESSIONS.open(request.sid, name)
+    user_id = session.user_id
+    join_room(user_id)
+    # el cliente guarda el token y lo manda al reconectar (ver handle_connect)
+    emit('session', {'token': token, 'user_id': user_id, 'idle_ttl': SESSION_IDLE_TTL}, room=request.sid)
+    is_new = STATE.get_client(user_id) is None
+    STATE.set_client(user_id, {'name': name})
+    if is_new:
+        PRESENCE.added(user_id, name)
+    else:
+        PRESENCE.renamed(user_id, name)
 
     bienvenida_texto = make_message(
         text=f'Hola {name}, bienvenido a Build a Chat. Para empezar, escriba o presione "menu" para abrir el menú interactivo 🚀',
@@ -135,11 +522,11 @@ def handle_register_name(data):
         audio_url='/static/audio/bienvenida.mp3'
     )
 
-    chats.setdefault(user_id, []).extend([bienvenida_texto, bienvenida_audio])
+    record_messages(user_id, bienvenida_texto, bienvenida_audio)
     emit('message', bienvenida_texto, room=user_id)
     emit('message', bienvenida_audio, room=user_id)
 
-    emit('message_admin', {
+    ADMIN_FEED.publish('message_admin', {
         'user_id': user_id,
         'message': {
             'message_id': bienvenida_texto['message_id'],
@@ -147,15 +534,18 @@ def handle_register_name(data):
             'timestamp': bienvenida_texto['timestamp'],
             'sender': 'Sistema'
         }
-    }, broadcast=True)
+    })
 
     actualizar_lista_admin()
 
-@socketio.on('message')
+@socket_event('message')
 def handle_message(data):
-    user_id = request.sid
-    name = clientes_conectados.get(user_id, {}).get('name', 'Invitado')
-    text = (data.get('text') or '').strip()
+    if not isinstance(data, dict):
+        return
+    user_id = current_user()
+    name = client_name(user_id)
+    text = data.get('text')
+    text = text.strip() if isinstance(text, str) else ''
     timestamp = data.get('timestamp') or current_timestamp()
     if not text:
         return
@@ -167,13 +557,13 @@ def handle_message(data):
         "sender": name
     }
 
-    chats.setdefault(user_id, []).append(msg)
+    record_messages(user_id, msg)
     emit('message', msg, room=user_id)
-    emit('message_admin', {'user_id': user_id, 'message': msg}, broadcast=True)
+    ADMIN_FEED.publish('message_admin', {'user_id': user_id, 'message': msg})
 
     if text.lower() == "menu":
-        emit('show_menu', {'menu': top_level_menu_payload()}, room=user_id)
-        emit('message_admin', {
+        emit('show_menu', {'menu': top_level_menu_payload(), 'version': MENU_STORE.version}, room=user_id)
+        ADMIN_FEED.publish('message_admin', {
             'user_id': user_id,
             'message': {
                 'message_id': uuid.uuid4().hex,
@@ -181,91 +571,122 @@ def handle_message(data):
                 'timestamp': current_timestamp(),
                 'sender': 'Sistema'
             }
-        }, broadcast=True)
-
-@socketio.on('menu_option_selected')
-def handle_menu_option(data):
-    user_id = request.sid
-    option_id = data.get('id')
-    option = menu_config.get(option_id)
-    if not option:
-        emit('show_info', {'label': 'Error', 'text': 'Opción no encontrada.'}, room=user_id)
+        })
+    elif MENU_SEARCH:
+        _answer_from_menu(user_id, name, text)
+
+def _answer_from_menu(user_id, name, text):
+    """Responde texto libre con el nodo del menú que mejor coincide (si alguno se parece)."""
+    index = MENU_STORE.index
+    node_id = index.search.best(text)
+    if node_id is None:
         return
-
-    tipo = option.get('type')
-    if tipo == "link":
-        emit('show_link', {'label': option.get('label'), 'link': option.get('link')}, room=user_id)
-    elif tipo == "submenu":
-        submenu = [{"id": item["id"], "label": item["label"], "type": item.get("type", "info")} for item in option.get("submenu", [])]
-        emit('show_submenu', {'submenu': submenu, 'parent_label': option.get('label')}, room=user_id)
-    elif tipo == "info":
-        emit('show_info', {'label': option.get('label'), 'text': option.get('text')}, room=user_id)
-    elif tipo == "image":
-        emit('show_map', {'image': option.get('image'), 'label': option.get('label')}, room=user_id)
-
-    client_name = clientes_conectados.get(user_id, {}).get('name', 'Invitado')
-    emit('message_admin', {
+    event, payload = index.payload_for(node_id)
+    emit(event, payload, room=user_id)
+    ADMIN_FEED.publish('message_admin', {
         'user_id': user_id,
         'message': {
             'message_id': uuid.uuid4().hex,
-            'text': f'El cliente "{client_name}" seleccionó: {option.get("label")}',
+            'text': f'El cliente "{name}" escribió "{text}"; se le mostró: {index.search.paths[node_id]}',
             'timestamp': current_timestamp(),
             'sender': 'Sistema'
         }
-    }, broadcast=True)
+    })
 
-@socketio.on('submenu_option_selected')
-def handle_submenu_option(data):
-    user_id = request.sid
-    option_id = data.get('id')
-
-    def find_option(menu, target_id):
-        if isinstance(menu, dict):
-            if menu.get("id") == target_id:
-                return menu
-            for v in menu.values():
-                found = find_option(v, target_id)
-                if found:
-                    return found
-        elif isinstance(menu, list):
-            for item in menu:
-                found = find_option(item, target_id)
-                if found:
-                    return found
-        return None
-
-    option = find_option(menu_config, option_id)
-    if not option:
-        emit('show_info', {'label': 'Error', 'text': 'Opción no encontrada.'}, room=user_id)
-        return
-
-    tipo = option.get('type')
-    if tipo == "link":
-        emit('show_link', {'label': option.get('label'), 'link': option.get('link')}, room=user_id)
-    elif tipo == "info":
-        emit('show_info', {'label': option.get('label'), 'text': option.get('text')}, room=user_id)
-    elif tipo == "submenu":
-        submenu = [{"id": item["id"], "label": item["label"], "type": item.get("type", "info")} for item in option.get("submenu", [])]
-        emit('show_submenu', {'submenu': submenu, 'parent_label': option.get('label')}, room=user_id)
-
-    client_name = clientes_conectados.get(user_id, {}).get('name', 'Invitado')
-    emit('message_admin', {
+def _notify_admin_selection(user_id, label, timestamp=None):
+    ADMIN_FEED.publish('message_admin', {
         'user_id': user_id,
         'message': {
             'message_id': uuid.uuid4().hex,
-            'text': f'El cliente "{client_name}" seleccionó: {option.get("label")}',
-            'timestamp': current_timestamp(),
+            'text': f'El cliente "{client_name(user_id)}" seleccionó: {label}',
+            'timestamp': timestamp or current_timestamp(),
             'sender': 'Sistema'
         }
-    }, broadcast=True)
+    })
 
-@socketio.on('admin_select_chat')
+def _emit_menu_option(user_id, option_id):
+    """Resuelve la opción en el índice precompilado y emite su payload."""
+    index = MENU_STORE.index
+    resolved = index.payload_for(option_id)
+    if not resolved:
+        emit('show_info', {'label': 'Error', 'text': 'Opción no encontrada.'}, room=user_id)
+        return
+
+    event, payload = resolved
+    emit(event, payload, room=user_id)
+    _notify_admin_selection(user_id, index.get(option_id).get('label'))
+
+@socket_event('menu_option_selected')
+def handle_menu_option(data):
+    _emit_menu_option(current_user(), (data or {}).get('id'))
+
+@socket_event('submenu_option_selected')
+def handle_submenu_option(data):
+    _emit_menu_option(current_user(), (data or {}).get('id'))
+
+@socket_event('menu_autocomplete')
+def handle_menu_autocomplete(data):
+    """Sugerencias del menú para lo que el alumno va escribiendo; `seq` permite descartar respuestas viejas."""
+    if not isinstance(data, dict):
+        return
+    query = data.get('q')
+    if not isinstance(query, str):
+        return
+    limit = data.get('limit')
+    limit = min(limit, MAX_AUTOCOMPLETE) if isinstance(limit, int) and limit > 0 else AUTOCOMPLETE_LIMIT
+    index = MENU_STORE.index
+    emit('menu_autocomplete_results', {
+        'seq': data.get('seq'),
+        'q': query,
+        'version': index.version,
+        'results': index.autocomplete.complete(query[:MAX_AUTOCOMPLETE_QUERY], limit),
+    }, room=request.sid)
+
+@socket_event('menu_telemetry')
+def handle_menu_telemetry(data):
+    """Selecciones que el cliente resolvió localmente con /menu.json, enviadas por lotes."""
+    user_id = current_user()
+    index = MENU_STORE.index
+    selections = (data or {}).get('selections')
+    if not isinstance(selections, list):
+        return
+    for sel in selections[:MAX_TELEMETRY_BATCH]:
+        if not isinstance(sel, dict):
+            continue
+        node = index.get(sel.get('id'))
+        if node:
+            timestamp = sel.get('timestamp') if isinstance(sel.get('timestamp'), str) else None
+            _notify_admin_selection(user_id, node.get('label'), timestamp)
+
+@socket_event('admin_select_chat')
 def admin_select_chat(data):
-    user_id = data.get('user_id')
-    emit('chat_history', chats.get(user_id, []), room=request.sid)
+    if not is_admin_socket():
+        return
+    if not isinstance(data, dict) or not isinstance(data.get('user_id'), str):
+        return
+    emit('chat_history', history_page_payload(data['user_id'], since=history_cursor(data.get('since')),
+                                              with_polarity=True),
+         room=request.sid)
+
+@socket_event('load_older')
+def handle_load_older(data):
+    """Página anterior a `before` (message_id). Sólo los admins pueden pedir otro user_id."""
+    if not isinstance(data, dict):
+        return
+    user_id = current_user()
+    is_admin = is_admin_socket()
+    if isinstance(data.get('user_id'), str) and data['user_id'] and is_admin:
+        user_id = data['user_id']
+    before = history_cursor(data.get('before'))
+    if not before:
+        return
+    emit('chat_history_older', history_page_payload(user_id, before=before, with_polarity=is_admin),
+         room=request.sid)
 
-@socketio.on('admin_message')
+@socket_event('admin_message')
 def handle_admin_message(data):
+    if not is_admin_socket():
+        return
     user_id = data.get('user_id')
     if not user_id:
         return
@@ -280,14 +701,14 @@ def handle_admin_message(data):
         "sender": "Admin"
     }
 
-    chats.setdefault(user_id, []).append(msg)
+    record_messages(user_id, msg)
     emit('message', msg, room=user_id)
-    emit('message_admin', {'user_id': user_id, 'message': msg}, broadcast=True)
+    ADMIN_FEED.publish('message_admin', {'user_id': user_id, 'message': msg})
 
-@socketio.on('return_to_main_menu')
+@socket_event('return_to_main_menu')
 def handle_return_to_main_menu():
-    user_id = request.sid
-    emit('show_menu', {'menu': top_level_menu_payload()}, room=user_id)
+    user_id = current_user()
+    emit('show_menu', {'menu': top_level_menu_payload(), 'version': MENU_STORE.version}, room=user_id)
 
 # -----------------------
 #  SUMMARY: generar y enviar PDF por correo
@@ -295,7 +716,7 @@ def handle_return_to_main_menu():
 #  compatibilidad: también aceptamos 'request_summary' (legacy)
 # -----------------------
 
-def _gemma_call_with_key_or_bearer(url_path, body):
+def _gemma_call_with_key_or_bearer(url_path, body, **kwargs):
     """
     Helper: si GEMMA_API_KEY parece 'AIza...' usamos ?key=..., si no usamos Authorization Bearer.
     """
@@ -304,7 +725,8 @@ def _gemma_call_with_key_or_bearer(url_path, body):
 
     if GEMMA_API_KEY.startswith("AIza"):
         # API key style (public key param)
-        url = f"{url_path}?key={GEMMA_API_KEY}"
+        sep = "&" if "?" in url_path else "?"
+        url = f"{url_path}{sep}key={GEMMA_API_KEY}"
         headers = {"Content-Type": "application/json"}
     else:
         url = url_path
@@ -312,153 +734,126 @@ def _gemma_call_with_key_or_bearer(url_path, body):
             "Content-Type": "application/json",
             "Authorization": f"Bearer {GEMMA_API_KEY}"
         }
-    return requests.post(url, json=body, headers=headers, timeout=30)
+    return GEMMA_HTTP.post(url, json=body, headers=headers, **kwargs)
 
-def call_gemma_generate_text(prompt_text):
+def _extract_gemma_text(data):
     """
-    Llamada a la API Generative Language. Maneja distintos formatos de respuesta.
+    Extrae el texto de los distintos formatos de respuesta conocidos; sirve tanto
+    para la respuesta completa como para cada chunk del streaming. None si no hay texto.
     """
-    # endpoint base: intentamos generateContent v1 (estructura más común)
-    base_url = f"https://generativelanguage.googleapis.com/v1/models/{GEMMA_MODEL}:generateContent"
-    body = {
+    if not isinstance(data, dict):
+        return None
+    # candidatos estilo: data["candidates"][0]["content"]["parts"][0]["text"]
+    if "candidates" in data and isinstance(data["candidates"], list) and len(data["candidates"]) > 0:
+        cand = data["candidates"][0]
+        if isinstance(cand, dict):
+            # candidate.content.parts (en streaming puede venir partido en varias)
+            cont = cand.get("content")
+            if isinstance(cont, dict):
+                parts = cont.get("parts")
+                if isinstance(parts, list):
+                    texts = [p["text"] for p in parts if isinstance(p, dict) and "text" in p]
+                    if texts:
+                        return "".join(texts)
+            # candidate.output string
+            out_str = cand.get("output")
+            if isinstance(out_str, str):
+                return out_str
+
+    # fallback a output -> content
+    out = data.get("output") or data.get("outputs")
+    if isinstance(out, list):
+        for part in out:
+            if isinstance(part, dict):
+                content = part.get("content")
+                if isinstance(content, list):
+                    for c in content:
+                        if isinstance(c, dict) and "text" in c:
+                            return c["text"]
+    return None
+
+def _gemma_body(prompt_text):
+    return {
         "contents": [
             {"parts": [{"text": prompt_text}]}
         ]
     }
 
-    resp = _gemma_call_with_key_or_bearer(base_url, body)
+def call_gemma_generate_text(prompt_text):
+    """
+    Llamada a la API Generative Language. Maneja distintos formatos de respuesta.
+    """
+    # endpoint base: intentamos generateContent v1 (estructura más común)
+    base_url = f"{GEMMA_API_BASE}/v1/models/{GEMMA_MODEL}:generateContent"
+    resp = _gemma_call_with_key_or_bearer(base_url, _gemma_body(prompt_text))
     resp.raise_for_status()
     data = resp.json()
 
-    # Extraer texto de varios formatos conocidos
-    try:
-        # candidatos estilo: data["candidates"][0]["content"]["parts"][0]["text"]
-        if isinstance(data, dict):
-            if "candidates" in data and isinstance(data["candidates"], list) and len(data["candidates"]) > 0:
-                cand = data["candidates"][0]
-                if isinstance(cand, dict):
-                    # candidate.content.parts
-                    cont = cand.get("content")
-                    if isinstance(cont, dict):
-                        parts = cont.get("parts")
-                        if isinstance(parts, list) and parts and isinstance(parts[0], dict) and "text" in parts[0]:
-                            return parts[0]["text"]
-                    # candidate.output string
-                    out_str = cand.get("output")
-                    if isinstance(out_str, str):
-                        return out_str
-
-            # fallback a output -> content
-            out = data.get("output") or data.get("outputs")
-            if isinstance(out, list):
-                for part in out:
-                    if isinstance(part, dict):
-                        content = part.get("content")
-                        if isinstance(content, list):
-                            for c in content:
-                                if isinstance(c, dict) and "text" in c:
-                                    return c["text"]
-
-        # si no encontramos nada conocido, devolvemos la representación string (útil para debug)
-        return str(data)
-    except Exception:
-        return str(data)
+    # si no encontramos nada conocido, devolvemos la representación string (útil para debug)
+    text = _extract_gemma_text(data)
+    return text if text is not None else str(data)
+
+def call_gemma_stream_text(prompt_text, on_chunk):
+    """
+    Igual que call_gemma_generate_text pero con streamGenerateContent (SSE):
+    cada fragmento se entrega a on_chunk(texto) en cuanto llega y se devuelve
+    el texto completo al terminar.
+    """
+    base_url = f"{GEMMA_API_BASE}/v1/models/{GEMMA_MODEL}:streamGenerateContent?alt=sse"
+    resp = _gemma_call_with_key_or_bearer(base_url, _gemma_body(prompt_text), stream=True)
+    with resp:
+        resp.raise_for_status()
+        if "text/event-stream" not in resp.headers.get("Content-Type", ""):
+            # sin SSE la API responde un arreglo JSON con todos los chunks
+            data = resp.json()
+            events = data if isinstance(data, list) else [data]
+        else:
+            events = (json.loads(line[5:]) for line in resp.iter_lines(decode_unicode=True)
+                      if line and line.startswith("data:"))
+
+        pieces = []
+        for event in events:
+            text = _extract_gemma_text(event)
+            if text:
+                pieces.append(text)
+                on_chunk(text)
+    if not pieces:
+        raise RuntimeError("Gemma no devolvió texto en el streaming")
+    return "".join(pieces)
+
+def analyze_conversation_sentiment(history, summary_text):
+    """
+    Polaridad para el PDF: con el motor local se puntúa la conversación completa
+    (por mensaje y por participante) sin salir del proceso; si no está disponible
+    o falla se usa la API remota sobre el resumen.
+    """
+    if SENTIMENT_ENGINE:
+        try:
+            return SENTIMENT_ENGINE.analyze_conversation(history)
+        except Exception:
+            logger.exception("Error en el motor de polaridad local")
+    return analyze_sentiment(summary_text) if SENTIMENT_API_URL else None
 
 def analyze_sentiment(text):
     """Llama a tu API de polaridad (opcional)."""
     if not SENTIMENT_API_URL:
         return None
     try:
-        r = requests.post(SENTIMENT_API_URL, json={"texto": text}, timeout=15)
+        r = SENTIMENT_HTTP.post(SENTIMENT_API_URL, json={"texto": text})
         r.raise_for_status()
         return r.json()
     except Exception as e:
         logger.warning("Error al llamar API de sentimiento: %s", e)
         return {"error": str(e)}
 
-def create_pdf_bytes(title, summary_text, sentiment_result, chat_history):
-    buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=letter)
-    w, h = letter
-    margin = 40
-    y = h - margin
-
-    c.setFont("Helvetica-Bold", 14)
-    c.drawString(margin, y, title)
-    y -= 24
-
-    c.setFont("Helvetica", 10)
-    c.drawString(margin, y, f"Fecha: {datetime.now().astimezone().isoformat()}")
-    y -= 18
-
-    if sentiment_result:
-        c.setFont("Helvetica-Bold", 11)
-        c.drawString(margin, y, "Análisis de polaridad:")
-        y -= 16
-        c.setFont("Helvetica", 10)
-        try:
-            c.drawString(margin, y, str(sentiment_result))
-        except Exception:
-            c.drawString(margin, y, repr(sentiment_result))
-        y -= 20
-
-    c.setFont("Helvetica-Bold", 11)
-    c.drawString(margin, y, "Resumen breve:")
-    y -= 14
-    c.setFont("Helvetica", 10)
-
-    for line in (summary_text or "").splitlines():
-        if not line:
-            continue
-        while len(line) > 90:
-            c.drawString(margin, y, line[:90])
-            line = line[90:]
-            y -= 12
-            if y < margin + 60:
-                c.showPage()
-                y = h - margin
-                c.setFont("Helvetica", 10)
-        c.drawString(margin, y, line)
-        y -= 12
-        if y < margin + 60:
-            c.showPage()
-            y = h - margin
-            c.setFont("Helvetica", 10)
-
-    y -= 6
-    c.setFont("Helvetica-Bold", 11)
-    c.drawString(margin, y, "Conversación (últimos mensajes):")
-    y -= 14
-    c.setFont("Helvetica", 9)
-
-    for m in (chat_history or [])[-100:]:
-        text = f"{m.get('timestamp','')[:19]} {m.get('sender','')}: {m.get('text','')}"
-        while len(text) > 90:
-            c.drawString(margin, y, text[:90])
-            text = text[90:]
-            y -= 12
-            if y < margin + 40:
-                c.showPage()
-                y = h - margin
-                c.setFont("Helvetica", 9)
-        c.drawString(margin, y, text)
-        y -= 12
-        if y < margin + 40:
-            c.showPage()
-            y = h - margin
-            c.setFont("Helvetica", 9)
-
-    c.showPage()
-    c.save()
-    buffer.seek(0)
-    return buffer.read()
-
-def send_email_with_resend(to_email, subject, html_body, pdf_bytes, filename="summary.pdf"):
-    """Envía correo con Resend. Adjunta el PDF en base64 en attachments."""
+def send_email_with_resend(to_email, subject, html_body, pdf_bytes, filename="summary.pdf", idempotency_key=None,
+                           encoded=None):
+    """Envía correo con Resend. Adjunta el PDF en base64 en attachments (`encoded` si ya viene codificado)."""
     if not RESEND_API_KEY:
         raise RuntimeError("RESEND_API_KEY no configurada")
 
-    encoded = base64.b64encode(pdf_bytes).decode('utf-8')
+    if encoded is None:
+        encoded = base64.b64encode(pdf_bytes).decode('utf-8')
     payload = {
         "from": RESEND_FROM,
         "to": [to_email],
@@ -474,69 +869,253 @@ def send_email_with_resend(to_email, subject, html_body, pdf_bytes, filename="su
     }
     headers = {
         "Authorization": f"Bearer {RESEND_API_KEY}",
-        "Content-Type": "application/json"
+        "Content-Type": "application/json",
+        # el cliente reintenta en 5xx: la llave evita correos duplicados
+        "Idempotency-Key": idempotency_key or uuid.uuid4().hex
     }
-    r = requests.post(RESEND_API_URL, json=payload, headers=headers, timeout=30)
+    r = RESEND_HTTP.post(RESEND_API_URL, json=payload, headers=headers)
+    if 400 <= r.status_code < 500 and r.status_code != 429:
+        # datos inválidos o llave rechazada: reintentar desde la bandeja no sirve
+        raise PermanentDeliveryError(f"Resend respondió {r.status_code}: {r.text[:200]}")
     r.raise_for_status()
     return r.json()
 
-def _handle_summary_request(user_id, email):
-    """Flujo interno para generar y enviar el resumen (sin socket)."""
+def deliver_outbox_email(email):
+    """Entrega un correo de la bandeja; su id es la Idempotency-Key en Resend."""
+    trace = SUMMARY_TRACES.linked(email['id'])
+    with (trace.stage('email_send', email['attachment']) if trace else nullcontext()) as call:
+        resp = send_email_with_resend(email['to_email'], email['subject'], email['html'], None,
+                                      email['filename'], idempotency_key=email['id'], encoded=email['attachment'])
+        if call:
+            call.bytes_out = payload_size(resp)
+    return resp.get('id') if isinstance(resp, dict) else None
+
+def summarize_conversation(conversation_id, messages, on_chunk=None, trace=None):
+    """
+    Resume `messages` reutilizando el cache: si ya se resumió exactamente este
+    contenido se devuelve el mismo texto; si sólo llegaron mensajes nuevos (y caben
+    en el presupuesto) se le pide a Gemma que actualice el resumen previo. Las
+    conversaciones que no caben en un prompt se resumen por map-reduce.
+    Con on_chunk (y GEMMA_STREAM) la llamada final se hace en streaming; los
+    resúmenes parciales del map no se transmiten.
+    Con `trace` cada llamada a Gemma queda medida en la etapa 'gemma'.
+    """
+    content_hash, prev, new_messages = SUMMARY_CACHE.lookup(conversation_id, messages)
+    if prev and not new_messages:
+        if trace:
+            trace.tags['summary_cache'] = 'hit'
+        if on_chunk:
+            on_chunk(prev.summary)
+        return prev.summary
+
+    generate = call_gemma_generate_text
+    if on_chunk and GEMMA_STREAM:
+        generate_final = lambda prompt: call_gemma_stream_text(prompt, on_chunk)
+    else:
+        generate_final = call_gemma_generate_text
+    if trace:
+        generate = trace.wrap('gemma', generate)
+        generate_final = trace.wrap('gemma', generate_final)
+
+    new_text = PROMPT_BUILDER.render(new_messages) if prev else None
+    if prev and PROMPT_BUILDER.fits(new_text, prev.summary):
+        if trace:
+            trace.tags['summary_cache'] = 'update'
+        summary_text = generate_final(PROMPT_BUILDER.update_prompt(prev.summary, new_text))
+    else:
+        if trace:
+            trace.tags['summary_cache'] = 'miss'
+        summary_text = map_reduce_summary(PROMPT_BUILDER, messages, generate,
+                                          GEMMA_POOL.imap, generate_final)
+
+    SUMMARY_CACHE.put(conversation_id, content_hash, summary_text, messages[-1].get('message_id'))
+    return summary_text
+
+def _handle_summary_request(user_id, email, progress=lambda stage: None, on_chunk=None, trace_id=None):
+    """
+    Flujo interno para generar y enviar el resumen (sin socket).
+    `progress(stage)` se llama al iniciar cada etapa; desde la cola de trabajos
+    notifica al cliente y corta el flujo si el usuario canceló.
+    `on_chunk(texto)` recibe el resumen a medida que Gemma lo genera.
+    Cada solicitud deja una traza por etapa en SUMMARY_TRACES (ver /admin/traces).
+    """
+    trace = SUMMARY_TRACES.start(trace_id or uuid.uuid4().hex, user_id=user_id)
+    try:
+        result = _summary_pipeline(trace, user_id, email, progress, on_chunk)
+    except JobCancelled:
+        trace.finish('cancelled')
+        raise
+    except Exception as e:
+        trace.finish('error', str(e))
+        raise
+    trace.finish('ok' if result.get('ok') else 'error', result.get('error'))
+    return result
+
+def _summary_pipeline(trace, user_id, email, progress, on_chunk):
     if not EMAIL_REGEX.match(email):
         return {"ok": False, "error": "Email inválido."}
 
-    history = chats.get(user_id, [])
-    text_for_summary = "\n".join([f"{m.get('sender','')}: {m.get('text','')}" for m in history[-200:]])
-    if not text_for_summary:
+    history = summary_history(user_id)
+    if not history:
         return {"ok": False, "error": "No hay historial para resumir."}
 
-    prompt = (
-        "Resume brevemente la siguiente conversación en español (máximo 6-8 líneas). "
-        "Incluye puntos importantes y recomendaciones si aplica.\n\n"
-        f"{text_for_summary}"
-    )
+    trace.tags['messages'] = len(history)
 
     # 1) Generar resumen
+    progress('summarizing')
+    start = time.perf_counter()
     try:
-        summary_text = call_gemma_generate_text(prompt)
+        summary_text = summarize_conversation(user_id, history, on_chunk, trace)
+    except JobCancelled:
+        raise
     except Exception as e:
-        logger.exception("Error al llamar Gemma/Gemini")
+        logger.exception("Error al llamar Gemma/Gemini (traza %s)", trace.trace_id)
         return {"ok": False, "error": f"Error Gemma: {e}"}
+    finally:
+        # lo que no fue espera de Gemma: render del historial, chunks y prompts
+        gemma = trace.stages.get('gemma')
+        trace.derive('prompt_build', time.perf_counter() - start - trace.stage_seconds('gemma'),
+                     bytes_in=sum(payload_size(m.get('text')) for m in history),
+                     bytes_out=gemma.bytes_in if gemma else 0)
 
     # 2) Analizar polaridad (opcional)
-    sentiment = analyze_sentiment(summary_text) if SENTIMENT_API_URL else None
-
-    # 3) Crear PDF
-    title = f"Resumen de chat - {clientes_conectados.get(user_id, {}).get('name','Invitado')}"
-    pdf_bytes = create_pdf_bytes(title, summary_text, sentiment, history)
+    with trace.stage('sentiment', summary_text) as call:
+        sentiment = analyze_conversation_sentiment(history, summary_text)
+        call.bytes_out = payload_size(sentiment)
+
+    # 3) Crear PDF (CPU-bound: en un proceso aparte para no frenar el loop); si ya se
+    #    generó exactamente el mismo PDF se reutiliza junto con su base64. La fecha
+    #    impresa es la del día y entra en la llave: mañana el mismo resumen se re-renderiza.
+    progress('rendering')
+    title = f"Resumen de chat - {client_name(user_id)}"
+    generated_on = datetime.now().astimezone().date().isoformat()
+    included = [(m.get('message_id'), m.get('timestamp'), m.get('sender'), m.get('text'))
+                for m in history[-PDF_MAX_MESSAGES:]]
+    key = artifact_key(title, generated_on, summary_text, sentiment, included)
+    artifact = ARTIFACT_CACHE.get(key)
+    trace.tags['pdf_cache'] = 'hit' if artifact is not None else 'miss'
+    if artifact is None:
+        with trace.stage('pdf', included) as call:
+            pdf_bytes = PDF_OFFLOADER.run(create_pdf_bytes, title, summary_text, sentiment, history,
+                                          PDF_MAX_MESSAGES, generated_on)
+            call.bytes_out = len(pdf_bytes)
+        artifact = ARTIFACT_CACHE.put(key, pdf_bytes)
+
+    # 4) Encolar el correo; la bandeja de salida lo entrega (y reintenta) por Resend
+    progress('sending')
+    if not RESEND_API_KEY:
+        return {"ok": False, "error": "Error al enviar correo: RESEND_API_KEY no configurada"}
+    with trace.stage('email_enqueue', artifact.base64):
+        email_id = EMAIL_OUTBOX.enqueue(user_id, email, f"Resumen de tu chat con Tecbot",
+                                        f"<p>Resumen:<br>{summary_text}</p>", artifact.base64, "summary.pdf")
+    # la bandeja completa la traza con 'email_send' en cada intento de entrega
+    trace.tags['email_id'] = email_id
+    SUMMARY_TRACES.link(email_id, trace)
+
+    return {"ok": True, "message": "Resumen listo; el correo se enviará en unos momentos."}
+
+def _notify_summary_status(user_id, payload):
+    socketio.emit('summary_status', payload, to=user_id)
+
+def _summary_chunk_emitter(job):
+    def on_chunk(text):
+        if job.cancelled:
+            # corta el streaming de Gemma; la cola notifica la cancelación
+            raise JobCancelled()
+        socketio.emit('summary_chunk', {'job_id': job.job_id, 'text': text}, to=job.user_id)
+    return on_chunk
+
+SUMMARY_CACHE = SummaryCache(SUMMARY_CACHE_SIZE, SUMMARY_CACHE_TTL)
+ARTIFACT_CACHE = ArtifactCache(ARTIFACT_CACHE_BYTES, ARTIFACT_SPILL_DIR or None, ARTIFACT_SPILL_BYTES)
+PROMPT_BUILDER = PromptBuilder(SUMMARY_TOKEN_BUDGET)
+SUMMARY_STAGE_SECONDS = METRICS.histogram('summary_stage_seconds', 'Duración por etapa del resumen', ('stage',))
+# trace id = job_id, el mismo que recibe el cliente en 'summary_status'
+SUMMARY_TRACES = TraceBuffer(SUMMARY_TRACE_KEEP, TRACER,
+                             lambda stage, seconds: SUMMARY_STAGE_SECONDS.observe(seconds, stage))
+# compartido entre todos los trabajos: acota las llamadas concurrentes a Gemma del map
+GEMMA_POOL = Pool(SUMMARY_MAP_CONCURRENCY)
+PDF_OFFLOADER = ProcessOffloader(PDF_PROCESSES)
+SUMMARY_JOBS = SummaryJobQueue(
+    lambda job, progress: _handle_summary_request(job.user_id, job.email, progress,
+                                                  _summary_chunk_emitter(job), job.job_id),
+    _notify_summary_status,
+    workers=SUMMARY_WORKERS,
+    max_queue=SUMMARY_QUEUE_SIZE,
+)
+SUMMARY_JOBS.start(socketio.start_background_task)
+atexit.register(PDF_OFFLOADER.close)
+
+EMAIL_OUTBOX = EmailOutbox(
+    OUTBOX_DB,
+    deliver_outbox_email,
+    lambda user_id, payload: socketio.emit('email_status', payload, to=user_id),
+    workers=OUTBOX_WORKERS,
+    max_attempts=OUTBOX_MAX_ATTEMPTS,
+    lease_seconds=OUTBOX_LEASE,
+    offload=run_native,
+)
+EMAIL_OUTBOX.start(socketio.start_background_task)
+socketio.start_background_task(EMAIL_OUTBOX.run, OUTBOX_INTERVAL, socketio.sleep)
+
+@socket_event('request_summary_email')
+def handle_request_summary_email(data):
+    user_id = current_user()
+    email = (data or {}).get('email', '').strip()
+    if not EMAIL_REGEX.match(email):
+        emit('summary_status', {'ok': False, 'stage': 'error', 'error': 'Email inválido.'}, room=user_id)
+        return
 
-    # 4) Enviar por Resend
-    try:
-        send_resp = send_email_with_resend(email, f"Resumen de tu chat con Tecbot", f"<p>Resumen:<br>{summary_text}</p>", pdf_bytes)
-    except Exception as e:
-        logger.exception("Error al enviar por Resend")
-        return {"ok": False, "error": f"Error al enviar correo: {e}"}
+    if GEMMA_HTTP.breaker.is_open():
+        # no tiene caso encolar algo que va a fallar: se avisa de inmediato
+        emit('summary_status', {'ok': False, 'stage': 'error',
+                                'error': 'El servicio de resúmenes no está disponible, intenta más tarde.'},
+             room=user_id)
+        return
 
-    return {"ok": True, "message": "Resumen enviado por correo."}
+    # el handler sólo encola; las etapas llegan después como 'summary_status'
+    job, status = SUMMARY_JOBS.submit(user_id, email)
+    if status == 'duplicate':
+        emit('summary_status', {'ok': None, 'stage': job.stage, 'job_id': job.job_id,
+                                'message': 'Ya hay un resumen en proceso para este chat.'}, room=user_id)
 
-@socketio.on('request_summary_email')
-def handle_request_summary_email(data):
-    user_id = request.sid
-    email = (data or {}).get('email', '').strip()
-    # send immediate status
-    emit('summary_status', {'ok': None, 'message': 'Iniciando generación de resumen...'}, room=user_id)
+@socket_event('email_status')
+def handle_email_status():
+    """Estado de los últimos correos del usuario (pendiente / enviado / fallido)."""
+    emit('email_status_list', EMAIL_OUTBOX.status(current_user()), room=request.sid)
 
-    result = _handle_summary_request(user_id, email)
-    if result.get("ok"):
-        emit('summary_status', {'ok': True, 'message': result.get("message")}, room=user_id)
-    else:
-        emit('summary_status', {'ok': False, 'error': result.get("error")}, room=user_id)
+@socket_event('cancel_summary')
+def handle_cancel_summary():
+    if not SUMMARY_JOBS.cancel(current_user()):
+        emit('summary_status', {'ok': False, 'stage': 'error', 'error': 'No hay un resumen en proceso.'},
+             room=request.sid)
 
 # backward-compatible event name
-@socketio.on('request_summary')
+@socket_event('request_summary')
 def handle_request_summary_legacy(data):
     handle_request_summary_email(data)
 
+# -----------------------
+#  Métricas: gauges (se calculan al hacer scrape) y monitor del loop
+# -----------------------
+LOOP_MONITOR = LoopMonitor()
+socketio.start_background_task(LOOP_MONITOR.run, socketio.sleep)
+
+METRICS.gauge('connected_clients', 'Clientes registrados', lambda: STATE.usage().get('clients'))
+METRICS.gauge('sessions', 'Sesiones de alumno por estado', lambda: {
+    ('connected',): SESSIONS.stats()['connected'], ('idle',): SESSIONS.stats()['idle']}, ('state',))
+METRICS.gauge('chat_messages', 'Mensajes en los historiales en memoria', lambda: STATE.usage().get('messages'))
+METRICS.gauge('chat_state_bytes', 'Bytes estimados del estado del chat',
+              lambda: STATE.usage().get('bytes', STATE.usage().get('used_memory')))
+METRICS.gauge('summary_jobs_in_flight', 'Resúmenes en cola o en proceso', SUMMARY_JOBS.in_flight)
+METRICS.gauge('outbox_emails', 'Correos en la bandeja de salida por estado',
+              lambda: {(status,): n for status, n in EMAIL_OUTBOX.stats().items()}, ('status',))
+METRICS.gauge('chat_log_pending', 'Registros esperando el próximo group commit',
+              lambda: CHAT_LOG.stats()['pending'] if CHAT_LOG else None)
+METRICS.gauge('upstream_breaker_open', '1 si el circuit breaker del upstream está abierto',
+              lambda: {(u.name,): int(u.breaker.is_open()) for u in UPSTREAMS}, ('upstream',))
+METRICS.gauge('event_loop_lag_seconds', 'Retraso del loop de gevent en el último tick',
+              lambda: max(LOOP_MONITOR.lag, LOOP_MONITOR.stalled_for()))
+
 # -----------------------
 #  Run
 # -----------------------
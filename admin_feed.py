@@ -0,0 +1,101 @@
+# admin_feed.py
+# Canal de eventos hacia los administradores. Todo se envía sólo a la sala 'admins'
+# y se agrupa por ticks: una ráfaga de actividad llega como un único 'admin_batch'
+# por admin en lugar de cientos de frames sueltos.
+import time
+import uuid
+import logging
+
+logger = logging.getLogger("build-a-chat.admin")
+
+ADMIN_ROOM = 'admins'
+
+
+class AdminFeed:
+    def __init__(self, socketio, room=ADMIN_ROOM, interval=0.075):
+        self.socketio = socketio
+        self.room = room
+        self.interval = interval
+        self._pending = []   # [ {event, data} ] en orden de llegada
+        self._latest = {}    # { event: builder } eventos donde sólo importa el último estado
+
+    def publish(self, event, data):
+        self._pending.append({'event': event, 'data': data})
+
+    def publish_latest(self, event, builder):
+        """
+        Para eventos que reemplazan al anterior (p. ej. la lista de clientes):
+        el payload se construye una sola vez al vaciar el tick, sin importar
+        cuántas veces se pidió dentro de él.
+        """
+        self._latest[event] = builder
+
+    def flush(self):
+        if not self._pending and not self._latest:
+            return 0
+        batch, self._pending = self._pending, []
+        latest, self._latest = self._latest, {}
+        for event, builder in latest.items():
+            data = builder()
+            if data is not None:
+                batch.append({'event': event, 'data': data})
+        if not batch:
+            return 0
+        self.socketio.emit('admin_batch', batch, to=self.room)
+        return len(batch)
+
+    def run(self, sleep=time.sleep):
+        while True:
+            sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Error al enviar el lote de eventos admin")
+
+
+class PresenceList:
+    """
+    Lista de clientes conectados con versión. En vez de reenviar la lista completa
+    en cada cambio se acumulan altas/bajas/renombres y se emiten como un delta
+    numerado ('chat_list_delta'). Cada worker numera sus propios deltas (origin),
+    así el admin detecta huecos por worker y pide un snapshot completo.
+    """
+
+    def __init__(self):
+        self.origin = uuid.uuid4().hex[:8]
+        self.seq = 0
+        self._changes = {}  # { user_id: ('added' | 'renamed' | 'removed', name) }
+
+    def added(self, user_id, name):
+        self._changes[user_id] = ('added', name)
+
+    def renamed(self, user_id, name):
+        prev = self._changes.get(user_id)
+        # un alta pendiente sigue siendo alta, sólo con el nombre nuevo
+        kind = 'added' if prev and prev[0] == 'added' else 'renamed'
+        self._changes[user_id] = (kind, name)
+
+    def removed(self, user_id):
+        prev = self._changes.get(user_id)
+        if prev and prev[0] == 'added':
+            # alta y baja dentro del mismo tick: el admin nunca necesita verlo
+            del self._changes[user_id]
+        else:
+            self._changes[user_id] = ('removed', None)
+
+    def take_delta(self):
+        """Consume los cambios acumulados; None si no hay nada que enviar."""
+        if not self._changes:
+            return None
+        changes, self._changes = self._changes, {}
+        self.seq += 1
+        delta = {'origin': self.origin, 'seq': self.seq, 'added': [], 'renamed': [], 'removed': []}
+        for user_id, (kind, name) in changes.items():
+            if kind == 'removed':
+                delta['removed'].append(user_id)
+            else:
+                delta[kind].append({'user_id': user_id, 'name': name})
+        return delta
+
+    def snapshot(self, clients):
+        return {'origin': self.origin, 'seq': self.seq, 'clients': clients}
@@ -0,0 +1,133 @@
+# artifact_cache.py
+# Cache direccionado por contenido de los PDF de resumen. La llave es el hash de
+# todo lo que entra al PDF (título, resumen, polaridad y mensajes incluidos), así
+# que pedir el mismo resumen otra vez (p. ej. tras equivocarse de correo) no vuelve
+# a renderizar ni a codificar en base64. La memoria se acota por bytes (LRU); lo que
+# se desaloja puede bajar a disco (spill) en lugar de perderse.
+import os
+import json
+import base64
+import hashlib
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger("build-a-chat.artifacts")
+
+SPILL_SUFFIX = '.pdf'
+
+
+def artifact_key(*parts):
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class Artifact:
+    __slots__ = ('pdf', 'base64')
+
+    def __init__(self, pdf):
+        self.pdf = pdf
+        self.base64 = base64.b64encode(pdf).decode('ascii')
+
+    @property
+    def size(self):
+        return len(self.pdf) + len(self.base64)
+
+
+class ArtifactCache:
+    def __init__(self, max_bytes=32 * 1024 * 1024, spill_dir=None, max_spill_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.max_spill_bytes = max_spill_bytes
+        self._entries = OrderedDict()   # { key: Artifact }
+        self._spilled = OrderedDict()   # { key: bytes en disco }, LRU
+        self.bytes = 0
+        self.spill_bytes = 0
+        self.hits = 0
+        self.spill_hits = 0
+        self.misses = 0
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+            self._scan_spill()
+
+    def _scan_spill(self):
+        found = []
+        for name in os.listdir(self.spill_dir):
+            if name.endswith(SPILL_SUFFIX):
+                path = os.path.join(self.spill_dir, name)
+                found.append((os.path.getmtime(path), name[:-len(SPILL_SUFFIX)], os.path.getsize(path)))
+        for _, key, size in sorted(found):
+            self._spilled[key] = size
+            self.spill_bytes += size
+        self._trim_spill()
+
+    def _spill_path(self, key):
+        return os.path.join(self.spill_dir, key + SPILL_SUFFIX)
+
+    def get(self, key):
+        artifact = self._entries.get(key)
+        if artifact is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return artifact
+        if key in self._spilled:
+            try:
+                with open(self._spill_path(key), 'rb') as f:
+                    pdf = f.read()
+            except OSError:
+                self._drop_spilled(key)
+            else:
+                self._spilled.move_to_end(key)
+                self.spill_hits += 1
+                # vuelve a memoria; el base64 se recalcula una sola vez
+                return self.put(key, pdf)
+        self.misses += 1
+        return None
+
+    def put(self, key, pdf):
+        if key in self._entries:
+            self.bytes -= self._entries.pop(key).size
+        artifact = Artifact(pdf)
+        self._entries[key] = artifact
+        self.bytes += artifact.size
+        while self.bytes > self.max_bytes and len(self._entries) > 1:
+            old_key, old = self._entries.popitem(last=False)
+            self.bytes -= old.size
+            self._spill(old_key, old)
+        return artifact
+
+    def _spill(self, key, artifact):
+        if not self.spill_dir or key in self._spilled:
+            return
+        try:
+            tmp = self._spill_path(key) + '.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(artifact.pdf)
+            os.replace(tmp, self._spill_path(key))
+        except OSError:
+            logger.warning("No se pudo bajar a disco el PDF %s", key, exc_info=True)
+            return
+        self._spilled[key] = len(artifact.pdf)
+        self.spill_bytes += len(artifact.pdf)
+        self._trim_spill()
+
+    def _trim_spill(self):
+        while self.spill_bytes > self.max_spill_bytes and self._spilled:
+            self._drop_spilled(next(iter(self._spilled)))
+
+    def _drop_spilled(self, key):
+        self.spill_bytes -= self._spilled.pop(key, 0)
+        try:
+            os.remove(self._spill_path(key))
+        except OSError:
+            pass
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "spilled": len(self._spilled),
+            "spill_bytes": self.spill_bytes,
+            "hits": self.hits,
+            "spill_hits": self.spill_hits,
+            "misses": self.misses,
+        }
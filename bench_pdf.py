@@ -0,0 +1,91 @@
+# bench_pdf.py
+# Benchmark del render de PDF: transcripciones de 100, 1k y 10k mensajes.
+# Cada tamaño corre en un proceso nuevo para que el pico de RSS sea sólo suyo.
+#
+#   python bench_pdf.py                 # 100 1000 10000
+#   python bench_pdf.py 500 5000 -r 5   # tamaños y repeticiones a elección
+"""Benchmark del render de PDF: tiempo, tamaño y pico de RSS por tamaño de transcripción."""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+import subprocess
+
+SUMMARY = (
+    "El alumno preguntó por la retícula de Ingeniería en Sistemas y por las fechas de "
+    "reinscripción. Se le compartieron los enlaces oficiales y se recomendó revisar el "
+    "calendario escolar antes de acudir a servicios escolares."
+)
+WORDS = ("hola necesito información sobre la inscripción del semestre retícula horario "
+         "residencias profesionales servicio social coordinación gracias documentos "
+         "trámite constancia kárdex https://www.tecnm.mx/convocatorias/2025/reinscripcion").split()
+
+
+def make_transcript(n, seed=0):
+    rng = random.Random(seed)
+    messages = []
+    for i in range(n):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(3, 60))]
+        messages.append({
+            "message_id": f"m{i}",
+            "timestamp": f"2025-01-01T00:{i // 60 % 60:02d}:{i % 60:02d}+00:00",
+            "sender": "Tecbot" if i % 2 else "Alumno",
+            "text": " ".join(words),
+        })
+    return messages
+
+
+def _peak_rss_mb():
+    # ru_maxrss está en KiB en Linux y en bytes en macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_one(n, repeat):
+    from pdf_render import create_pdf_bytes
+
+    messages = make_transcript(n)
+    baseline = _peak_rss_mb()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        pdf = create_pdf_bytes("Resumen de chat - benchmark", SUMMARY, None, messages, max_messages=None)
+        times.append(time.perf_counter() - start)
+    return {
+        "messages": n,
+        "best_s": min(times),
+        "mean_s": sum(times) / len(times),
+        "pdf_kb": len(pdf) / 1024,
+        "peak_rss_mb": _peak_rss_mb(),
+        "baseline_rss_mb": baseline,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('sizes', nargs='*', type=int, default=[100, 1000, 10000])
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('--one', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.one is not None:
+        print(json.dumps(run_one(args.one, args.repeat)))
+        return
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    print(f"{'mensajes':>9} {'mejor (s)':>10} {'media (s)':>10} {'PDF (KiB)':>10} {'RSS pico (MiB)':>15} {'RSS base':>9}")
+    for n in args.sizes:
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--one', str(n), '-r', str(args.repeat)],
+            cwd=here, check=True, capture_output=True, text=True,
+        ).stdout
+        r = json.loads(out)
+        print(f"{r['messages']:>9} {r['best_s']:>10.3f} {r['mean_s']:>10.3f} {r['pdf_kb']:>10.1f} "
+              f"{r['peak_rss_mb']:>15.1f} {r['baseline_rss_mb']:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
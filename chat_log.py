@@ -0,0 +1,390 @@
+# chat_log.py
+# Bitácora durable, append-only y segmentada de los mensajes del chat.
+#
+# Cada registro es binario y con framing propio:
+#   header  <IIQQ = longitud del cuerpo, crc32 del cuerpo, epoch en ms, secuencia
+#                   del mensaje dentro de su conversación
+#   cuerpo  7 campos utf-8 prefijados con <I longitud:
+#           user_id, message_id, timestamp, sender, text, audio_url, extra (json o vacío)
+#
+# Las escrituras se acumulan y se vuelcan por lotes (group commit) con un solo
+# write + fsync; el fsync corre en un hilo nativo (`offload`) para no detener el
+# hub de gevent. Un índice en memoria { user_id: [(segmento, offset), ...] } permite
+# reconstruir el historial leyendo directo de los segmentos mapeados en memoria.
+import os
+import io
+import json
+import mmap
+import struct
+import threading
+import time
+import zlib
+import logging
+from collections import Counter, deque
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin candado entre procesos
+    fcntl = None
+
+logger = logging.getLogger("build-a-chat.chatlog")
+
+HEADER = struct.Struct('<IIQQ')
+FIELD_LEN = struct.Struct('<I')
+N_FIELDS = 7
+SEGMENT_PREFIX = 'segment-'
+SEGMENT_SUFFIX = '.log'
+LOCK_FILE = 'LOCK'
+
+
+class ChatLogBusy(RuntimeError):
+    """Otro proceso ya escribe en el directorio: cada proceso necesita el suyo."""
+
+
+def encode_record(user_id, msg, ts_ms, seq):
+    base = {"message_id", "text", "timestamp", "sender", "audio_url"}
+    extra = {k: v for k, v in msg.items() if k not in base}
+    fields = (
+        user_id,
+        msg.get("message_id") or "",
+        msg.get("timestamp") or "",
+        msg.get("sender") or "",
+        msg.get("text") or "",
+        msg.get("audio_url") or "",
+        json.dumps(extra, ensure_ascii=False) if extra else "",
+    )
+    body = io.BytesIO()
+    for field in fields:
+        raw = str(field).encode('utf-8')
+        body.write(FIELD_LEN.pack(len(raw)))
+        body.write(raw)
+    body = body.getvalue()
+    return HEADER.pack(len(body), zlib.crc32(body), ts_ms, seq) + body
+
+
+def read_record(buf, offset):
+    """Devuelve (user_id, mensaje, ts_ms, seq, siguiente_offset) del registro en `offset`."""
+    body_len, _, ts_ms, seq = HEADER.unpack_from(buf, offset)
+    pos = offset + HEADER.size
+    fields = []
+    for _ in range(N_FIELDS):
+        (n,) = FIELD_LEN.unpack_from(buf, pos)
+        pos += FIELD_LEN.size
+        fields.append(buf[pos:pos + n].decode('utf-8'))
+        pos += n
+    user_id, message_id, timestamp, sender, text, audio_url, extra = fields
+    msg = {"message_id": message_id, "text": text, "timestamp": timestamp, "sender": sender}
+    if audio_url:
+        msg["audio_url"] = audio_url
+    if extra:
+        msg.update(json.loads(extra))
+    return user_id, msg, ts_ms, seq, offset + HEADER.size + body_len
+
+
+def _valid_record_end(buf, offset, size):
+    """Fin del registro en `offset` si está completo y su crc cuadra; None si no."""
+    if offset + HEADER.size > size:
+        return None
+    body_len, crc, _, _ = HEADER.unpack_from(buf, offset)
+    end = offset + HEADER.size + body_len
+    if end > size or zlib.crc32(buf[offset + HEADER.size:end]) != crc:
+        return None
+    return end
+
+
+class _Segment:
+    def __init__(self, number, path):
+        self.number = number
+        self.path = path
+        self.size = os.path.getsize(path) if os.path.exists(path) else 0
+        self._map = None
+        self._mapped_size = 0
+
+    def view(self):
+        """mmap de sólo lectura; se vuelve a mapear si el segmento creció."""
+        if self.size == 0:
+            return b''
+        if self._map is None or self._mapped_size != self.size:
+            self.close()
+            with open(self.path, 'rb') as f:
+                self._map = mmap.mmap(f.fileno(), self.size, access=mmap.ACCESS_READ)
+            self._mapped_size = self.size
+        return self._map
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+            self._mapped_size = 0
+
+
+class ChatLog:
+    """
+    offload(fn, *args) ejecuta fn fuera del loop (p. ej. en el threadpool del hub de
+    gevent) y devuelve su resultado; por defecto se llama en el mismo hilo.
+    """
+
+    def __init__(self, directory, segment_bytes=8 * 1024 * 1024, max_records=200,
+                 retention_seconds=7 * 24 * 3600, fsync=True, offload=None):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_records = max_records
+        self.retention_seconds = retention_seconds
+        self.fsync = fsync
+        self._offload = offload or (lambda fn, *args: fn(*args))
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()   # un group commit (o compactación) a la vez
+        self._segments = {}         # número -> _Segment
+        self._index = {}            # user_id -> deque[(segmento, offset)]
+        self._last_write = {}       # user_id -> epoch ms del último registro
+        self._seq = {}              # user_id -> secuencia del último mensaje
+        self._live = Counter()      # segmento -> registros aún referenciados por el índice
+        self._records = Counter()   # segmento -> registros escritos (vivos o no)
+        self._pending = []          # [(user_id, bytes)] pendientes del próximo group commit
+        self._active = None
+        self._fh = None
+
+        os.makedirs(directory, exist_ok=True)
+        self._lock_fh = self._lock_directory()
+        self._recover()
+
+    def _lock_directory(self):
+        # dos procesos sobre el mismo segmento activo intercalan escrituras y cada uno
+        # lleva sus propios offsets: el segundo no arranca
+        fh = open(os.path.join(self.directory, LOCK_FILE), 'a')
+        if fcntl is not None:
+            try:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                fh.close()
+                raise ChatLogBusy(f"{self.directory} ya está en uso por otro proceso")
+        return fh
+
+    # --- arranque ---
+    def _recover(self):
+        numbers = sorted(
+            int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+            for name in os.listdir(self.directory)
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)
+        )
+        found = {}  # user_id -> [(seq, ts_ms, segmento, offset)]
+        for number in numbers:
+            seg = self._segments[number] = _Segment(number, self._segment_path(number))
+            buf = seg.view()
+            offset = 0
+            while offset < seg.size:
+                end = _valid_record_end(buf, offset, seg.size)
+                if end is None:
+                    # cola truncada por un crash: se descarta lo que sigue
+                    logger.warning("Registro corrupto en %s@%d; se trunca el segmento", seg.path, offset)
+                    seg.close()
+                    with open(seg.path, 'r+b') as f:
+                        f.truncate(offset)
+                    seg.size = offset
+                    break
+                user_id, _, ts_ms, seq, _ = read_record(buf, offset)
+                found.setdefault(user_id, []).append((seq, ts_ms, number, offset))
+                self._records[number] += 1
+                offset = end
+
+        # la compactación mueve registros viejos a segmentos nuevos: el orden en disco
+        # no es el de la conversación, la secuencia sí (el reloj puede repetir o retroceder)
+        cutoff = self._retention_cutoff()
+        for user_id, records in found.items():
+            if max(ts_ms for _, ts_ms, _, _ in records) < cutoff:
+                # conversación ya expirada: sus registros quedan muertos para la compactación
+                continue
+            records.sort()
+            for seq, ts_ms, number, offset in records:
+                self._track(user_id, number, offset, ts_ms)
+            self._seq[user_id] = records[-1][0]
+
+        self._open_active(numbers[-1] if numbers else 1)
+
+    def _segment_path(self, number):
+        return os.path.join(self.directory, f'{SEGMENT_PREFIX}{number:06d}{SEGMENT_SUFFIX}')
+
+    def _open_active(self, number):
+        if self._fh is not None:
+            self._fh.close()
+        seg = self._segments.get(number)
+        if seg is None:
+            seg = self._segments[number] = _Segment(number, self._segment_path(number))
+        self._active = seg
+        self._fh = open(seg.path, 'ab')
+
+    def _track(self, user_id, number, offset, ts_ms):
+        positions = self._index.get(user_id)
+        if positions is None:
+            positions = self._index[user_id] = deque()
+        if len(positions) >= self.max_records:
+            old_number, _ = positions.popleft()
+            self._live[old_number] -= 1
+        positions.append((number, offset))
+        self._live[number] += 1
+        self._last_write[user_id] = max(ts_ms, self._last_write.get(user_id, 0))
+
+    # --- escritura ---
+    def append(self, user_id, *messages):
+        ts_ms = int(time.time() * 1000)
+        with self._lock:
+            seq = self._seq.get(user_id, 0)
+            for msg in messages:
+                seq += 1
+                self._pending.append((user_id, encode_record(user_id, msg, ts_ms, seq)))
+            self._seq[user_id] = seq
+
+    def flush(self):
+        """
+        Group commit: un write + fsync para todo lo pendiente. El fsync ocurre sin
+        `_lock`, así que append() y read() siguen atendiéndose mientras el disco confirma.
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch, self._pending = self._pending, []
+                self._write_batch(batch)
+            if self.fsync:
+                self._offload(os.fsync, self._fh.fileno())
+            with self._lock:
+                if self._active.size >= self.segment_bytes:
+                    self._open_active(self._active.number + 1)
+            return len(batch)
+
+    def _write_batch(self, batch):
+        seg = self._active
+        offset = seg.size
+        for user_id, record in batch:
+            ts_ms = HEADER.unpack_from(record, 0)[2]
+            self._track(user_id, seg.number, offset, ts_ms)
+            offset += len(record)
+        self._records[seg.number] += len(batch)
+        self._fh.write(b''.join(record for _, record in batch))
+        self._fh.flush()
+        seg.size = offset
+
+    def run_flusher(self, interval, sleep=time.sleep):
+        while True:
+            sleep(interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Error al volcar la bitácora del chat")
+
+    # --- lectura ---
+    def read(self, user_id, limit=None):
+        """Últimos `limit` mensajes de la conversación (por defecto todo lo retenido)."""
+        limit = min(limit or self.max_records, self.max_records)
+        with self._lock:
+            messages = []
+            for number, offset in self._index.get(user_id, ()):
+                msg = read_record(self._segments[number].view(), offset)[1]
+                messages.append(msg)
+            for uid, record in self._pending:
+                if uid == user_id:
+                    messages.append(read_record(record, 0)[1])
+            return messages[-limit:]
+
+    # --- compactación ---
+    def _retention_cutoff(self):
+        return int((time.time() - self.retention_seconds) * 1000)
+
+    def compact(self, min_live_ratio=0.5):
+        """
+        Expira conversaciones fuera de retención y reescribe los segmentos sellados
+        con pocos registros vivos: los vivos se copian al segmento activo y el
+        archivo viejo se borra. Decidir qué segmentos compactar usa los contadores
+        en memoria (sin releer el disco) y el fsync de las copias ocurre sin `_lock`;
+        los archivos viejos se borran sólo después.
+        """
+        with self._flush_lock:
+            with self._lock:
+                cutoff = self._retention_cutoff()
+                for user_id in [u for u, ts in self._last_write.items() if ts < cutoff]:
+                    for number, _ in self._index.pop(user_id, ()):
+                        self._live[number] -= 1
+                    del self._last_write[user_id]
+                    self._seq.pop(user_id, None)
+
+                victims = [
+                    self._segments[number] for number in sorted(self._segments)
+                    if self._segments[number] is not self._active
+                    and (not self._records[number] or self._live[number] / self._records[number] < min_live_ratio)
+                ]
+                moved = self._move_live_records(victims) if victims else 0
+
+            if moved and self.fsync:
+                self._offload(os.fsync, self._fh.fileno())
+
+            with self._lock:
+                for seg in victims:
+                    seg.close()
+                    os.remove(seg.path)
+                    del self._segments[seg.number]
+                    self._live.pop(seg.number, None)
+                    self._records.pop(seg.number, None)
+                if self._active.size >= self.segment_bytes:
+                    self._open_active(self._active.number + 1)
+            return len(victims)
+
+    def _move_live_records(self, segments):
+        """Copia al segmento activo los registros vivos de `segments` (sin fsync); devuelve cuántos."""
+        sources = {seg.number: seg.view() for seg in segments}
+        moved = {}               # (segmento, offset viejo) -> offset nuevo
+        dest = self._active
+        out = []
+        new_offset = dest.size
+        for positions in self._index.values():
+            for i, (number, offset) in enumerate(positions):
+                buf = sources.get(number)
+                if buf is None:
+                    continue
+                key = (number, offset)
+                if key not in moved:
+                    end = offset + HEADER.size + HEADER.unpack_from(buf, offset)[0]
+                    out.append(buf[offset:end])
+                    moved[key] = new_offset
+                    new_offset += end - offset
+                positions[i] = (dest.number, moved[key])
+        if out:
+            self._fh.write(b''.join(out))
+            self._fh.flush()
+            dest.size = new_offset
+            self._live[dest.number] += len(moved)
+            self._records[dest.number] += len(moved)
+        return len(moved)
+
+    def run_compactor(self, interval, sleep=time.sleep):
+        while True:
+            sleep(interval)
+            try:
+                removed = self.compact()
+                if removed:
+                    logger.info("Bitácora compactada: %d segmentos eliminados", removed)
+            except Exception:
+                logger.exception("Error al compactar la bitácora del chat")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "segments": len(self._segments),
+                "bytes": sum(seg.size for seg in self._segments.values()),
+                "conversations": len(self._index),
+                "pending": len(self._pending),
+            }
+
+    def close(self):
+        # al salir del proceso el threadpool del hub puede ya no existir: el último fsync va directo
+        self._offload = lambda fn, *args: fn(*args)
+        self.flush()
+        with self._flush_lock, self._lock:
+            for seg in self._segments.values():
+                seg.close()
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+            if self._lock_fh is not None:
+                self._lock_fh.close()
+                self._lock_fh = None
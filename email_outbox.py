@@ -0,0 +1,240 @@
+# email_outbox.py
+# Bandeja de salida durable para los correos (SQLite). El flujo del resumen sólo
+# encola; un despachador toma por lotes los correos vencidos y un número acotado
+# de workers los entrega con reintentos (backoff exponencial con jitter).
+# El id de cada correo es también su Idempotency-Key en Resend: si el proceso
+# muere a media entrega, el reintento no duplica el correo.
+#
+# Reclamar un correo es tomar un lease: status='sending' con claimed_at. Si el
+# worker que lo tomó muere, el correo vuelve a estar disponible cuando el lease
+# vence (`lease_seconds`), sin tocar los que otros procesos vivos están enviando.
+# Las llamadas a SQLite (y la espera del lock de BEGIN IMMEDIATE) corren en
+# `offload`, fuera del loop de gevent.
+import time
+import uuid
+import queue
+import random
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger("build-a-chat.outbox")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id            TEXT PRIMARY KEY,
+    user_id       TEXT NOT NULL,
+    to_email      TEXT NOT NULL,
+    subject       TEXT NOT NULL,
+    html          TEXT NOT NULL,
+    filename      TEXT,
+    attachment    TEXT,                   -- PDF en base64, listo para Resend
+    status        TEXT NOT NULL,          -- pending | sending | sent | failed
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    next_attempt  REAL NOT NULL,
+    claimed_at    REAL,                   -- inicio del lease de 'sending'
+    last_error    TEXT,
+    provider_id   TEXT,
+    created       REAL NOT NULL,
+    updated       REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt);
+CREATE INDEX IF NOT EXISTS outbox_user ON outbox (user_id, created);
+"""
+
+STATUS_MESSAGES = {
+    'pending': 'Correo en cola de envío.',
+    'retrying': 'No se pudo enviar el correo; se reintentará en unos momentos.',
+    'sent': 'Resumen enviado por correo.',
+    'failed': 'No se pudo enviar el correo.',
+}
+
+
+class PermanentDeliveryError(Exception):
+    """El proveedor rechazó el correo (p. ej. 4xx): reintentar no sirve."""
+
+
+class EmailOutbox:
+    """
+    send(email) entrega un correo (dict con id, to_email, subject, html, filename,
+    attachment en base64) y devuelve el id del proveedor; lanza PermanentDeliveryError si no
+    tiene caso reintentar. notify(user_id, payload) avisa cada cambio de estado.
+    `lease_seconds` debe cubrir de sobra una entrega con todos sus reintentos HTTP.
+    offload(fn, *args) ejecuta fn fuera del loop y devuelve su resultado (por
+    defecto, en el mismo hilo).
+    """
+
+    def __init__(self, path, send, notify=lambda user_id, payload: None, workers=4, batch=20,
+                 max_attempts=6, backoff=2.0, max_backoff=600.0, retention_seconds=7 * 24 * 3600,
+                 lease_seconds=300.0, clock=time.time, offload=None):
+        self._send = send
+        self._notify = notify
+        self.workers = workers
+        self.batch = batch
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retention_seconds = retention_seconds
+        self.lease_seconds = lease_seconds
+        self._clock = clock
+        self._offload = offload or (lambda fn, *args: fn(*args))
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()   # una operación a la vez sobre la conexión compartida
+
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        columns = {row['name'] for row in self._db.execute("PRAGMA table_info(outbox)")}
+        if 'claimed_at' not in columns:
+            # bandejas creadas antes del lease: sus 'sending' sin claimed_at cuentan como vencidos
+            self._db.execute("ALTER TABLE outbox ADD COLUMN claimed_at REAL")
+
+    def _call(self, fn, *args):
+        """fn(db, *args) en `offload`; el lock se toma en el greenlet que llama."""
+        with self._lock:
+            return self._offload(fn, self._db, *args)
+
+    # --- productor ---
+    def enqueue(self, user_id, to_email, subject, html, attachment=None, filename=None):
+        email_id = uuid.uuid4().hex
+        now = self._clock()
+        self._call(lambda db: db.execute(
+            "INSERT INTO outbox (id, user_id, to_email, subject, html, filename, attachment,"
+            " status, next_attempt, created, updated) VALUES (?,?,?,?,?,?,?,'pending',?,?,?)",
+            (email_id, user_id, to_email, subject, html, filename, attachment, now, now, now),
+        ))
+        self._notify(user_id, self._payload(email_id, 'pending', to_email))
+        return email_id
+
+    def status(self, user_id, limit=10):
+        """Últimos correos del usuario, del más reciente al más viejo."""
+        rows = self._call(lambda db: db.execute(
+            "SELECT id, to_email, status, attempts, last_error, created, updated FROM outbox"
+            " WHERE user_id=? ORDER BY created DESC LIMIT ?", (user_id, limit),
+        ).fetchall())
+        return [dict(row) for row in rows]
+
+    def stats(self):
+        rows = self._call(lambda db: db.execute(
+            "SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+        return dict(rows)
+
+    # --- despacho ---
+    def start(self, spawn):
+        for _ in range(self.workers):
+            spawn(self._work)
+
+    def claim_due(self):
+        """
+        Toma el lease de hasta `batch` correos (vencidos, o 'sending' con el lease
+        expirado porque su worker murió) y los pone en la cola de workers.
+        """
+        now = self._clock()
+        rows = self._call(self._claim, now)
+        for row in rows:
+            self._queue.put(dict(row))
+        return len(rows)
+
+    def _claim(self, db, now):
+        # BEGIN IMMEDIATE: otro proceso con el mismo archivo no puede reclamar los mismos
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            rows = db.execute(
+                "SELECT * FROM outbox WHERE (status='pending' AND next_attempt<=?)"
+                " OR (status='sending' AND (claimed_at IS NULL OR claimed_at<=?))"
+                " ORDER BY next_attempt LIMIT ?", (now, now - self.lease_seconds, self.batch),
+            ).fetchall()
+            db.executemany("UPDATE outbox SET status='sending', claimed_at=?, updated=? WHERE id=?",
+                           [(now, now, row['id']) for row in rows])
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        for row in rows:
+            if row['status'] == 'sending':
+                logger.warning("Correo %s: lease vencido, se vuelve a reclamar", row['id'])
+        # el lease que se acaba de tomar identifica al dueño en las escrituras siguientes
+        return [dict(row, status='sending', claimed_at=now) for row in rows]
+
+    def purge(self):
+        cutoff = self._clock() - self.retention_seconds
+        cur = self._call(lambda db: db.execute(
+            "DELETE FROM outbox WHERE status IN ('sent', 'failed') AND updated<?", (cutoff,)))
+        return cur.rowcount
+
+    def run(self, interval=1.0, sleep=time.sleep, purge_every=3600.0):
+        last_purge = 0.0
+        while True:
+            try:
+                # sólo se reclama más cuando los workers vaciaron el lote anterior
+                if self._queue.empty():
+                    self.claim_due()
+                if self._clock() - last_purge >= purge_every:
+                    last_purge = self._clock()
+                    self.purge()
+            except Exception:
+                logger.exception("Error en el despachador de correos")
+            sleep(interval)
+
+    def _work(self):
+        while True:
+            email = self._queue.get()
+            try:
+                self._deliver(email)
+            except Exception:
+                logger.exception("Error al procesar el correo %s", email['id'])
+
+    def _deliver(self, email):
+        attempts = email['attempts'] + 1
+        try:
+            provider_id = self._send(email)
+        except PermanentDeliveryError as e:
+            self._finish(email, 'failed', attempts, error=str(e))
+        except Exception as e:
+            if attempts >= self.max_attempts:
+                self._finish(email, 'failed', attempts, error=str(e))
+                return
+            delay = random.uniform(0.5, 1.0) * min(self.max_backoff, self.backoff * (2 ** (attempts - 1)))
+            logger.warning("Correo %s: intento %d falló (%s); reintento en %.1fs", email['id'], attempts, e, delay)
+            now = self._clock()
+            if not self._release(email, "status='pending', attempts=?, next_attempt=?, last_error=?, updated=?",
+                                 (attempts, now + delay, str(e), now)):
+                return
+            if attempts == 1:
+                self._notify(email['user_id'], self._payload(email['id'], 'retrying', email['to_email']))
+        else:
+            self._finish(email, 'sent', attempts, provider_id=provider_id)
+
+    def _finish(self, email, status, attempts, error=None, provider_id=None):
+        now = self._clock()
+        # el adjunto ya no hace falta: se libera el espacio
+        if not self._release(email, "status=?, attempts=?, last_error=?, provider_id=?, attachment=NULL, updated=?",
+                             (status, attempts, error, provider_id, now)):
+            return
+        if status == 'failed':
+            logger.error("Correo %s descartado tras %d intentos: %s", email['id'], attempts, error)
+        self._notify(email['user_id'], self._payload(email['id'], status, email['to_email'], error))
+
+    def _release(self, email, assignments, params):
+        """
+        Cierra el lease con `assignments`. Si el lease venció y otro worker ya tomó
+        el correo, no se toca la fila (el otro reintenta con la misma llave) y se
+        devuelve False.
+        """
+        cur = self._call(lambda db: db.execute(
+            f"UPDATE outbox SET {assignments}, claimed_at=NULL"
+            " WHERE id=? AND status='sending' AND claimed_at=?", (*params, email['id'], email['claimed_at'])))
+        if cur.rowcount == 0:
+            logger.warning("Correo %s: el lease venció durante la entrega; lo resuelve otro worker", email['id'])
+            return False
+        return True
+
+    @staticmethod
+    def _payload(email_id, status, to_email, error=None):
+        payload = {'email_id': email_id, 'status': status, 'to': to_email,
+                   'message': STATUS_MESSAGES[status]}
+        if error:
+            payload['error'] = error
+        return payload
@@ -0,0 +1,216 @@
+# http_client.py
+# Cliente HTTP saliente compartido para Gemma, la API de polaridad y Resend.
+# Cada upstream tiene su propia Session (pool keep-alive por host), timeouts de
+# conexión y lectura separados, reintentos con jitter en 429/5xx y un circuit
+# breaker para fallar rápido cuando el servicio está caído.
+import time
+import random
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger("build-a-chat.http")
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class UpstreamUnavailable(RuntimeError):
+    """El circuit breaker del upstream está abierto."""
+
+
+class CircuitBreaker:
+    """
+    closed -> open tras `failure_threshold` fallos seguidos; open rechaza todo
+    durante `reset_timeout` segundos; luego half_open deja pasar una prueba:
+    si sale bien vuelve a closed, si falla se reabre.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = None
+        self.times_opened = 0
+
+    def allow(self):
+        if self.state == 'open':
+            if self._clock() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = 'half_open'
+            return True
+        if self.state == 'half_open':
+            # sólo una petición de prueba a la vez
+            return False
+        return True
+
+    def is_open(self):
+        """True si hoy rechazaría peticiones (sin consumir la prueba de half_open)."""
+        return self.state == 'open' and self._clock() - self.opened_at < self.reset_timeout
+
+    def record_success(self):
+        self.state = 'closed'
+        self.failures = 0
+
+    def record_client_error(self):
+        """
+        4xx: el upstream respondió, pero la petición era inválida. No reinicia la cuenta
+        de fallos seguidos (no prueba que el servicio esté sano); una prueba de half_open
+        que llega a responder sí cierra el circuito.
+        """
+        if self.state == 'half_open':
+            self.state = 'closed'
+            self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == 'half_open' or self.failures >= self.failure_threshold:
+            if self.state != 'open':
+                self.times_opened += 1
+            self.state = 'open'
+            self.opened_at = self._clock()
+
+    def stats(self):
+        return {"state": self.state, "failures": self.failures, "times_opened": self.times_opened}
+
+
+class UpstreamClient:
+    def __init__(self, name, pool_size=10, connect_timeout=3.05, read_timeout=30.0,
+                 retries=2, backoff=0.5, max_backoff=8.0, breaker=None, sleep=time.sleep, observer=None,
+                 tracer=None):
+        self.name = name
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker()
+        self._sleep = sleep
+        # observer(upstream, resultado, segundos) por cada intento (p. ej. métricas)
+        self._observer = observer
+        # tracer.span(nombre, **tags) envuelve cada post (ver profiling.Tracer)
+        self._tracer = tracer
+
+        self.session = requests.Session()
+        # los reintentos los maneja post(); el adapter sólo aporta el pool keep-alive
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._adapter = adapter
+
+        self.requests = 0
+        self.retried = 0
+        self.failed = 0
+        self.rejected = 0
+        self.client_errors = 0
+
+    def _delay(self, attempt, resp=None):
+        if resp is not None and resp.status_code == 429:
+            retry_after = resp.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                return min(float(retry_after), self.max_backoff)
+        # full jitter: evita que todos los greenlets reintenten al mismo tiempo
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+    def post(self, url, read_timeout=None, **kwargs):
+        """POST con reintentos; devuelve la última respuesta (el llamador decide raise_for_status)."""
+        if self._tracer is None:
+            return self._post(url, read_timeout, **kwargs)
+        with self._tracer.span(f'upstream.{self.name}', upstream=self.name):
+            return self._post(url, read_timeout, **kwargs)
+
+    def _post(self, url, read_timeout=None, **kwargs):
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise UpstreamUnavailable(f"{self.name} no disponible (circuit breaker abierto)")
+
+        probe = self.breaker.state == 'half_open'
+        try:
+            return self._send(url, read_timeout, **kwargs)
+        except BaseException:
+            # una prueba interrumpida (GreenletExit, gevent.Timeout) no llegó a registrar nada
+            # y dejaría el breaker en half_open para siempre: cuenta como fallo
+            if probe and self.breaker.state == 'half_open':
+                self.failed += 1
+                self.breaker.record_failure()
+            raise
+
+    def _send(self, url, read_timeout=None, **kwargs):
+        timeout = (self.connect_timeout, read_timeout or self.read_timeout)
+        attempt = 0
+        while True:
+            self.requests += 1
+            resp = None
+            start = time.perf_counter()
+            try:
+                resp = self.session.post(url, timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._observe('timeout' if isinstance(e, requests.Timeout) else 'connection_error', start)
+                error = e
+            except Exception:
+                # error no reintentable; igual cuenta para el breaker (y libera un half_open)
+                self._observe('error', start)
+                self.failed += 1
+                self.breaker.record_failure()
+                raise
+            else:
+                # con stream=True mide hasta los headers, no el cuerpo completo
+                self._observe(str(resp.status_code), start)
+                if resp.status_code in RETRY_STATUSES:
+                    error = None
+                elif 400 <= resp.status_code < 500:
+                    # un 4xx es culpa de la petición, no del upstream: ni éxito ni fallo
+                    self.client_errors += 1
+                    self.breaker.record_client_error()
+                    return resp
+                else:
+                    self.breaker.record_success()
+                    return resp
+
+            if attempt >= self.retries:
+                self.failed += 1
+                self.breaker.record_failure()
+                if error is not None:
+                    raise error
+                return resp
+
+            delay = self._delay(attempt, resp)
+            logger.warning("%s: reintento %d en %.2fs (%s)", self.name, attempt + 1, delay,
+                           error or resp.status_code)
+            if resp is not None:
+                # la respuesta descartada devuelve (o cierra) su conexión del pool
+                resp.close()
+            attempt += 1
+            self.retried += 1
+            self._sleep(delay)
+
+    def _observe(self, outcome, start):
+        if self._observer is not None:
+            self._observer(self.name, outcome, time.perf_counter() - start)
+
+    def pool_stats(self):
+        pools = self._adapter.poolmanager.pools
+        stats = []
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            stats.append({
+                "host": key.key_host,
+                "num_connections": pool.num_connections,
+                "num_requests": pool.num_requests,
+            })
+        return stats
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "retried": self.retried,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "client_errors": self.client_errors,
+            "breaker": self.breaker.stats(),
+            "pools": self.pool_stats(),
+        }
@@ -0,0 +1,318 @@
+# loadtest.py
+# Generador de carga Socket.IO: simula N alumnos recorriendo los flujos reales
+# (connect -> join -> register_name -> "menu" -> menu_option_selected /
+# submenu_option_selected anidados -> mensaje libre) y M admins escuchando
+# 'message_admin'. Reporta throughput y p50/p95/p99 por evento.
+#
+#   python loadtest.py --url http://127.0.0.1:5000 --clients 200 --admins 2 --ramp 10
+#
+# Con --summary-ratio una fracción de los clientes pide además el resumen por
+# correo; para probarlo sin red arranca los stand-ins (python upstream_stubs.py,
+# o --stubs PORT aquí mismo) y apunta la app a ellos con las variables que se
+# imprimen al iniciar.
+import sys
+import json
+import time
+import queue
+import random
+import argparse
+import threading
+from collections import defaultdict
+
+import socketio
+
+FREE_TEXT = [
+    "hola, quiero información de inscripciones",
+    "¿dónde veo la retícula de mi carrera?",
+    "gracias, me sirvió mucho",
+    "¿cuál es el horario de servicios escolares?",
+    "no encuentro el enlace de residencias",
+]
+AUTOCOMPLETE_QUERIES = ["ingenieria elec", "reticula sist", "recibos", "plan de estudios bio", "servicios"]
+MENU_EVENTS = ('show_submenu', 'show_link', 'show_info', 'show_map')
+
+
+class Timeout(Exception):
+    pass
+
+
+class Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)   # evento -> [segundos]
+        self.errors = defaultdict(int)       # evento -> fallos/timeouts
+
+    def record(self, event, seconds):
+        with self._lock:
+            self.latencies[event].append(seconds)
+
+    def error(self, event):
+        with self._lock:
+            self.errors[event] += 1
+
+    @staticmethod
+    def percentile(sorted_values, p):
+        if not sorted_values:
+            return 0.0
+        k = min(len(sorted_values) - 1, max(0, int(round(p / 100.0 * len(sorted_values) + 0.5)) - 1))
+        return sorted_values[k]
+
+    def summary(self, wall):
+        rows = []
+        with self._lock:
+            events = sorted(set(self.latencies) | set(self.errors))
+            for event in events:
+                values = sorted(self.latencies.get(event, ()))
+                rows.append({
+                    "event": event,
+                    "count": len(values),
+                    "errors": self.errors.get(event, 0),
+                    "rate": len(values) / wall if wall else 0.0,
+                    "p50_ms": self.percentile(values, 50) * 1000,
+                    "p95_ms": self.percentile(values, 95) * 1000,
+                    "p99_ms": self.percentile(values, 99) * 1000,
+                    "max_ms": (values[-1] if values else 0.0) * 1000,
+                })
+        total = sum(r["count"] for r in rows if r["event"] != "admin_fanout")
+        return {"wall_s": wall, "ops": total, "ops_per_s": total / wall if wall else 0.0, "events": rows}
+
+
+class _Socket:
+    """Cliente Socket.IO que encola todo lo que recibe para esperarlo con expect()."""
+
+    def __init__(self, url, stats, timeout, transports):
+        self.url = url
+        self.stats = stats
+        self.timeout = timeout
+        self.transports = transports
+        self.inbox = queue.Queue()
+        self.sio = socketio.Client(reconnection=False)
+        self.sio.on('*', self._on_any)
+
+    def _on_any(self, event, data=None):
+        self.inbox.put((event, data))
+
+    def expect(self, events, predicate=None, timeout=None):
+        deadline = time.perf_counter() + (timeout or self.timeout)
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise Timeout(events)
+            try:
+                event, data = self.inbox.get(timeout=remaining)
+            except queue.Empty:
+                raise Timeout(events)
+            if event in events and (predicate is None or predicate(data)):
+                return event, data
+
+    def timed(self, name, emit_event, payload, events, predicate=None, timeout=None):
+        """Emite y mide hasta la respuesta esperada; registra la latencia bajo `name`."""
+        start = time.perf_counter()
+        if payload is None:
+            self.sio.emit(emit_event)
+        else:
+            self.sio.emit(emit_event, payload)
+        try:
+            result = self.expect(events, predicate, timeout)
+        except Timeout:
+            self.stats.error(name)
+            raise
+        self.stats.record(name, time.perf_counter() - start)
+        return result
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            self.sio.connect(self.url, transports=self.transports, wait_timeout=self.timeout)
+            self.expect(('connected',))
+        except Exception:
+            self.stats.error('connect')
+            raise
+        self.stats.record('connect', time.perf_counter() - start)
+
+    def close(self):
+        try:
+            self.sio.disconnect()
+        except Exception:
+            pass
+
+
+class StudentClient(_Socket):
+    def __init__(self, n, args, stats, sent):
+        super().__init__(args.url, stats, args.timeout, args.transports)
+        self.n = n
+        self.args = args
+        self.sent = sent                 # { message_id: perf_counter } para medir el fan-out admin
+        self.rng = random.Random(n)
+
+    def run(self):
+        try:
+            self.connect()
+            self.timed('join', 'join', {}, ('chat_history',))
+            self.timed('register_name', 'register_name', {'name': f'alumno-{self.n}'}, ('message',),
+                       lambda m: m.get('sender') == 'Tecbot')
+            for _ in range(self.args.iterations):
+                self.browse_menu()
+                if self.args.autocomplete:
+                    self.type_ahead()
+                self.free_text()
+                time.sleep(self.rng.uniform(0, self.args.think))
+            if self.rng.random() < self.args.summary_ratio:
+                self.summary()
+        except Timeout:
+            pass
+        except Exception as e:
+            self.stats.error(f'client:{type(e).__name__}')
+        finally:
+            self.close()
+
+    def _send_message(self, text):
+        message_id = f"lt-{self.n}-{self.rng.getrandbits(48):x}"
+        self.sent[message_id] = time.perf_counter()
+        return message_id, {'text': text, 'message_id': message_id}
+
+    def browse_menu(self):
+        message_id, payload = self._send_message('menu')
+        _, menu = self.timed('menu', 'message', payload, ('show_menu',))
+        options = (menu or {}).get('menu') or []
+        event, emit_event, depth = None, 'menu_option_selected', 0
+        while options and depth < self.args.max_depth:
+            option = self.rng.choice(options)
+            name = 'menu_option_selected' if depth == 0 else 'submenu_option_selected'
+            event, data = self.timed(name, emit_event, {'id': option['id']}, MENU_EVENTS)
+            if event != 'show_submenu':
+                break
+            options = (data or {}).get('submenu') or []
+            emit_event, depth = 'submenu_option_selected', depth + 1
+
+    def type_ahead(self):
+        """Escribe una etiqueta del menú tecla por tecla pidiendo sugerencias (como el cliente)."""
+        query = self.rng.choice(AUTOCOMPLETE_QUERIES)
+        for n in range(2, len(query) + 1):
+            seq = self.rng.getrandbits(32)
+            self.timed('menu_autocomplete', 'menu_autocomplete', {'q': query[:n], 'seq': seq},
+                       ('menu_autocomplete_results',), lambda r: (r or {}).get('seq') == seq)
+            time.sleep(self.args.keystroke)
+
+    def free_text(self):
+        message_id, payload = self._send_message(self.rng.choice(FREE_TEXT))
+        self.timed('message', 'message', payload, ('message',),
+                   lambda m: (m or {}).get('message_id') == message_id)
+
+    def summary(self):
+        start = time.perf_counter()
+        self.sio.emit('request_summary_email', {'email': f'alumno{self.n}@example.com'})
+        timeout = self.args.summary_timeout
+        try:
+            _, first = self.expect(('summary_chunk',), timeout=timeout)
+            self.stats.record('summary_first_chunk', time.perf_counter() - start)
+        except Timeout:
+            # sin streaming (o cache) no hay chunk: se mide sólo el final
+            pass
+        try:
+            _, status = self.expect(('summary_status',), lambda s: s.get('ok') is not None, timeout=timeout)
+        except Timeout:
+            self.stats.error('summary_done')
+            return
+        if not status.get('ok'):
+            self.stats.error('summary_done')
+            return
+        self.stats.record('summary_done', time.perf_counter() - start)
+        try:
+            self.expect(('email_status',), lambda s: s.get('status') in ('sent', 'failed'), timeout=timeout)
+            self.stats.record('email_sent', time.perf_counter() - start)
+        except Timeout:
+            self.stats.error('email_sent')
+
+
+class AdminClient(_Socket):
+    """Admin que escucha los lotes y mide cuánto tarda en verse cada mensaje de alumno."""
+
+    def __init__(self, args, stats, sent):
+        super().__init__(args.url, stats, args.timeout, args.transports)
+        self.sent = sent
+        self.sio.on('admin_batch', self._on_batch)
+
+    def _on_batch(self, batch):
+        now = time.perf_counter()
+        for item in batch or ():
+            if item.get('event') != 'message_admin':
+                continue
+            message_id = ((item.get('data') or {}).get('message') or {}).get('message_id')
+            sent_at = self.sent.get(message_id)
+            if sent_at is not None:
+                self.stats.record('admin_fanout', now - sent_at)
+
+    def start(self):
+        self.connect()
+        self.timed('admin_join', 'admin_join', None, ('chat_list_snapshot',))
+
+
+def print_report(report, out=sys.stdout):
+    print(f"\nDuración: {report['wall_s']:.1f}s  operaciones: {report['ops']}  "
+          f"throughput: {report['ops_per_s']:.1f} ops/s\n", file=out)
+    print(f"{'evento':<26}{'n':>7}{'err':>6}{'ops/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}", file=out)
+    for r in report["events"]:
+        print(f"{r['event']:<26}{r['count']:>7}{r['errors']:>6}{r['rate']:>8.1f}{r['p50_ms']:>9.1f}"
+              f"{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}{r['max_ms']:>9.1f}", file=out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga Socket.IO para Build a Chat")
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--clients', type=int, default=50, help="alumnos simultáneos")
+    parser.add_argument('--admins', type=int, default=1)
+    parser.add_argument('--ramp', type=float, default=5.0, help="segundos para conectar a todos los alumnos")
+    parser.add_argument('--iterations', type=int, default=3, help="recorridos menú + mensaje por alumno")
+    parser.add_argument('--think', type=float, default=1.0, help="pausa máxima entre recorridos (s)")
+    parser.add_argument('--max-depth', type=int, default=3, help="niveles de submenú a recorrer")
+    parser.add_argument('--autocomplete', action='store_true', help="teclear consultas con 'menu_autocomplete'")
+    parser.add_argument('--keystroke', type=float, default=0.15, help="pausa entre teclas (s)")
+    parser.add_argument('--summary-ratio', type=float, default=0.0, help="fracción de alumnos que pide resumen")
+    parser.add_argument('--summary-timeout', type=float, default=120.0)
+    parser.add_argument('--timeout', type=float, default=15.0, help="espera máxima por respuesta (s)")
+    parser.add_argument('--transports', default='websocket', help="websocket | polling | polling,websocket")
+    parser.add_argument('--stubs', type=int, metavar='PORT', help="arranca aquí los stand-ins de upstreams")
+    parser.add_argument('--json', action='store_true', help="imprime el reporte en JSON")
+    args = parser.parse_args()
+    args.transports = args.transports.split(',')
+
+    if args.stubs is not None:
+        from upstream_stubs import start_stubs
+        _, base = start_stubs(args.stubs)
+        print(f"Stand-ins en {base}; arranca la app con:\n"
+              f"  GEMMA_API_KEY=stub GEMMA_API_BASE={base} SENTIMENT_API_URL={base}/sentiment "
+              f"RESEND_API_KEY=stub RESEND_API_URL={base}/emails", file=sys.stderr)
+
+    stats = Stats()
+    sent = {}
+    admins = [AdminClient(args, stats, sent) for _ in range(args.admins)]
+    for admin in admins:
+        admin.start()
+
+    start = time.perf_counter()
+    threads = []
+    for n in range(args.clients):
+        t = threading.Thread(target=StudentClient(n, args, stats, sent).run, daemon=True)
+        t.start()
+        threads.append(t)
+        if args.ramp and args.clients > 1:
+            time.sleep(args.ramp / args.clients)
+    for t in threads:
+        t.join()
+    # margen para que llegue el último tick del feed admin
+    time.sleep(0.5)
+    wall = time.perf_counter() - start
+
+    for admin in admins:
+        admin.close()
+
+    report = stats.summary(wall)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,592 +1,26 @@
-menu_config = {
-    "menu_ambar": {
-        "id": "menu_ambar",
-        "type": "link",
-        "label": "Ambar",
-        "link": "https://culiacan.ambar.tecnm.mx/estudiantes/"
-    },
-    "menu_asp": {
-        "id": "menu_asp",
-        "type": "submenu",
-        "label": "Aspirantes",
-        "submenu": [
-            {
-                "id": "asp_preinsc",
-                "label": "Sistema de Pre-Inscripciones",
-                "type": "link",
-                "link": "https://www.culiacan.tecnm.mx/preinscripciones-agosto-diciembre-2025/"
-            },
-            {
-                "id": "asp_recibos",
-                "label": "Recibos",
-                "type": "link",
-                "link": "https://culiacan.ambar.tecnm.mx/recibos/"
-            },
-            {
-                "id": "asp_evaluatec",
-                "label": "EVALUATEC",
-                "type": "submenu",
-                "submenu": [
-                    {
-                        "id": "eval_link1",
-                        "label": "Link 1",
-                        "type": "link",
-                        "link": "https://culiacan.evaluatec.tecnm.mx"
-                    }
-                ]
-            }
-        ]
-    },
-    "menu_ofe": {
-        "id": "menu_ofe",
-        "type": "submenu",
-        "label": "Oferta Educativa",
-        "submenu": [
-            {
-                "id": "ofe_lic",
-                "label": "Licenciaturas",
-                "type": "submenu",
-                "submenu": [
-                    {
-                        "id": "lic_ambiental",
-                        "label": "Ingeniería Ambiental",
-                        "type": "submenu",
-                        "submenu": [
-                            {
-                                "id": "ambiental_reticula",
-                                "label": "Retícula",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2016/10/Reticula-Ingenieria-Ambiental.pdf"
-                            },
-                            {
-                                "id": "ambiental_plan",
-                                "label": "Plan de estudios",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2024/02/FOLLETO-AMBIENTAL.pdf"
-                            },
-                            {
-                                "id": "ambiental_programas",
-                                "label": "Programas de estudios por materia",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2024/01/AMBIENTAL.zip"
-                            }
-                        ]
-                    },
+# menu_config.py
+# El árbol del menú vive en un archivo de datos (JSON o YAML) para poder editarlo
+# sin redeploy. MENU_FILE permite apuntar a otro archivo.
+import os
+import json
 
-                     {
-                        "id": "lic_bioquimica",
-                        "label": "Ingeniería Bioquimica",
-                        "type": "submenu",
-                        "submenu": [
-                            {
-                                "id": "bioquimica_reticula",
-                                "label": "Retícula",
-                                "type": "link",
-                                "link": "https://docs.google.com/viewerng/viewer?url=https://www.culiacan.tecnm.mx/wp-content/uploads/2016/10/Reticula+Ingenieria+Bioquimica.pdf"
-                            },
-                            {
-                                "id": "bioquimica_plan",
-                                "label": "Plan de estudios",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2024/02/FOLLETO-BIOQUIMICA.pdf"
-                            },
-                            {
-                                "id": "bioquimica_programas",
-                                "label": "Programas de estudios por materia",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2024/01/BIOQUIMICA.zip"
-                            }
-                        ]
-                    },
-                    {
-                        "id": "lic_electrica",
-                        "label": "Ingeniería Electrica",
-                        "type": "submenu",
-                        "submenu": [
-                            {
-                                "id": "electrica_reticula",
-                                "label": "Retícula",
-                                "type": "link",
-                                "link": "http://culiacan.tecnm.mx/wp-content/uploads/2017/03/Reticula-Ingenieria-Electrica.pdf"
-                            },
-                            {
-                                "id": "electrica_plan",
-                                "label": "Plan de estudios",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2024/02/FOLLETO-ELECTRICA.pdf"
-                            },
-                            {
-                                "id": "electrica_programas",
-                                "label": "Programas de estudios por materia",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2024/01/ELECTRICA.zip"
-                            }
-                        ]
-                    },
-                    {
-                        "id": "lic_electronica",
-                        "label": "Ingeniería Electronica",
-                        "type": "submenu",
-                        "submenu": [
-                            {
-                                "id": "electronica_reticula",
-                                "label": "Retícula",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2017/03/Reticula-Ingenieria-Electronica.pdf"
-                            },
-                            {
-                                "id": "electronica_plan",
-                                "label": "Plan de estudios",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2024/02/FOLLETO-ELECTRONICA.pdf"
-                            },
-                            {
-                                "id": "electronica_programas",
-                                "label": "Programas de estudios por materia",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2024/01/ELECTRONICA.zip"
-                            }
-                        ]
-                    },
-                    {
-                        "id": "lic_energias",
-                        "label": "Ingeniería en Energias Renovables",
-                        "type": "submenu",
-                        "submenu": [
-                            {
-                                "id": "energias_reticula",
-                                "label": "Retícula",
-                                "type": "link",
-                                "link": "http://culiacan.tecnm.mx/wp-content/uploads/2017/03/Reticula-Ingenieria-en-Energias-Renovables.pdf"
-                            },
-                            {
-                                "id": "energias_plan",
-                                "label": "Plan de estudios",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2024/02/FOLLETO-ENERGIAS-RENOVABLES.pdf"
-                            },
-                            {
-                                "id": "energias_programas",
-                                "label": "Programas de estudios por materia",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2024/01/ENERGIAS-RENOVABLES.zip"
-                            }
-                        ]
-                    },
-                    {
-                        "id": "lic_gestion",
-                        "label": "Ingeniería en Gestion Empresarial",
-                        "type": "submenu",
-                        "submenu": [
-                            {
-                                "id": "gestion_reticula1",
-                                "label": "Retícula Especialidad 1",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2023/02/Ingenieria-en-Gestion-Empresarial-Plan-2-Esp.-1-INNOVACION.pdf"
-                            },
-                            {
-                                "id": "gestion_reticula2",
-                                "label": "Retícula Especialidad 2",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2023/02/Ingenieria-en-Gestion-Empresarial-Plan-2-Esp.-2-CAPITAL-HUMANO.pdf"
-                            },
-                            {
-                                "id": "gestion_plan",
-                                "label": "Plan de estudios",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2024/02/FOLLETO-IGE.pdf"
-                            },
-                            {
-                                "id": "gestion_programas",
-                                "label": "Programas de estudios por materia",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2024/01/IGE.zip"
-                            }
-                        ]
-                    },
-                    {
-                        "id": "lic_industrial",
-                        "label": "Ingeniería Industrial",
-                        "type": "submenu",
-                        "submenu": [
-                            {
-                                "id": "industrial_reticula1",
-                                "label": "Retícula Especialidad 1",
-                                "type": "link",
-                                "link": "http://culiacan.tecnm.mx/wp-content/uploads/2017/06/Ingenieria-Industrial-Reticula-Nueva-Especialidad-1.pdf"
-                            },
-                                                        {
-                                "id": "industrial_reticula2",
-                                "label": "Retícula Especialidad 2",
-                                "type": "link",
-                                "link": "http://culiacan.tecnm.mx/wp-content/uploads/2016/10/Reticula-Ingenieria-Industrial.pdf"
-                            },
-                                                        {
-                                "id": "industrial_reticula3",
-                                "label": "Retícula Especialidad 3",
-                                "type": "link",
-                                "link": "http://culiacan.tecnm.mx/wp-content/uploads/2017/06/Ingenieria-Industrial-Reticula-Nueva-Especialidad-2.pdf"
-                            },
-                            {
-                                "id": "industrial_plan",
-                                "label": "Plan de estudios",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2024/02/FOLLETO-INDUSTRIAL.pdf"
-                            },
-                            {
-                                "id": "industrial_programas",
-                                "label": "Programas de estudios por materia",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2024/01/INDUSTRIAL-2.zip"
-                            }
-                        ]
-                    },
-                    {
-                        "id": "lic_agricola",
-                        "label": "Ingeniería en Innovacion Agricola Sustentable",
-                        "type": "submenu",
-                        "submenu": [
-                            {
-                                "id": "agricola_reticula",
-                                "label": "Retícula",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2025/03/Reticula-Ingenieria-en-Innovacion-Agricola-Sustentable.docx"
-                            },
-                            {
-                                "id": "agricola_plan",
-                                "label": "Plan de estudios",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2025/03/FOLLETO-INNOVACION-AGRICOLA-SUSTENTABLE_compressed.pdf"
-                            },
-                            {
-                                "id": "agricola_programas",
-                                "label": "Programas de estudios por materia",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2025/03/Ing-en-inno-ag-sus.zip"
-                            }
-                        ]
-                    },
-                    {
-                        "id": "lic_mecanica",
-                        "label": "Ingeniería Mecanica",
-                        "type": "submenu",
-                        "submenu": [
-                            {
-                                "id": "mecanica_reticula",
-                                "label": "Retícula",
-                                "type": "link",
-                                "link": "http://culiacan.tecnm.mx/wp-content/uploads/2016/10/Reticula-Ingenieria-Mecanica.pdf"
-                            },
-                            {
-                                "id": "mecanica_plan",
-                                "label": "Plan de estudios",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2024/02/FOLLETO-MECANICA.pdf"
-                            },
-                            {
-                                "id": "mecanica_programas",
-                                "label": "Programas de estudios por materia",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2024/01/MECANICA.zip"
-                            }
-                        ]
-                    },
+MENU_FILE = os.environ.get(
+    'MENU_FILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'menu_config.json')
+)
 
-                    {
-                        "id": "lic_mecatronica",
-                        "label": "Ingeniería Mecatronica",
-                        "type": "submenu",
-                        "submenu": [
-                            {
-                                "id": "mecatronica_reticula",
-                                "label": "Retícula",
-                                "type": "link",
-                                "link": "http://culiacan.tecnm.mx/wp-content/uploads/2016/10/Reticula-Ingenieria-Mecatronica.pdf"
-                            },
-                            {
-                                "id": "mecatronica_plan",
-                                "label": "Plan de estudios",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2024/02/FOLLETO-MECATRONICA-1.pdf"
-                            },
-                            {
-                                "id": "mecatronica_programas",
-                                "label": "Programas de estudios por materia",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2024/01/MECATRONICA-2.zip"
-                            }
-                        ]
-                    },
-                 
-                    {
-                        "id": "lic_sistemas",
-                        "label": "Ingeniería en Sistemas Computacionales",
-                        "type": "submenu",
-                        "submenu": [
-                            {
-                                "id": "sistemas_reticula",
-                                "label": "Retícula Especialidad 1",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2022/02/ISC_con_Ingenieria_de_Software.pdf"
-                            },
-                            {
-                                "id": "sistemas_reticula",
-                                "label": "Retícula Especialidad 2",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2022/02/TIC_con_Gestion_de_Tecnologias_en_Negocios.pdf"
-                            },
-                            {
-                                "id": "sistemas_plan",
-                                "label": "Plan de estudios",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2024/02/FOLLETO-SISTEMAS-1.pdf"
-                            },
-                            {
-                                "id": "sistemas_programas",
-                                "label": "Programas de estudios por materia",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2024/01/Sistemas.zip"
-                            }
-                        ]
-                    },
-                    {
-                        "id": "lic_tic",
-                        "label": "Ingeniería en Tecnologias de la Informacion y Comunicaciones",
-                        "type": "submenu",
-                        "submenu": [
-                            {
-                                "id": "tic_reticula",
-                                "label": "Retícula Especialidad 1",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2022/02/TIC_con_Ingenieria_de_Software.pdf"
-                            },
-                            {
-                                "id": "tic_reticula",
-                                "label": "Retícula Especialidad 2",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2022/02/TIC_con_Gestion_de_Tecnologias_en_Negocios.pdf"
-                            },
-                            {
-                                "id": "tic_plan",
-                                "label": "Plan de estudios",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2024/02/FOLLETO-TIC-1.pdf"
-                            },
-                            {
-                                "id": "tic_programas",
-                                "label": "Programas de estudios por materia",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2024/01/TIC.zip"
-                            }
-                        ]
-                    }           
-                    # 
-                ]
-            },
-            
-            {
-                "id": "ofe_pos",
-                "label": "Posgrados",
-                "type": "submenu",
-                "submenu": [
-                    {
-                        "id": "pos_computacion",
-                        "label": "Maestría en Ciencias de la Computación",
-                        "type": "submenu",
-                        "submenu": [
-                            {
-                                "id": "computacion_info",
-                                "label": "Informacion ",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/posgrados/maestria-en-ciencias-de-la-computacion"
-                            },
-                            {
-                                "id": "computacion_tutoria",
-                                "label": "Tutoría",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/mcc-tutorias-generacion-2020-2022"
-                            }
-                        ]
-                    },
-                    {
-                        "id": "pos_ingenieria",
-                        "label": "Maestría en Ciencias de la Ingeniería",
-                        "type": "submenu",
-                        "submenu": [
-                            {
-                                "id": "ingenieria_info",
-                                "label": "Información ",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/maestria-en-ciencias-de-la-ingenieria"
-                            },
-                            {
-                                "id": "ingenieria_tutoria",
-                                "label": "Tutoría",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/mci-tutoria-generacion-2021-2023"
-                            }
-                        ]
-                    },
-                    {
-                        "id": "pos_doctorado_inge",
-                        "label": "Doctorado en Ciencias de la Ingeniería",
-                        "type": "submenu",
-                        "submenu": [
-                            {
-                                "id": "doc_ingenieria_info",
-                                "label": "Información ",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/posgrados/doctorado-en-ciencias-de-la-ingenieria"
-                            },
-                            {
-                                "id": "doc_ingenieria_tutoria",
-                                "label": "Tutoría",
-                                "type": "link",
-                                "link": "https://www.culiacan.tecnm.mx/doctorado-en-ciencias-de-la-ingenieria-tutoria-generacion-2022-2026-1"
-                            }
-                        ]
-                    },
-                    
-                ]
-                
-            },
-            {
-                "id": "ofe_cle",
-                "label": "Coordinación de Lenguas Extranjeras",
-                "type": "submenu",
-                "submenu": [
-                    {
-                        "id": "cle_informes",
-                        "label": "Informes CLE",
-                        "type": "info",
-                        "text": "Coordinación de Lenguas Extranjeras  Tel. 667-454-0100  Ext. 1270 y 1271  De lunes a viernes  Con horario de 8:00 am- 3:00 p.m.  Juan de Dios Bátiz  310 Pte., Col. Guadalupe, Culiacán, Sinaloa.  Dentro de las instalaciones del Campus Culiacán"
-                    },
-                    {
-                        "id": "cle_programa",
-                        "label": "Programa e Inscripciones",
-                        "type": "info",
-                        "text": "Es un programa de seis niveles con enfoque conversacional. Los estudiantes son introducidos de manera natural en el diálogo de conversación. Evaluados con base en proyectos.  Incluye actividades, canciones, trabajo en equipo, y manualidades que favorecen un buen comienzo en el aprendizaje del idioma inglés. Solicitud de examen de ubicación: Del 16 de Enero al 26 de Enero de 2026.  Aplicación de examen de ubicación: Del 16 de Enero al 27 de Enero de 2026.  Horario de atención: De 09:00 a 13:30 horas. Es necesario agendar cita.  Horarios de clase  De lunes a viernes: De 08:00 a 19:00 horas (según disponibilidad).  Sabatino: De 09:00 a 13:30 horas."
-                    },
-                    {
-                        "id": "cle_facebook",
-                        "label": "Página de Facebook",
-                        "type": "link",
-                        "link": "https://www.facebook.com/p/Coordinación-De-Lenguas-Extranjeras-Instituto-Tecnológico-de-Culiacán-100057478148166/?locale=es_LA"
-                    }
-                ]
-            }
-        ]
-    },
-    "menu_est": {
-        "id": "menu_est",
-        "type": "submenu",
-        "label": "Estudiantes",
-        "submenu": [
-            {
-                "id": "est_serv",
-                "label": "Servicios Escolares",
-                "type": "submenu",
-                "submenu": [
-                    {
-                        "id": "horarios",
-                        "label": "Horarios de Atención",
-                        "type": "info",
-                        "text": "Lunes a Viernes de 8:00 a 14:00 hrs."
-                    },
-                    {
-                        "id": "reglamento",
-                        "label": "Reglamento de Estudiantes",
-                        "type": "link",
-                        "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2024/04/Reglamento_de_Estudiantes_del_TecNM.pdf"
-                    },
-                    {
-                        "id": "medicos",
-                        "label": "Servicios Médicos",
-                        "type": "link",
-                        "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2024/04/SERVICIOS-MEDICOS-DEL-ITC.pdf"
-                    },
-                    {
-                        "id": "thona",
-                        "label": "Seguro THONA",
-                        "type": "link",
-                        "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2024/04/THONA-SEGUROS-2024.pdf"
-                    },
-                    {
-                        "id": "imss",
-                        "label": "Seguro IMSS",
-                        "type": "link",
-                        "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2024/04/SEGURO-FACULTATIVO-2024.pdf"
-                    }
-                ]
-            },
-            {
-                "id": "est_fin",
-                "label": "Recursos Financieros",
-                "type": "submenu",
-                "submenu": [
-                    {
-                        "id": "cuotas",
-                        "label": "Cuotas de servicios",
-                        "type": "link",
-                        "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2025/06/Minuta-de-Cuotas-SEM-115.pdf"
-                    },
-                    {
-                        "id": "horarios_fin",
-                        "label": "Horarios de atención",
-                         "type": "info",
-                        "text": " Horarios de atención en ventanilla bancaria y en correo electrónico.  De lunes a viernes: de 08:00-18:00 h  Correo electrónico: recursosfinancieros@itculiacan.edu.mx"
-                    },
-                    {
-                        "id": "encuesta",
-                        "label": "Encuesta de satisfacción",
-                        "type": "link",
-                        "link": "https://forms.office.com/Pages/ResponsePage.aspx?id=zIGvrnIJG0eM2jeAB5Arr0PeN4x4Ru5LiOfmrDpbOW1UMldMWFQyUDNJQUk2T1VGRk5IRzcyWFlWRy4u"
-                    }
-                ]
-            },
-            {
-                "id": "est_gest",
-                "label": "Gestión Tecnológica y Vinculación",
-                "type": "submenu",
-                "submenu": [
-                    {
-                        "id": "servicio_soc",
-                        "label": "Servicio Social",
-                        "type": "link",
-                        "link": "https://www.facebook.com/people/Servicio-social-ITC/100063981543154/?fref=ts"
-                    },
-                    {
-                        "id": "residencias",
-                        "label": "Residencias Profesionales",
-                        "type": "link",
-                        "link": "https://www.culiacan.tecnm.mx/residencias-profesionales"
-                    },
-                    {
-                        "id": "requisitos",
-                        "label": "Requisitos carta presentación",
-                        "type": "link",
-                        "link": "http://culiacan.tecnm.mx/wp-content/uploads/2016/05/REQUISITOS-CARTA-PRESENTACION-RESIDENCIAS-2016.docx"
-                    },
-                    {
-                        "id": "formatos",
-                        "label": "Descarga de formatos",
-                        "type": "link",
-                        "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2025/06/FORMATOS-RESIDENCIAS.zip"
-                    },
-                    {
-                        "id": "banco_proyectos",
-                        "label": "Banco de proyectos",
-                        "type": "link",
-                        "link": "https://www.culiacan.tecnm.mx/wp-content/uploads/2025/05/BANCO-DE-PROYECTOS-AGOSTO-DICIEMBRE-2025-2.pdf"
-                    }
-                ]
-            }
-        ]
-    },
-    "menu_map": {
-        "id": "menu_map",
-        "type": "image",
-        "label": "Mapa de instalaciones",
-        "image": "/static/images/Mapa.jpg"
-    }
-}
+
+def load_menu_config(path=MENU_FILE):
+    """Lee y parsea el archivo del menú (.json, o .yaml/.yml si PyYAML está instalado)."""
+    with open(path, encoding='utf-8') as f:
+        if path.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise RuntimeError("PyYAML no está instalado; use un menú .json")
+            data = yaml.safe_load(f)
+        else:
+            data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError(f"{path}: el menú debe ser un objeto {{id: nodo}}")
+    return data
@@ -0,0 +1,171 @@
+# menu_index.py
+# Índice precompilado del menú: se construye una sola vez a partir de menu_config
+# para que los handlers resuelvan cualquier opción en O(1) y emitan un payload ya armado.
+import os
+import json
+import hashlib
+import logging
+import time
+
+from menu_search import MenuSearch, MenuAutocomplete
+
+logger = logging.getLogger("build-a-chat.menu")
+
+
+class MenuConfigError(ValueError):
+    """El árbol del menú no es válido (ids duplicados, nodos sin id, etc.)."""
+
+
+def _item_summary(item):
+    return {
+        "id": item["id"],
+        "label": item.get("label", item["id"]),
+        "type": item.get("type", "info"),
+    }
+
+
+def _node_payload(node):
+    """Devuelve (evento, payload) que se emite al seleccionar el nodo."""
+    tipo = node.get("type", "info")
+    label = node.get("label")
+    if tipo == "link":
+        return "show_link", {"label": label, "link": node.get("link")}
+    if tipo == "submenu":
+        submenu = [_item_summary(item) for item in node.get("submenu", [])]
+        return "show_submenu", {"submenu": submenu, "parent_label": label}
+    if tipo == "image":
+        return "show_map", {"image": node.get("image"), "label": label}
+    return "show_info", {"label": label, "text": node.get("text")}
+
+
+class MenuIndex:
+    """
+    Vista plana del árbol del menú.
+      nodes:     { id: nodo original }
+      parents:   { id: id del padre (None en el nivel superior) }
+      payloads:  { id: (evento, payload) listo para emitir }
+      top_level: [ {id, label, type}, ... ] para 'show_menu'
+      version:   hash del contenido del menú
+      bundle_json: árbol compilado serializado para /menu.json (navegación en el cliente)
+      search:    MenuSearch para responder texto libre con el nodo más parecido
+      autocomplete: MenuAutocomplete para las sugerencias mientras se escribe
+    """
+
+    def __init__(self, menu):
+        self.version = menu_version(menu)
+        self.nodes = {}
+        self.parents = {}
+        self.payloads = {}
+        self.top_level = []
+
+        for key, item in menu.items():
+            item = dict(item)
+            item.setdefault("id", key)
+            self._add(item, None)
+            self.top_level.append(_item_summary(item))
+
+        # se serializa una sola vez por versión
+        self.bundle_json = json.dumps({
+            "version": self.version,
+            "menu": self.top_level,
+            "options": {
+                node_id: {"event": event, "payload": payload}
+                for node_id, (event, payload) in self.payloads.items()
+            },
+        }, ensure_ascii=False, separators=(',', ':'))
+        self.search = MenuSearch(self)
+        self.autocomplete = MenuAutocomplete(self, self.search.paths)
+
+    def _add(self, node, parent_id):
+        node_id = node.get("id")
+        if not node_id:
+            raise MenuConfigError(f"Nodo sin 'id' bajo '{parent_id}': {node.get('label')!r}")
+        if node_id in self.nodes:
+            raise MenuConfigError(
+                f"id duplicado en el menú: '{node_id}' "
+                f"(bajo '{self.parents[node_id]}' y '{parent_id}')"
+            )
+        self.nodes[node_id] = node
+        self.parents[node_id] = parent_id
+        self.payloads[node_id] = _node_payload(node)
+        for child in node.get("submenu", []):
+            self._add(child, node_id)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def get(self, option_id):
+        return self.nodes.get(option_id)
+
+    def payload_for(self, option_id):
+        return self.payloads.get(option_id)
+
+
+def menu_version(menu):
+    canonical = json.dumps(menu, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()[:12]
+
+
+def compile_menu(menu):
+    return MenuIndex(menu)
+
+
+class MenuStore:
+    """
+    Mantiene el índice vigente del menú cargado desde un archivo.
+    El archivo se vigila por mtime; al cambiar se parsea e indexa por completo
+    y sólo entonces se reemplaza la referencia, así que un handler que leyó
+    `store.index` siempre ve un árbol completo y consistente.
+    """
+
+    def __init__(self, path, loader):
+        self.path = path
+        self._loader = loader
+        self._mtime = os.stat(path).st_mtime
+        self._failed_mtime = None
+        self._index = compile_menu(loader(path))
+
+    @property
+    def index(self):
+        return self._index
+
+    @property
+    def version(self):
+        return self._index.version
+
+    def reload_if_changed(self):
+        """Recarga el menú si el archivo cambió. Devuelve True si hubo swap."""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError as e:
+            logger.warning("No se pudo leer %s: %s", self.path, e)
+            return False
+        if mtime == self._mtime:
+            return False
+
+        try:
+            new_index = compile_menu(self._loader(self.path))
+        except Exception as e:
+            # un archivo a medio editar o inválido no tumba el menú vigente; el mtime
+            # no se registra para reintentar en la próxima vuelta (el editor puede
+            # terminar de escribir sin cambiar el mtime visible)
+            if mtime != self._failed_mtime:
+                logger.error("Menú inválido en %s, se conserva la versión %s: %s",
+                             self.path, self.version, e)
+                self._failed_mtime = mtime
+            return False
+
+        self._mtime = mtime
+        self._failed_mtime = None
+        if new_index.version == self._index.version:
+            return False
+        old_version = self._index.version
+        self._index = new_index
+        logger.info("Menú recargado: %s -> %s (%d nodos)", old_version, new_index.version, len(new_index))
+        return True
+
+    def watch(self, interval, sleep=time.sleep):
+        """Bucle de vigilancia pensado para correr como background task."""
+        while True:
+            sleep(interval)
+            self.reload_if_changed()
@@ -0,0 +1,309 @@
+# menu_search.py
+# Búsqueda en texto libre sobre el menú compilado: "plan de estudios bioquímica"
+# o "recibos" llegan al nodo correcto sin pasar por "menu".
+#   - tokens sin acentos ni mayúsculas, sin palabras vacías y con un stemming
+#     mínimo de plurales ("recibos" -> "recibo")
+#   - índice invertido con pesos BM25F precalculados: la etiqueta del nodo pesa
+#     más que la ruta de sus ancestros, y ésta más que el texto o el enlace
+#   - typos y palabras a medias: cada término desconocido se expande a los del
+#     vocabulario a distancia de edición 1-2 (diccionario de borrados) o que lo
+#     tienen como prefijo
+# Se construye junto con MenuIndex, así que se rehace en cada recarga del menú.
+import re
+import math
+import unicodedata
+from bisect import bisect_left
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a al ante como con cual cuales de del donde el en es esta este hay la las le lo los me mi mis
+necesito para por que quiero se su sus tu un una uno unos unas y o u ver veo busco sobre
+informacion info dame saber puedo ayuda favor no encuentro enlace link pagina
+""".split())
+
+# BM25F: peso de cada campo del nodo
+FIELD_WEIGHTS = (('label', 3.0), ('path', 1.0), ('text', 0.5), ('link', 0.5))
+K1 = 1.2
+B = 0.75
+
+# penalización de los términos que no coinciden exactamente
+PREFIX_FACTOR = 0.8
+FUZZY_FACTORS = {1: 0.7, 2: 0.45}
+MAX_EXPANSIONS = 4
+
+
+def fold(text):
+    """Minúsculas y sin acentos ("Bioquímica" -> "bioquimica")."""
+    text = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+def stem(token):
+    if len(token) > 5 and token.endswith('ones'):
+        return token[:-2]          # inscripciones -> inscripcion
+    if len(token) > 3 and token.endswith('s'):
+        return token[:-1]          # recibos -> recibo
+    return token
+
+
+def tokenize(text):
+    return [stem(t) for t in TOKEN_RE.findall(fold(text or '')) if t not in STOPWORDS]
+
+
+def _link_words(link):
+    # sólo la ruta del enlace: el dominio se repite en todos los nodos
+    path = re.sub(r'^[a-z]+://[^/]+', '', link or '')
+    return path.replace('-', ' ').replace('_', ' ').replace('/', ' ')
+
+
+def _deletes(term):
+    return {term[:i] + term[i + 1:] for i in range(len(term))}
+
+
+def edit_distance(a, b, limit=2):
+    """Damerau-Levenshtein (transposiciones adyacentes); corta en cuanto supera `limit`."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2, prev = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            cost = ca != cb
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if prev2 is not None and i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        if min(cur) > limit:
+            return limit + 1
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+class MenuSearch:
+    """
+    search(query) -> [(node_id, score), ...] de mayor a menor; best(query) aplica
+    los umbrales para decidir si el texto del alumno se responde con un nodo.
+    """
+
+    def __init__(self, index, min_score=2.0, min_coverage=0.5, tie_ratio=0.95):
+        self.min_score = min_score
+        self.min_coverage = min_coverage
+        self.tie_ratio = tie_ratio
+        self.parents = index.parents
+        self.node_ids = []
+        self.depth = []
+        self.paths = {}              # { id: "Oferta Educativa › Licenciaturas › ..." }
+        self.postings = {}           # { término: [(posición del nodo, peso BM25F), ...] }
+
+        docs = []
+        for node_id, node in index.nodes.items():
+            ancestors = []
+            parent = index.parents.get(node_id)
+            while parent is not None:
+                ancestors.append(index.nodes[parent].get('label') or parent)
+                parent = index.parents.get(parent)
+            label = (node.get('label') or node_id).strip()
+            self.paths[node_id] = ' › '.join([a.strip() for a in reversed(ancestors)] + [label])
+            fields = {
+                'label': tokenize(label),
+                'path': tokenize(' '.join(ancestors)),
+                'text': tokenize(node.get('text')),
+                'link': tokenize(_link_words(node.get('link'))),
+            }
+            tf, length = {}, 0.0
+            for field, weight in FIELD_WEIGHTS:
+                for token in fields[field]:
+                    tf[token] = tf.get(token, 0.0) + weight
+                length += weight * len(fields[field])
+            self.node_ids.append(node_id)
+            self.depth.append(len(ancestors))
+            docs.append((tf, length))
+
+        n = len(docs)
+        avg_length = (sum(length for _, length in docs) / n) if n else 1.0
+        df = {}
+        for tf, _ in docs:
+            for token in tf:
+                df[token] = df.get(token, 0) + 1
+        for pos, (tf, length) in enumerate(docs):
+            norm = K1 * (1 - B + B * length / (avg_length or 1.0))
+            for token, freq in tf.items():
+                idf = math.log(1 + (n - df[token] + 0.5) / (df[token] + 0.5))
+                self.postings.setdefault(token, []).append((pos, idf * freq * (K1 + 1) / (freq + norm)))
+
+        self.vocabulary = sorted(self.postings)
+        self._deleted = {}           # { término o término con un borrado: {términos} }
+        for term in self.vocabulary:
+            for variant in _deletes(term) | {term}:
+                self._deleted.setdefault(variant, set()).add(term)
+        self._expansions = {}        # cache de expand(): el vocabulario no cambia
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def expand(self, token):
+        """[(término del vocabulario, factor)] para un token de la consulta."""
+        if token in self.postings:
+            return [(token, 1.0)]
+        cached = self._expansions.get(token)
+        if cached is not None:
+            return cached
+
+        found = {}
+        if len(token) >= 3:
+            i = bisect_left(self.vocabulary, token)
+            while i < len(self.vocabulary) and self.vocabulary[i].startswith(token):
+                found[self.vocabulary[i]] = PREFIX_FACTOR
+                i += 1
+        if len(token) >= 5:
+            # en palabras cortas un typo convierte "hola" en "hora": no se corrige
+            limit = 1 if len(token) <= 7 else 2
+            candidates = set()
+            for variant in _deletes(token) | {token}:
+                candidates |= self._deleted.get(variant, set())
+            for term in candidates:
+                distance = edit_distance(token, term, limit)
+                if distance <= limit:
+                    found[term] = max(found.get(term, 0.0), FUZZY_FACTORS[distance])
+
+        result = sorted(found.items(), key=lambda kv: -kv[1])[:MAX_EXPANSIONS]
+        if len(self._expansions) < 10000:
+            self._expansions[token] = result
+        return result
+
+    def _score(self, query):
+        """(tokens que existen en el vocabulario, {pos: score}, {pos: tokens que coincidieron})."""
+        known, scores, hits = 0, {}, {}
+        for token in dict.fromkeys(tokenize(query)):
+            expansions = self.expand(token)
+            if expansions:
+                known += 1
+            matched = set()
+            for term, factor in expansions:
+                for pos, weight in self.postings[term]:
+                    scores[pos] = scores.get(pos, 0.0) + weight * factor
+                    matched.add(pos)
+            for pos in matched:
+                hits[pos] = hits.get(pos, 0) + 1
+        return known, scores, hits
+
+    def search(self, query, limit=5):
+        _, scores, _ = self._score(query)
+        # empate: el nodo menos profundo y, después, el primero en el menú
+        ranked = sorted(scores, key=lambda pos: (-scores[pos], self.depth[pos], pos))[:limit]
+        return [(self.node_ids[pos], scores[pos]) for pos in ranked]
+
+    def best(self, query):
+        """
+        id del nodo que responde a `query`, o None si nada se parece lo suficiente.
+        Si varios nodos empatan ("retícula" está en cada carrera) se responde con su
+        ancestro común más cercano, p. ej. el submenú de Licenciaturas.
+        """
+        known, scores, hits = self._score(query)
+        if not scores:
+            return None
+        pos = min(scores, key=lambda p: (-scores[p], self.depth[p], p))
+        # las palabras que el menú no conoce ("hola", "carrera") no cuentan en contra
+        if scores[pos] < self.min_score or hits[pos] < self.min_coverage * known:
+            return None
+        cutoff = scores[pos] * self.tie_ratio
+        tied = [self.node_ids[p] for p, score in scores.items() if score >= cutoff]
+        if len(tied) == 1:
+            return self.node_ids[pos]
+        return self.common_ancestor(tied)
+
+    def common_ancestor(self, node_ids):
+        """Ancestro común más cercano (o el propio nodo si uno contiene a los demás); None en la raíz."""
+        def chain(node_id):
+            out = []
+            while node_id is not None:
+                out.append(node_id)
+                node_id = self.parents.get(node_id)
+            return out[::-1]
+        chains = [chain(n) for n in node_ids]
+        common = None
+        for level in zip(*chains):
+            if any(n != level[0] for n in level):
+                break
+            common = level[0]
+        return common
+
+
+class MenuAutocomplete:
+    """
+    Sugerencias por prefijo mientras el alumno escribe. Cada palabra de cada
+    etiqueta (sin acentos) entra a un arreglo ordenado; una consulta es un bisect
+    por palabra más un recorrido del rango contiguo que comparte el prefijo. Las
+    sugerencias ({id, label, path, type}) se arman una vez al construir y las
+    respuestas se cachean por consulta: el mismo prefijo llega de muchos clientes.
+    """
+
+    def __init__(self, index, paths, cache_size=4096):
+        self.node_ids = []
+        self.depth = []
+        self.suggestions = []        # por posición: dict listo para emitir
+        self._label_words = []       # por posición: palabras de la etiqueta
+        self._path_words = []        # por posición: palabras de los ancestros
+        entries = []
+        for pos, (node_id, node) in enumerate(index.nodes.items()):
+            label = (node.get('label') or node_id).strip()
+            words = tuple(TOKEN_RE.findall(fold(label)))
+            ancestors = paths[node_id].split(' › ')[:-1]
+            self.node_ids.append(node_id)
+            self.depth.append(len(ancestors))
+            self.suggestions.append({"id": node_id, "label": label, "path": paths[node_id],
+                                     "type": node.get("type", "info")})
+            self._label_words.append(words)
+            self._path_words.append(tuple(TOKEN_RE.findall(fold(' '.join(ancestors)))))
+            for i, word in enumerate(words):
+                entries.append((word, i, pos))
+        entries.sort()
+        self._words = [word for word, _, _ in entries]
+        self._entries = [(i, pos) for _, i, pos in entries]
+        self._cache = {}
+        self.cache_size = cache_size
+
+    def _prefix_range(self, prefix):
+        lo = bisect_left(self._words, prefix)
+        hi = bisect_left(self._words, prefix + '\uffff', lo)
+        return lo, hi
+
+    def complete(self, query, limit=8):
+        """Hasta `limit` sugerencias para lo que va escrito; [] si no hay nada útil."""
+        tokens = TOKEN_RE.findall(fold(query or ''))
+        if not tokens:
+            return []
+        key = (' '.join(tokens), limit)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+
+        # candidatos: nodos con alguna palabra de la etiqueta que empiece por algún token
+        ranks = {}
+        for t, token in enumerate(tokens):
+            lo, hi = self._prefix_range(token)
+            for word_index, pos in self._entries[lo:hi]:
+                # la etiqueta que *empieza* por el primer token va antes
+                rank = 0 if (t == 0 and word_index == 0) else 1
+                if rank < ranks.get(pos, 2):
+                    ranks[pos] = rank
+
+        results = []
+        for pos, rank in ranks.items():
+            label_words, path_words = self._label_words[pos], self._path_words[pos]
+            in_label = 0
+            for token in tokens:
+                if any(w.startswith(token) for w in label_words):
+                    in_label += 1
+                elif not any(w.startswith(token) for w in path_words):
+                    break
+            else:
+                # todas las palabras aparecen en la etiqueta o en la ruta
+                results.append((-in_label, rank, self.depth[pos], pos))
+        results.sort()
+        out = [self.suggestions[pos] for _, _, _, pos in results[:limit]]
+
+        if len(self._cache) >= self.cache_size:
+            self._cache.clear()
+        self._cache[key] = out
+        return out
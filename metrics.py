@@ -0,0 +1,203 @@
+# metrics.py
+# Métricas en formato de texto de Prometheus sin dependencias extra. Los
+# histogramas y contadores se actualizan en el camino caliente (un bisect y dos
+# sumas por observación); los gauges se calculan sólo al hacer scrape.
+import time
+import inspect
+import logging
+from bisect import bisect_left
+from functools import wraps
+
+logger = logging.getLogger("build-a-chat.metrics")
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _labels_text(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+class _HistogramSeries:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # el último es +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+
+    def labels(self, *values):
+        series = self._series.get(values)
+        if series is None:
+            series = self._series[values] = _HistogramSeries(self.buckets)
+        return series
+
+    def observe(self, value, *labels):
+        self.labels(*labels).observe(value)
+
+    def render(self):
+        for values, s in sorted(self._series.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), s.counts):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield f"{self.name}_bucket{_labels_text(self.labelnames, values, ('le', le))} {cumulative}"
+            yield f"{self.name}_sum{_labels_text(self.labelnames, values)} {s.sum}"
+            yield f"{self.name}_count{_labels_text(self.labelnames, values)} {s.count}"
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        for values, v in sorted(self._values.items()):
+            yield f"{self.name}{_labels_text(self.labelnames, values)} {v}"
+
+
+class GaugeFunc:
+    """Gauge calculado al hacer scrape: fn() -> número, o {(valores de labels): número}."""
+    kind = 'gauge'
+
+    def __init__(self, name, help, fn, labelnames=()):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+
+    def render(self):
+        try:
+            value = self.fn()
+        except Exception:
+            logger.exception("Error al calcular el gauge %s", self.name)
+            return
+        if value is None:
+            return
+        if isinstance(value, dict):
+            for values, v in sorted(value.items()):
+                if v is not None:
+                    yield f"{self.name}{_labels_text(self.labelnames, values)} {v}"
+        else:
+            yield f"{self.name} {value}"
+
+
+class Registry:
+    def __init__(self, prefix='buildachat_'):
+        self.prefix = prefix
+        self._metrics = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(self.prefix + name, help, labelnames, buckets))
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(self.prefix + name, help, labelnames))
+
+    def gauge(self, name, help, fn, labelnames=()):
+        return self._add(GaugeFunc(self.prefix + name, help, fn, labelnames))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class HandlerMetrics:
+    """Latencia, llamadas y errores por handler de Socket.IO."""
+
+    def __init__(self, registry):
+        self.latency = registry.histogram('socketio_handler_seconds',
+                                          'Duración de los handlers de Socket.IO', ('event',))
+        self.errors = registry.counter('socketio_handler_errors_total',
+                                       'Excepciones en handlers de Socket.IO', ('event',))
+
+    def instrument(self, event):
+        series = self.latency.labels(event)
+        errors = self.errors
+        perf_counter = time.perf_counter
+
+        def decorator(fn):
+            # se recortan los argumentos a los que acepta el handler (p. ej. 'connect'
+            # recibe auth); así Flask-SocketIO no ve un TypeError del wrapper
+            params = inspect.signature(fn).parameters.values()
+            if any(p.kind == p.VAR_POSITIONAL for p in params):
+                arity = None
+            else:
+                arity = sum(1 for p in params if p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD))
+
+            @wraps(fn)
+            def wrapper(*args):
+                start = perf_counter()
+                try:
+                    return fn(*args[:arity]) if arity is not None else fn(*args)
+                except Exception:
+                    errors.inc(event)
+                    raise
+                finally:
+                    series.observe(perf_counter() - start)
+            return wrapper
+        return decorator
+
+
+class LoopMonitor:
+    """
+    Mide el retraso del loop: un greenlet duerme `interval` y compara con el tiempo
+    real transcurrido. Si algo bloquea el hub, el despertar llega tarde (lag) o no
+    llega (stale).
+    """
+
+    def __init__(self, interval=0.5, clock=time.monotonic):
+        self.interval = interval
+        self._clock = clock
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.last_tick = clock()
+
+    def run(self, sleep=time.sleep):
+        while True:
+            start = self._clock()
+            sleep(self.interval)
+            now = self._clock()
+            self.lag = max(0.0, now - start - self.interval)
+            self.max_lag = max(self.max_lag, self.lag)
+            self.last_tick = now
+
+    def stalled_for(self):
+        """Segundos desde el último tick más allá de lo esperado (0 si va al día)."""
+        return max(0.0, self._clock() - self.last_tick - self.interval)
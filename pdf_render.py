@@ -0,0 +1,154 @@
+# pdf_render.py
+# Generación del PDF del resumen. Vive fuera de App.py para poder ejecutarse en un
+# proceso aparte: importar este módulo no arranca la app ni parchea con gevent.
+import io
+from datetime import datetime
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+
+def wrap_text(text, font, size, max_width):
+    """
+    Parte `text` en líneas que caben en `max_width` puntos midiendo el ancho real
+    de la fuente. Corta por palabras; una palabra más ancha que la línea se parte
+    por caracteres.
+    """
+    space = stringWidth(' ', font, size)
+    lines = []
+    for paragraph in text.splitlines():
+        # el ancho de la línea se acumula palabra por palabra en lugar de re-medirla
+        line, width = [], 0.0
+        for word in paragraph.split():
+            word_width = stringWidth(word, font, size)
+            if line and width + space + word_width <= max_width:
+                line.append(word)
+                width += space + word_width
+                continue
+            if line:
+                lines.append(' '.join(line))
+            while word_width > max_width:
+                cut = _fit_chars(word, font, size, max_width)
+                lines.append(word[:cut])
+                word = word[cut:]
+                word_width = stringWidth(word, font, size)
+            line, width = [word], word_width
+        if line:
+            lines.append(' '.join(line))
+    return lines
+
+
+def _fit_chars(word, font, size, max_width):
+    """Cuántos caracteres de `word` caben en `max_width` (búsqueda binaria, mínimo 1)."""
+    lo, hi = 1, len(word)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if stringWidth(word[:mid], font, size) <= max_width:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+class PdfWriter:
+    """Canvas con cursor vertical: escribe líneas y salta de página solo."""
+
+    def __init__(self, fileobj, pagesize=letter, margin=40, bottom=60):
+        self.canvas = canvas.Canvas(fileobj, pagesize=pagesize)
+        self.width, self.height = pagesize
+        self.margin = margin
+        self.bottom = bottom
+        self.y = self.height - margin
+        self.font = ("Helvetica", 10)
+        self.canvas.setFont(*self.font)
+
+    @property
+    def text_width(self):
+        return self.width - 2 * self.margin
+
+    def set_font(self, name, size):
+        self.font = (name, size)
+        self.canvas.setFont(name, size)
+
+    def space(self, points):
+        self.y -= points
+
+    def line(self, text, leading=12, indent=0):
+        self.canvas.drawString(self.margin + indent, self.y, text)
+        self.y -= leading
+        if self.y < self.margin + self.bottom:
+            self.canvas.showPage()
+            self.y = self.height - self.margin
+            self.canvas.setFont(*self.font)
+
+    def paragraph(self, text, leading=12, indent=0):
+        name, size = self.font
+        for line in wrap_text(text, name, size, self.text_width - indent):
+            self.line(line, leading, indent)
+
+    def heading(self, text, size=11, leading=14):
+        self.set_font("Helvetica-Bold", size)
+        self.line(text, leading)
+
+    def save(self):
+        self.canvas.showPage()
+        self.canvas.save()
+
+
+def create_pdf_bytes(title, summary_text, sentiment_result, chat_history, max_messages=100, generated_on=None):
+    # reportlab arma el documento completo en memoria hasta save() y el resultado se
+    # devuelve como bytes: un archivo temporal intermedio no acotaría nada
+    out = io.BytesIO()
+    render_summary_pdf(out, title, summary_text, sentiment_result, chat_history, max_messages, generated_on)
+    return out.getvalue()
+
+
+def render_summary_pdf(out, title, summary_text, sentiment_result, chat_history, max_messages=100,
+                       generated_on=None):
+    """
+    Escribe el PDF en `out`; max_messages=None incluye toda la conversación.
+    `generated_on` es la fecha impresa (por defecto ahora); quien cachea el PDF la
+    fija y la incluye en la llave para no reenviar una fecha vieja.
+    """
+    pdf = PdfWriter(out)
+
+    pdf.heading(title, size=14, leading=24)
+    pdf.set_font("Helvetica", 10)
+    pdf.line(f"Fecha: {generated_on or datetime.now().astimezone().isoformat()}", leading=18)
+
+    message_polarity = {}
+    if isinstance(sentiment_result, dict) and "by_speaker" in sentiment_result:
+        # resultado del motor local: global + por participante (+ por mensaje abajo)
+        message_polarity = sentiment_result.get("messages") or {}
+        pdf.heading("Análisis de polaridad:", leading=16)
+        pdf.set_font("Helvetica", 10)
+        overall = sentiment_result["overall"]
+        pdf.line(f"Global: {overall['label']} ({overall['polarity']:+.2f})", leading=14)
+        for sender, s in sentiment_result["by_speaker"].items():
+            pdf.paragraph(f"{sender}: {s['label']} ({s['polarity']:+.2f}, {s['messages']} mensajes)",
+                          leading=14, indent=10)
+        pdf.space(6)
+    elif sentiment_result:
+        pdf.heading("Análisis de polaridad:", leading=16)
+        pdf.set_font("Helvetica", 10)
+        pdf.paragraph(str(sentiment_result))
+        pdf.space(8)
+
+    pdf.heading("Resumen breve:")
+    pdf.set_font("Helvetica", 10)
+    pdf.paragraph(summary_text or "")
+
+    pdf.space(6)
+    pdf.heading("Conversación (últimos mensajes):" if max_messages else "Conversación:")
+    pdf.set_font("Helvetica", 9)
+
+    messages = chat_history or []
+    if max_messages:
+        messages = messages[-max_messages:]
+    for m in messages:
+        text = f"{m.get('timestamp','')[:19]} {m.get('sender','')}: {m.get('text','')}"
+        if m.get('message_id') in message_polarity:
+            text = f"[{message_polarity[m['message_id']]:+.2f}] {text}"
+        pdf.paragraph(text)
+
+    pdf.save()
@@ -0,0 +1,193 @@
+# profiling.py
+# Visibilidad de qué está ocupando el loop de gevent:
+#   - Tracer: spans por handler de socket y por llamada saliente (evento, user_id),
+#     con la pila de spans activa por greenlet para atribuir bloqueos.
+#   - BlockingMonitor: el hilo monitor de gevent detecta cuando un greenlet retiene
+#     el hub más de `threshold` segundos; se guarda la pila y el span en curso.
+#   - SamplingProfiler: muestreo bajo demanda desde un hilo nativo; devuelve pilas
+#     colapsadas ("a;b;c 42"), el formato que aceptan flamegraph.pl y speedscope.
+import sys
+import time
+import logging
+from collections import Counter, deque
+from contextlib import contextmanager
+from functools import wraps
+from weakref import WeakKeyDictionary
+
+from greenlet import getcurrent
+
+logger = logging.getLogger("build-a-chat.profiling")
+
+
+class Span:
+    __slots__ = ('name', 'tags', 'start', 'duration', 'parent')
+
+    def __init__(self, name, tags, parent):
+        self.name = name
+        self.tags = tags
+        self.parent = parent
+        self.start = time.time()
+        self.duration = None
+
+    def as_dict(self):
+        return {"name": self.name, "tags": self.tags, "start": self.start,
+                "duration": self.duration, "parent": self.parent}
+
+
+class Tracer:
+    def __init__(self, keep=1000, slow_threshold=0.5):
+        self.slow_threshold = slow_threshold
+        self.finished = deque(maxlen=keep)   # spans recientes (ring buffer)
+        self._active = WeakKeyDictionary()   # { greenlet: [Span, ...] }
+
+    def current(self, glet=None):
+        """Span más interno activo en `glet` (por defecto, el greenlet actual)."""
+        stack = self._active.get(glet or getcurrent())
+        return stack[-1] if stack else None
+
+    @contextmanager
+    def span(self, name, **tags):
+        glet = getcurrent()
+        stack = self._active.get(glet)
+        if stack is None:
+            stack = self._active[glet] = []
+        span = Span(name, tags, stack[-1].name if stack else None)
+        stack.append(span)
+        start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span.duration = time.perf_counter() - start
+            stack.pop()
+            self.finished.append(span)
+            if span.duration >= self.slow_threshold:
+                logger.warning("Span lento %s %.3fs %s", name, span.duration, tags)
+
+    def instrument(self, name, tags=lambda: {}):
+        """Decorador: cada llamada corre dentro de un span; `tags()` se evalúa al entrar."""
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(name, **tags()):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def slowest(self, limit=20):
+        return [s.as_dict() for s in sorted(self.finished, key=lambda s: s.duration, reverse=True)[:limit]]
+
+
+class BlockingMonitor:
+    """Registra los bloqueos del hub que detecta el hilo monitor de gevent."""
+
+    def __init__(self, tracer=None, threshold=0.1, keep=50):
+        self.tracer = tracer
+        self.threshold = threshold
+        self.events = deque(maxlen=keep)
+
+    def install(self):
+        import gevent
+        import zope.event
+        from gevent.events import EventLoopBlocked
+
+        gevent.config.max_blocking_time = self.threshold
+        gevent.config.print_blocking_reports = False
+        gevent.config.monitor_thread = True
+
+        def on_event(event):
+            if isinstance(event, EventLoopBlocked):
+                self._record(event)
+        zope.event.subscribers.append(on_event)
+        # el hilo monitor se apaga solo si al despertar el hub todavía no corre (p. ej. un
+        # import lento); se arranca desde el loop para que el hub ya esté activo
+        hub = gevent.get_hub()
+        hub.loop.run_callback(hub.start_periodic_monitoring_thread)
+
+    def _record(self, event):
+        # corre en el hilo monitor mientras el greenlet sigue bloqueando
+        span = self.tracer.current(event.greenlet) if self.tracer else None
+        entry = {
+            "time": time.time(),
+            "blocking_time": event.blocking_time,
+            "greenlet": repr(event.greenlet),
+            "span": span.as_dict() if span else None,
+            "report": list(event.info),
+        }
+        self.events.append(entry)
+        logger.warning("Loop bloqueado >%.3fs por %s (span %s)", event.blocking_time,
+                       entry["greenlet"], span.name if span else None)
+
+    def recent(self):
+        return list(self.events)
+
+
+def _original(module, name):
+    # con gevent parcheado el muestreo necesita un hilo y un sleep nativos
+    try:
+        from gevent.monkey import get_original
+        return get_original(module, name)
+    except ImportError:
+        return getattr(__import__(module), name)
+
+
+def collapse_frame(frame):
+    """Pila de `frame` en formato colapsado (raíz primero)."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        module = frame.f_globals.get('__name__', '?')
+        names.append(f"{module}:{code.co_name}")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class ProfilerBusy(RuntimeError):
+    pass
+
+
+class SamplingProfiler:
+    """
+    Muestrea la pila del hilo principal (donde corren todos los greenlets) desde un
+    hilo nativo; como no depende del hub, también captura los bloqueos del loop.
+    """
+
+    def __init__(self, thread_ident=None):
+        # threading.get_ident parcheado devolvería el id del greenlet, no el del hilo
+        self.thread_ident = thread_ident or _original('_thread', 'get_ident')()
+        self._running = False
+
+    def profile(self, seconds, hz=97, wait=time.sleep):
+        """Bloquea (cooperativamente, vía `wait`) hasta terminar; devuelve Counter{pila: muestras}."""
+        if self._running:
+            raise ProfilerBusy("Ya hay un perfil en curso")
+        self._running = True
+        result = {}
+        start_thread = _original('_thread', 'start_new_thread')
+        native_sleep = _original('time', 'sleep')
+
+        def sample():
+            samples = Counter()
+            interval = 1.0 / hz
+            deadline = time.monotonic() + seconds
+            try:
+                while time.monotonic() < deadline:
+                    frame = sys._current_frames().get(self.thread_ident)
+                    if frame is not None:
+                        samples[collapse_frame(frame)] += 1
+                    native_sleep(interval)
+            finally:
+                result['samples'] = samples
+                self._running = False
+
+        try:
+            start_thread(sample, ())
+        except Exception:
+            self._running = False
+            raise
+        while 'samples' not in result:
+            wait(0.1)
+        return result['samples']
+
+    @staticmethod
+    def collapsed(samples):
+        return ''.join(f"{stack} {count}\n" for stack, count in samples.most_common())
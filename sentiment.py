@@ -0,0 +1,131 @@
+# sentiment.py
+# Motor de polaridad local (scikit-learn). Se carga una sola vez por proceso y
+# puntúa la conversación completa en un solo lote vectorizado: polaridad por
+# mensaje, por participante y global, en [-1, 1] (p(positivo) - p(negativo)).
+#
+# No se entrena nada al arrancar: SENTIMENT_MODEL_PATH apunta a un artefacto
+# joblib que genera train_sentiment.py junto con su evaluación (validación
+# cruzada sobre el corpus etiquetado).
+import time
+import logging
+
+import numpy as np
+
+logger = logging.getLogger("build-a-chat.sentiment")
+
+POSITIVE_THRESHOLD = 0.25
+NEGATIVE_THRESHOLD = -0.25
+LABELS = {'positivo': 1, 'neutral': 0, 'negativo': -1}
+ARTIFACT_FORMAT = 1
+
+
+def polarity_label(score):
+    if score >= POSITIVE_THRESHOLD:
+        return 'positivo'
+    if score <= NEGATIVE_THRESHOLD:
+        return 'negativo'
+    return 'neutral'
+
+
+def build_pipeline():
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+
+    # n-gramas de caracteres: toleran faltas de ortografía y conjugaciones
+    return make_pipeline(
+        TfidfVectorizer(analyzer='char_wb', ngram_range=(2, 4), strip_accents='unicode',
+                        lowercase=True, sublinear_tf=True),
+        LogisticRegression(C=4.0, max_iter=1000, class_weight='balanced'),
+    )
+
+
+def evaluate(texts, labels, folds=5, seed=0):
+    """Validación cruzada estratificada: accuracy, F1 macro, F1 por clase y matriz de confusión."""
+    from sklearn.metrics import accuracy_score, confusion_matrix, f1_score
+    from sklearn.model_selection import StratifiedKFold, cross_val_predict
+
+    classes = sorted(set(labels))
+    cv = StratifiedKFold(n_splits=folds, shuffle=True, random_state=seed)
+    predicted = cross_val_predict(build_pipeline(), list(texts), list(labels), cv=cv)
+    per_class = f1_score(labels, predicted, labels=classes, average=None)
+    return {
+        "samples": len(labels),
+        "folds": folds,
+        "accuracy": round(float(accuracy_score(labels, predicted)), 4),
+        "macro_f1": round(float(f1_score(labels, predicted, average='macro')), 4),
+        "f1_by_class": {int(c): round(float(f), 4) for c, f in zip(classes, per_class)},
+        "confusion": {"labels": [int(c) for c in classes],
+                      "matrix": confusion_matrix(labels, predicted, labels=classes).tolist()},
+    }
+
+
+def train_artifact(texts, labels, folds=5):
+    """Evalúa con validación cruzada y entrena el modelo final con todo el corpus."""
+    metrics = evaluate(texts, labels, folds)
+    pipeline = build_pipeline()
+    pipeline.fit(list(texts), list(labels))
+    return {"format": ARTIFACT_FORMAT, "pipeline": pipeline, "metrics": metrics,
+            "trained_at": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())}
+
+
+class LocalSentiment:
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        classes = list(pipeline.classes_)
+        self._pos = classes.index(1)
+        self._neg = classes.index(-1)
+        self.metrics = None
+
+    @classmethod
+    def load(cls, model_path):
+        """Carga el artefacto de train_sentiment.py (o un pipeline joblib suelto)."""
+        if not model_path:
+            raise ValueError("SENTIMENT_MODEL_PATH es obligatorio con el backend local")
+        import joblib
+        artifact = joblib.load(model_path)
+        if isinstance(artifact, dict):
+            engine = cls(artifact['pipeline'])
+            engine.metrics = artifact.get('metrics')
+            logger.info("Modelo de polaridad %s (entrenado %s): %s", model_path,
+                        artifact.get('trained_at'), engine.metrics)
+        else:
+            engine = cls(artifact)
+            logger.warning("Modelo de polaridad %s sin métricas de evaluación", model_path)
+        return engine
+
+    def score(self, texts):
+        """Polaridad de cada texto en un solo predict_proba (ndarray en [-1, 1])."""
+        if not texts:
+            return np.zeros(0)
+        proba = self.pipeline.predict_proba(texts)
+        return proba[:, self._pos] - proba[:, self._neg]
+
+    def analyze_conversation(self, messages):
+        """
+        {"engine", "overall": {polarity, label}, "by_speaker": {sender: {polarity, label, messages}},
+         "messages": {message_id: polarity}}; None si no hay mensajes de texto.
+        """
+        scored = [m for m in messages if (m.get('text') or '').strip()]
+        if not scored:
+            return None
+        scores = self.score([m['text'] for m in scored])
+
+        speakers, speaker_idx = np.unique([m.get('sender') or '' for m in scored], return_inverse=True)
+        counts = np.bincount(speaker_idx)
+        means = np.bincount(speaker_idx, weights=scores) / counts
+
+        overall = float(scores.mean())
+        return {
+            "engine": "local",
+            "overall": {"polarity": round(overall, 3), "label": polarity_label(overall)},
+            "by_speaker": {
+                str(sender): {"polarity": round(float(mean), 3), "label": polarity_label(mean),
+                              "messages": int(n)}
+                for sender, mean, n in zip(speakers, means, counts)
+            },
+            "messages": {
+                m.get('message_id'): round(float(s), 3)
+                for m, s in zip(scored, scores) if m.get('message_id')
+            },
+        }
@@ -0,0 +1,213 @@
+# sessions.py
+# Sesiones reanudables del alumno. La conversación ya no muere con el socket:
+# register_name emite un token firmado (HMAC del user_id) que el cliente guarda y
+# manda en el handshake de cada reconexión; el servidor vuelve a asociar el socket
+# nuevo con la conversación y sólo le envía los mensajes posteriores al último
+# message_id que vio. Una sesión sin sockets expira tras `idle_ttl` segundos; las
+# expiraciones se llevan en una rueda de temporizadores (agendar y cancelar en
+# O(1), un tick revisa sólo su casilla).
+#
+# Con varios workers la rueda es local: el alumno puede reconectarse a otro
+# worker mientras éste espera su TTL. Por eso cada attach/detach se anota en el
+# estado compartido (`shared`, ver state_backend) y, al vencer, la conversación
+# sólo se libera si nadie tiene sockets y nadie la tocó desde este detach.
+import hmac
+import time
+import hashlib
+import logging
+import secrets
+
+logger = logging.getLogger("build-a-chat.sessions")
+
+
+class TimerWheel:
+    """
+    Rueda de temporizadores con `slots` casillas de `tick` segundos. Cada llave vive
+    en la casilla de su vencimiento; los plazos mayores que una vuelta se quedan en
+    su casilla hasta la vuelta que les toca. Cancelar o reagendar sólo cambia el
+    vencimiento registrado: la entrada vieja se descarta al pasar por su casilla.
+    """
+
+    def __init__(self, tick=1.0, slots=512, clock=time.monotonic):
+        self.tick = tick
+        self._slots = [set() for _ in range(slots)]
+        self._deadlines = {}     # { llave: vencimiento }
+        self._clock = clock
+        self._cursor = int(clock() / tick)
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def _slot(self, deadline):
+        return int(deadline / self.tick) % len(self._slots)
+
+    def schedule(self, key, delay):
+        deadline = self._clock() + delay
+        self._deadlines[key] = deadline
+        self._slots[self._slot(deadline)].add(key)
+        return deadline
+
+    def cancel(self, key):
+        return self._deadlines.pop(key, None) is not None
+
+    def advance(self):
+        """Llaves vencidas desde la última llamada."""
+        now = self._clock()
+        target = int(now / self.tick)
+        expired = []
+        # tras una pausa larga basta una vuelta completa para revisar todas las casillas
+        start = max(self._cursor, target - len(self._slots) + 1)
+        for t in range(start, target + 1):
+            index = t % len(self._slots)
+            slot = self._slots[index]
+            for key in list(slot):
+                deadline = self._deadlines.get(key)
+                if deadline is None or self._slot(deadline) != index:
+                    slot.discard(key)            # cancelada o reagendada
+                elif deadline <= now:
+                    slot.discard(key)
+                    del self._deadlines[key]
+                    expired.append(key)
+        self._cursor = target
+        return expired
+
+
+class Session:
+    __slots__ = ('user_id', 'name', 'sockets', 'created', 'last_seen', 'marker')
+
+    def __init__(self, user_id, name, now):
+        self.user_id = user_id
+        self.name = name
+        self.sockets = set()
+        self.created = now
+        self.last_seen = now
+        self.marker = None     # token del último detach anotado en el estado compartido
+
+
+class SessionRegistry:
+    """
+    on_expire(user_id) libera la conversación (estado, presencia en el admin).
+    Con `secret` fijo (SESSION_SECRET) los tokens siguen siendo válidos tras un
+    reinicio; la sesión se reconstruye si el estado compartido (Redis) aún conoce
+    al usuario, ver resume(). `shared` (InMemoryState/RedisState) lleva el marcador
+    de sesión entre workers; `owner` identifica a este worker en él.
+    """
+
+    def __init__(self, secret=None, idle_ttl=300.0, on_expire=lambda user_id: None, tick=1.0,
+                 clock=time.monotonic, shared=None, owner=None):
+        self._secret = (secret or secrets.token_hex(32)).encode('utf-8')
+        self.idle_ttl = idle_ttl
+        self._on_expire = on_expire
+        self._clock = clock
+        self._shared = shared
+        self.owner = owner or secrets.token_hex(8)
+        self._sessions = {}      # { user_id: Session }
+        self._by_sid = {}        # { sid: user_id }
+        self._wheel = TimerWheel(tick, max(16, int(idle_ttl / tick) + 2), clock)
+
+    # --- tokens ---
+    def _sign(self, user_id):
+        return hmac.new(self._secret, user_id.encode('utf-8'), hashlib.sha256).hexdigest()[:32]
+
+    def token_for(self, user_id):
+        return f"{user_id}.{self._sign(user_id)}"
+
+    def verify(self, token):
+        """user_id del token si la firma es válida; None si no."""
+        if not isinstance(token, str):
+            return None
+        user_id, _, signature = token.rpartition('.')
+        if not user_id or not hmac.compare_digest(signature, self._sign(user_id)):
+            return None
+        return user_id
+
+    # --- sesiones ---
+    def get(self, user_id):
+        return self._sessions.get(user_id)
+
+    def user_for(self, sid):
+        """Conversación del socket; un socket sin sesión usa su propio sid."""
+        return self._by_sid.get(sid, sid)
+
+    def open(self, sid, name):
+        """Crea (o renombra) la sesión del socket; devuelve (session, token)."""
+        user_id = self._by_sid.get(sid)
+        session = self._sessions.get(user_id) if user_id else None
+        if session is None:
+            session = Session(sid, name, self._clock())
+            self._sessions[sid] = session
+            self.attach(sid, session)
+        session.name = name
+        return session, self.token_for(session.user_id)
+
+    def resume(self, sid, token, known_name=lambda user_id: None):
+        """
+        Asocia el socket con la sesión del token. Si la sesión ya no está en memoria
+        (reinicio, otro worker) pero `known_name(user_id)` la reconoce, se reconstruye.
+        Devuelve la sesión o None (token inválido o sesión expirada).
+        """
+        user_id = self.verify(token)
+        if user_id is None:
+            return None
+        session = self._sessions.get(user_id)
+        if session is None:
+            name = known_name(user_id)
+            if name is None:
+                return None
+            session = self._sessions[user_id] = Session(user_id, name, self._clock())
+        self.attach(sid, session)
+        return session
+
+    def attach(self, sid, session):
+        self._by_sid[sid] = session.user_id
+        session.sockets.add(sid)
+        session.last_seen = self._clock()
+        self._wheel.cancel(session.user_id)
+        if self._shared is not None:
+            self._shared.session_attached(session.user_id, self.owner)
+
+    def detach(self, sid):
+        """
+        Suelta el socket. Si era el último de su sesión se agenda la expiración y se
+        devuelve la sesión; None si el socket no tenía sesión o quedan otros.
+        """
+        user_id = self._by_sid.pop(sid, None)
+        session = self._sessions.get(user_id) if user_id else None
+        if session is None:
+            return None
+        session.sockets.discard(sid)
+        session.last_seen = self._clock()
+        if self._shared is not None:
+            session.marker = self._shared.session_detached(user_id, self.owner)
+        if session.sockets:
+            return None
+        self._wheel.schedule(user_id, self.idle_ttl)
+        return session
+
+    def expire_due(self):
+        expired = []
+        for user_id in self._wheel.advance():
+            session = self._sessions.get(user_id)
+            if session is None or session.sockets:
+                continue  # se reconectó justo a tiempo
+            del self._sessions[user_id]
+            if self._shared is not None and not self._shared.session_release(user_id, session.marker):
+                # otro worker la retomó (o aún tiene sockets): sólo se suelta la copia local
+                logger.info("Sesión %s retomada en otro worker; no se libera", user_id)
+                continue
+            expired.append(user_id)
+            try:
+                self._on_expire(user_id)
+            except Exception:
+                logger.exception("Error al expirar la sesión %s", user_id)
+        return expired
+
+    def run(self, sleep=time.sleep):
+        while True:
+            sleep(self._wheel.tick)
+            self.expire_due()
+
+    def stats(self):
+        connected = sum(1 for s in self._sessions.values() if s.sockets)
+        return {"sessions": len(self._sessions), "connected": connected,
+                "idle": len(self._sessions) - connected, "sockets": len(self._by_sid)}
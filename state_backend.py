@@ -0,0 +1,288 @@
+# state_backend.py
+# Estado compartido del chat (historiales y clientes conectados).
+# InMemoryState es el default (un solo worker); RedisState permite correr
+# varios workers/nodos compartiendo el mismo estado.
+#
+# Marcador de sesión: cada worker que asocia o suelta un socket de una sesión lo
+# registra (sockets vivos por worker + un token del último cambio). Al vencer el
+# TTL de inactividad, sólo el worker que hizo el último detach, y sin sockets
+# vivos en ningún worker, libera la conversación (ver sessions.SessionRegistry).
+import json
+import uuid
+from collections import Counter, OrderedDict, deque
+
+# Límites por defecto: el resumen usa los últimos 200 mensajes y el PDF los últimos 100,
+# así que no tiene sentido guardar más que eso por conversación.
+DEFAULT_MAX_MESSAGES = 200
+DEFAULT_MAX_BYTES = 256 * 1024            # por conversación
+DEFAULT_MEMORY_BUDGET = 64 * 1024 * 1024  # total del proceso
+
+
+def message_size(msg):
+    """Tamaño aproximado en bytes de un mensaje (suficiente para contabilizar memoria)."""
+    return sum(len(k) + len(str(v)) for k, v in msg.items())
+
+
+class _Conversation:
+    __slots__ = ('messages', 'bytes')
+
+    def __init__(self, max_messages):
+        self.messages = deque(maxlen=max_messages)  # ring buffer de (mensaje, bytes)
+        self.bytes = 0
+
+
+class InMemoryState:
+    """
+    Estado local al proceso. Cada conversación es un ring buffer acotado por
+    número de mensajes y por bytes; además hay un presupuesto global que,
+    al excederse, descarta primero las conversaciones inactivas más antiguas.
+    """
+
+    def __init__(self, max_messages=DEFAULT_MAX_MESSAGES, max_bytes=DEFAULT_MAX_BYTES,
+                 memory_budget=DEFAULT_MEMORY_BUDGET):
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.memory_budget = memory_budget
+        self._chats = OrderedDict()  # { user_id: _Conversation }, de menos a más reciente
+        self._clients = {}           # { user_id: { "name": str } }
+        self._markers = {}           # { user_id: (Counter {worker: sockets}, token del último cambio) }
+        self._total_bytes = 0
+        self._evicted_conversations = 0
+        self._dropped_messages = 0
+
+    # --- clientes ---
+    def get_client(self, user_id):
+        return self._clients.get(user_id)
+
+    def set_client(self, user_id, info):
+        self._clients[user_id] = info
+
+    def remove_client(self, user_id):
+        self._clients.pop(user_id, None)
+
+    def list_clients(self):
+        return list(self._clients.items())
+
+    # --- marcadores de sesión ---
+    def session_attached(self, user_id, owner):
+        return self._mark(user_id, owner, 1)
+
+    def session_detached(self, user_id, owner):
+        return self._mark(user_id, owner, -1)
+
+    def _mark(self, user_id, owner, delta):
+        sockets, _ = self._markers.get(user_id, (Counter(), None))
+        sockets[owner] += delta
+        token = uuid.uuid4().hex
+        self._markers[user_id] = (sockets, token)
+        return token
+
+    def session_release(self, user_id, token):
+        """True (y borra el marcador) si nadie tiene sockets y el último cambio fue `token`."""
+        sockets, last = self._markers.get(user_id, (Counter(), None))
+        if last != token or any(n > 0 for n in sockets.values()):
+            return False
+        self._markers.pop(user_id, None)
+        return True
+
+    # --- historiales ---
+    def append_messages(self, user_id, *messages):
+        conv = self._chats.get(user_id)
+        if conv is None:
+            conv = self._chats[user_id] = _Conversation(self.max_messages)
+        else:
+            self._chats.move_to_end(user_id)
+
+        for msg in messages:
+            if len(conv.messages) == conv.messages.maxlen:
+                self._discard_oldest(conv)
+            size = message_size(msg)
+            conv.messages.append((msg, size))
+            conv.bytes += size
+            self._total_bytes += size
+
+        while conv.bytes > self.max_bytes and len(conv.messages) > 1:
+            self._discard_oldest(conv)
+
+        if self._total_bytes > self.memory_budget:
+            self._evict_idle(keep=user_id)
+
+    def _discard_oldest(self, conv):
+        _, size = conv.messages.popleft()
+        conv.bytes -= size
+        self._total_bytes -= size
+        self._dropped_messages += 1
+
+    def _evict_idle(self, keep):
+        for uid in list(self._chats):
+            if self._total_bytes <= self.memory_budget:
+                break
+            if uid == keep:
+                continue
+            self._total_bytes -= self._chats.pop(uid).bytes
+            self._evicted_conversations += 1
+
+    def get_history(self, user_id):
+        conv = self._chats.get(user_id)
+        return [msg for msg, _ in conv.messages] if conv else []
+
+    def drop_chat(self, user_id):
+        conv = self._chats.pop(user_id, None)
+        if conv:
+            self._total_bytes -= conv.bytes
+
+    def usage(self):
+        return {
+            "backend": "memory",
+            "clients": len(self._clients),
+            "conversations": len(self._chats),
+            "messages": sum(len(c.messages) for c in self._chats.values()),
+            "bytes": self._total_bytes,
+            "memory_budget": self.memory_budget,
+            "max_messages": self.max_messages,
+            "max_bytes": self.max_bytes,
+            "evicted_conversations": self._evicted_conversations,
+            "dropped_messages": self._dropped_messages,
+        }
+
+
+class RedisState:
+    """
+    Estado en Redis (o cualquier servidor compatible). Recibe un cliente con la
+    API de redis-py, así que en pruebas puede usarse un sustituto local
+    como fakeredis.FakeRedis().
+    """
+
+    def __init__(self, client, prefix='bac:', max_messages=DEFAULT_MAX_MESSAGES):
+        self._r = client
+        self.max_messages = max_messages
+        self._prefix = prefix
+        self._clients_key = f'{prefix}clients'
+
+    def _chat_key(self, user_id):
+        return f'{self._prefix}chat:{user_id}'
+
+    def _session_key(self, user_id):
+        return f'{self._prefix}session:{user_id}'
+
+    # --- clientes ---
+    def get_client(self, user_id):
+        raw = self._r.hget(self._clients_key, user_id)
+        return json.loads(raw) if raw else None
+
+    def set_client(self, user_id, info):
+        self._r.hset(self._clients_key, user_id, json.dumps(info))
+
+    def remove_client(self, user_id):
+        self._r.hdel(self._clients_key, user_id)
+
+    def list_clients(self):
+        items = self._r.hgetall(self._clients_key).items()
+        return [(_as_str(uid), json.loads(raw)) for uid, raw in items]
+
+    # --- marcadores de sesión ---
+    def session_attached(self, user_id, owner):
+        return self._mark(user_id, owner, 1)
+
+    def session_detached(self, user_id, owner):
+        return self._mark(user_id, owner, -1)
+
+    def _mark(self, user_id, owner, delta):
+        token = uuid.uuid4().hex
+        pipe = self._r.pipeline()
+        pipe.hincrby(self._session_key(user_id), f'w:{owner}', delta)
+        pipe.hset(self._session_key(user_id), 'last', token)
+        pipe.execute()
+        return token
+
+    def session_release(self, user_id, token):
+        """
+        True (y borra el marcador) si nadie tiene sockets y el último cambio fue `token`.
+        WATCH: si otro worker toca el marcador entre la lectura y el borrado, no se libera.
+        """
+        from redis.exceptions import WatchError
+
+        key = self._session_key(user_id)
+        with self._r.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                marker = {_as_str(k): _as_str(v) for k, v in pipe.hgetall(key).items()}
+                sockets = [int(v) for k, v in marker.items() if k.startswith('w:')]
+                if marker.get('last') != token or any(n > 0 for n in sockets):
+                    pipe.unwatch()
+                    return False
+                pipe.multi()
+                pipe.delete(key)
+                pipe.execute()
+                return True
+            except WatchError:
+                return False
+
+    # --- historiales ---
+    def append_messages(self, user_id, *messages):
+        if messages:
+            key = self._chat_key(user_id)
+            pipe = self._r.pipeline()
+            pipe.rpush(key, *[json.dumps(m) for m in messages])
+            pipe.ltrim(key, -self.max_messages, -1)
+            pipe.execute()
+
+    def get_history(self, user_id):
+        return [json.loads(raw) for raw in self._r.lrange(self._chat_key(user_id), 0, -1)]
+
+    def drop_chat(self, user_id):
+        self._r.delete(self._chat_key(user_id))
+
+    def usage(self):
+        # la memoria la administra Redis (maxmemory); aquí sólo se reporta
+        return {
+            "backend": "redis",
+            "clients": self._r.hlen(self._clients_key),
+            "max_messages": self.max_messages,
+            "used_memory": self._r.info('memory').get('used_memory'),
+        }
+
+
+def page_history(history, before=None, since=None, limit=50):
+    """
+    Pagina un historial ordenado usando message_id como cursor.
+      before: los `limit` mensajes anteriores a ese id (para 'load_older')
+      since:  todos los mensajes posteriores a ese id (resync al reconectar)
+      sin cursor: los últimos `limit` mensajes
+    Si el cursor ya no existe (mensaje descartado) se devuelve la última página con reset=True.
+    Los dos cursores a la vez no tienen sentido: ValueError.
+    """
+    if before and since:
+        raise ValueError("page_history: 'before' y 'since' son excluyentes")
+    cursor = before or since
+    pos = None
+    if cursor:
+        for i in range(len(history) - 1, -1, -1):
+            if history[i].get("message_id") == cursor:
+                pos = i
+                break
+
+    if cursor and pos is None:
+        start = max(0, len(history) - limit)
+        return {"messages": history[start:], "has_more": start > 0, "reset": True}
+    if since:
+        return {"messages": history[pos + 1:], "has_more": False, "reset": False}
+    end = pos if before else len(history)
+    start = max(0, end - limit)
+    return {"messages": history[start:end], "has_more": start > 0, "reset": False}
+
+
+def _as_str(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+def make_state_backend(redis_url=None, max_messages=DEFAULT_MAX_MESSAGES,
+                       max_bytes=DEFAULT_MAX_BYTES, memory_budget=DEFAULT_MEMORY_BUDGET):
+    """Sin REDIS_URL se usa el estado en memoria del proceso."""
+    if not redis_url:
+        return InMemoryState(max_messages, max_bytes, memory_budget)
+    try:
+        import redis
+    except ImportError:
+        raise RuntimeError("REDIS_URL configurada pero el paquete 'redis' no está instalado")
+    return RedisState(redis.Redis.from_url(redis_url), max_messages=max_messages)
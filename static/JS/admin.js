@@ -1,4 +1,9 @@
-const socket = io();
+// con ADMIN_TOKEN en el servidor, el panel se autentica en el handshake de cada (re)conexión
+let adminToken = sessionStorage.getItem('admin_token');
+const socket = io({
+    transports: window.SOCKET_TRANSPORTS,
+    auth: (cb) => cb(adminToken ? { admin_token: adminToken } : {})
+});
 
 // DOM
 const chatListEl = document.getElementById('chat-list');
@@ -11,6 +16,7 @@ const sendBtn = document.getElementById('send-admin');
 // Estado
 let currentUserId = null;
 const chats = {}; // { userId: [msgObj, ...] }
+const hasOlder = {}; // { userId: bool } quedan páginas anteriores en el servidor
 // msgObj: { text, timestamp, sender, audio_url? }
 
 // -----------------------------
@@ -22,59 +28,133 @@ socket.on('connect', () => {
     socket.emit('admin_join');
 });
 
+function askAdminToken(message) {
+    adminToken = window.prompt(message);
+    if (adminToken) sessionStorage.setItem('admin_token', adminToken);
+    else sessionStorage.removeItem('admin_token');
+    if (adminToken) socket.disconnect().connect();
+}
+
+socket.on('admin_auth_required', () => askAdminToken('Token de administrador:'));
+
+socket.on('connect_error', (err) => {
+    if (err && err.message === 'admin no autorizado') askAdminToken('Token inválido. Token de administrador:');
+});
+
 // -----------------------------
-// Actualizar lista de clientes
-// El servidor envía 'update_chat_list' como lista: [{user_id, name}, ...]
+// Lista de clientes
+// Al unirse, el servidor manda 'chat_list_snapshot' {origin, seq, clients: [{user_id, name}]}
+// y después sólo 'chat_list_delta' {origin, seq, added, renamed, removed}.
+// Si falta un seq de algún worker (origin) se pide un snapshot nuevo.
 // -----------------------------
-socket.on('update_chat_list', (clientes) => {
-    chatListEl.innerHTML = '';
+const chatItems = new Map(); // { userId: <button> }
+const lastSeqByOrigin = {};
+let snapshotRequested = false;
+
+function createChatItem(id, name) {
+    const item = document.createElement('button');
+    item.className = 'chat-button';
+    item.dataset.userId = id;
+    item.style.display = 'block';
+    item.style.width = '100%';
+    item.style.textAlign = 'left';
+    item.style.padding = '10px';
+    item.style.marginBottom = '8px';
+    item.style.borderRadius = '6px';
+    item.style.border = '1px solid #ccc';
+    item.style.background = (currentUserId === id) ? '#e6f0ff' : '#fff';
+    fillChatItem(item, id, name);
+    item.addEventListener('click', () => {
+        selectChat(id, item.dataset.name);
+    });
+    return item;
+}
+
+function fillChatItem(item, id, name) {
+    item.dataset.name = name;
 
-    if (!clientes || clientes.length === 0) {
-        const p = document.createElement('p');
-        p.textContent = 'No hay clientes conectados';
-        p.style.padding = '10px';
-        chatListEl.appendChild(p);
+    // mostrar nombre + id corto
+    const shortId = id.length > 10 ? id.slice(0, 8) + '...' : id;
+    item.innerHTML = `<strong>${escapeHtml(name)}</strong><br><small>ID: ${shortId}</small>`;
+
+    // marca de nuevo mensaje
+    if (chats[id] && chats[id].some(m => m._unread)) {
+        const badge = document.createElement('span');
+        badge.textContent = ' • Nuevo';
+        badge.style.color = '#d9534f';
+        badge.style.marginLeft = '6px';
+        item.querySelector('strong').after(badge);
+    }
+}
+
+function upsertChatItem(cl) {
+    const id = cl.user_id;
+    const name = cl.name || 'Invitado';
+    const existing = chatItems.get(id);
+    if (existing) {
+        fillChatItem(existing, id, name);
         return;
     }
+    const item = createChatItem(id, name);
+    chatItems.set(id, item);
+    chatListEl.appendChild(item);
+}
 
-    clientes.forEach(cl => {
-        const id = cl.user_id;
-        const name = cl.name || 'Invitado';
-
-        // crear elemento
-        const item = document.createElement('button');
-        item.className = 'chat-button';
-        item.dataset.userId = id;
-        item.style.display = 'block';
-        item.style.width = '100%';
-        item.style.textAlign = 'left';
-        item.style.padding = '10px';
-        item.style.marginBottom = '8px';
-        item.style.borderRadius = '6px';
-        item.style.border = '1px solid #ccc';
-        item.style.background = (currentUserId === id) ? '#e6f0ff' : '#fff';
-
-        // mostrar nombre + id corto
-        const shortId = id.length > 10 ? id.slice(0, 8) + '...' : id;
-        item.innerHTML = `<strong>${escapeHtml(name)}</strong><br><small>ID: ${shortId}</small>`;
-
-        // marca de nuevo mensaje
-        if (chats[id] && chats[id].some(m => m._unread)) {
-            const badge = document.createElement('span');
-            badge.textContent = ' • Nuevo';
-            badge.style.color = '#d9534f';
-            badge.style.marginLeft = '6px';
-            item.querySelector('strong').after(badge);
-        }
+function removeChatItem(id) {
+    const item = chatItems.get(id);
+    if (!item) return;
+    item.remove();
+    chatItems.delete(id);
+}
 
-        item.addEventListener('click', () => {
-            selectChat(id, name);
-        });
+function updateEmptyPlaceholder() {
+    let placeholder = chatListEl.querySelector('.empty-list');
+    if (chatItems.size > 0) {
+        if (placeholder) placeholder.remove();
+        return;
+    }
+    if (!placeholder) {
+        placeholder = document.createElement('p');
+        placeholder.className = 'empty-list';
+        placeholder.style.padding = '10px';
+        chatListEl.appendChild(placeholder);
+    }
+    placeholder.textContent = 'No hay clientes conectados';
+}
 
-        chatListEl.appendChild(item);
-    });
+function renderChatList(clientes) {
+    chatListEl.innerHTML = '';
+    chatItems.clear();
+    (clientes || []).forEach(upsertChatItem);
+    updateEmptyPlaceholder();
+}
+socket.on('chat_list_snapshot', (snapshot) => {
+    if (!snapshot) return;
+    if (snapshot.origin) lastSeqByOrigin[snapshot.origin] = snapshot.seq;
+    snapshotRequested = false;
+    renderChatList(snapshot.clients);
 });
 
+function applyChatListDelta(delta) {
+    if (!delta) return;
+    const last = lastSeqByOrigin[delta.origin];
+    if (last !== undefined && delta.seq !== last + 1) {
+        if (delta.seq <= last) return; // ya aplicado (llegó antes el snapshot)
+        if (!snapshotRequested) {
+            snapshotRequested = true;
+            socket.emit('request_chat_list');
+        }
+        return;
+    }
+    lastSeqByOrigin[delta.origin] = delta.seq;
+
+    (delta.removed || []).forEach(removeChatItem);
+    (delta.added || []).forEach(upsertChatItem);
+    (delta.renamed || []).forEach(upsertChatItem);
+    updateEmptyPlaceholder();
+}
+socket.on('chat_list_delta', applyChatListDelta);
+
 // -----------------------------
 // Seleccionar chat y pedir historial
 // -----------------------------
@@ -99,27 +179,59 @@ function selectChat(userId, name) {
 // -----------------------------
 // Recibir historial
 // -----------------------------
-socket.on('chat_history', (messages) => {
+socket.on('chat_history', (page) => {
     // El servidor responde directamente SOLO para la sala del admin que pidió
-    // messages es array de {text, timestamp, sender, audio_url?}
-    if (!currentUserId) {
-        // Si no hay chat seleccionado, guardamos en una clave temporal? No — ignoramos.
+    // page: { user_id, messages: [{text, timestamp, sender, audio_url?}], has_more }
+    // Sólo llega la última página; las anteriores se piden con 'load_older'.
+    if (!currentUserId || !page || page.user_id !== currentUserId) {
+        // respuesta de un chat que ya no está seleccionado
         return;
     }
 
     // Guardar (sobrescribir historial para el usuario actual)
-    chats[currentUserId] = (messages || []).map(msg => ({ ...msg, _unread: false }));
+    const polarity = page.polarity || {};
+    chats[currentUserId] = (page.messages || []).map(msg => ({ ...msg, polarity: polarity[msg.message_id], _unread: false }));
+    hasOlder[currentUserId] = !!page.has_more;
 
     // Renderizar
     renderChatForCurrent();
 });
 
 // -----------------------------
-// Recibir mensajes (broadcast desde servidor) -> 'message_admin'
+// Páginas anteriores del historial (se insertan arriba sin mover la vista)
+// -----------------------------
+function requestOlder() {
+    const arr = chats[currentUserId] || [];
+    if (!arr.length) return;
+    socket.emit('load_older', { user_id: currentUserId, before: arr[0].message_id });
+}
+
+socket.on('chat_history_older', (page) => {
+    if (!page || page.user_id !== currentUserId || page.reset) return;
+    const polarity = page.polarity || {};
+    const older = (page.messages || []).map(msg => ({ ...msg, polarity: polarity[msg.message_id], _unread: false }));
+    chats[currentUserId] = older.concat(chats[currentUserId] || []);
+    hasOlder[currentUserId] = !!page.has_more;
+
+    const prevHeight = chatBoxEl.scrollHeight;
+    const fragment = document.createDocumentFragment();
+    older.forEach(m => renderMessage(m, fragment));
+    const loadBtn = chatBoxEl.querySelector('.load-older');
+    if (loadBtn) {
+        loadBtn.after(fragment);
+        if (!page.has_more) loadBtn.remove();
+    } else {
+        chatBoxEl.prepend(fragment);
+    }
+    chatBoxEl.scrollTop += chatBoxEl.scrollHeight - prevHeight;
+});
+
+// -----------------------------
+// Recibir mensajes (sala 'admins', normalmente dentro de 'admin_batch') -> 'message_admin'
 // payload: { user_id, message }
 // message: { text, timestamp, sender, audio_url? }
 // -----------------------------
-socket.on('message_admin', (payload) => {
+function handleAdminMessage(payload) {
     try {
         const userId = payload.user_id;
         const msg = payload.message;
@@ -142,13 +254,30 @@ socket.on('message_admin', (payload) => {
                 chats[userId].forEach(m => { m._unread = false; });
             } else {
                 // resaltar en la lista que hay nuevo mensaje
-                const el = [...chatListEl.children].find(c => c.dataset.userId === userId);
+                const el = chatItems.get(userId);
                 if (el) el.classList.add('new-message');
             }
         }
     } catch (e) {
         console.error('Error al procesar message_admin', e);
     }
+}
+socket.on('message_admin', handleAdminMessage);
+
+// -----------------------------
+// Lotes del servidor: los eventos de admin llegan agrupados por tick
+// en 'admin_batch' como [{event, data}, ...]
+// -----------------------------
+const adminHandlers = {
+    chat_list_delta: applyChatListDelta,
+    message_admin: handleAdminMessage
+};
+
+socket.on('admin_batch', (batch) => {
+    (batch || []).forEach(item => {
+        const handler = adminHandlers[item.event];
+        if (handler) handler(item.data);
+    });
 });
 
 // -----------------------------
@@ -194,14 +323,24 @@ function renderChatForCurrent() {
     if (!currentUserId) return;
     clearChatBox();
     const arr = chats[currentUserId] || [];
-    arr.forEach(m => renderMessage(m));
+    if (hasOlder[currentUserId]) {
+        const loadBtn = document.createElement('button');
+        loadBtn.className = 'load-older';
+        loadBtn.textContent = 'Cargar mensajes anteriores';
+        loadBtn.addEventListener('click', requestOlder);
+        chatBoxEl.appendChild(loadBtn);
+    }
+    // se arma fuera del DOM y se inserta de una vez
+    const fragment = document.createDocumentFragment();
+    arr.forEach(m => renderMessage(m, fragment));
+    chatBoxEl.appendChild(fragment);
     // marcar leidos
     arr.forEach(m => m._unread = false);
     scrollToBottom();
 }
 
-function renderMessage(msg) {
-    if (!chatBoxEl) return;
+function renderMessage(msg, target = chatBoxEl) {
+    if (!target) return;
     const wrapper = document.createElement('div');
 
     // decide clase (estética mínima; tu CSS puede mapear .own-message/.other-message)
@@ -228,7 +367,7 @@ function renderMessage(msg) {
         ts.innerText = formatTimestamp(msg.timestamp);
         audioWrap.appendChild(ts);
 
-        chatBoxEl.appendChild(audioWrap);
+        target.appendChild(audioWrap);
         return;
     }
 
@@ -249,6 +388,11 @@ function renderMessage(msg) {
     tsEl.style.color = '#666';
     tsEl.style.marginTop = '6px';
     tsEl.innerText = formatTimestamp(msg.timestamp);
+    if (typeof msg.polarity === 'number') {
+        // polaridad del motor local en [-1, 1]
+        const mood = msg.polarity >= 0.25 ? '🙂' : msg.polarity <= -0.25 ? '🙁' : '😐';
+        tsEl.innerText += ` · ${mood} ${msg.polarity >= 0 ? '+' : ''}${msg.polarity.toFixed(2)}`;
+    }
 
     const container = document.createElement('div');
     container.style.margin = '6px 0';
@@ -258,8 +402,8 @@ function renderMessage(msg) {
     // alineación
     container.style.alignSelf = isAdmin ? 'flex-end' : 'flex-start';
 
-    chatBoxEl.appendChild(container);
-    scrollToBottom();
+    target.appendChild(container);
+    if (target === chatBoxEl) scrollToBottom();
 }
 
 function scrollToBottom() {
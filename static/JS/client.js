@@ -1,10 +1,20 @@
 // static/JS/client.js 
-const socket = io();
 let userId = null;
 let userName = sessionStorage.getItem("user_name");
+// token de la sesión (lo emite register_name): al reconectar devuelve este socket a su conversación
+let sessionToken = sessionStorage.getItem("session_token");
 
 // track rendered messages to avoid duplicates
 const renderedMessageIds = new Set();
+// cursores del historial: el más viejo mostrado (load_older) y el último recibido (since)
+let oldestMessageId = null;
+let lastMessageId = null;
+
+// `auth` se evalúa en cada (re)conexión: lleva el token y el último mensaje visto.
+const socket = io({
+    transports: window.SOCKET_TRANSPORTS,
+    auth: (cb) => cb(sessionToken ? { token: sessionToken, since: lastMessageId } : {})
+});
 
 // === Conexión inicial ===
 window.addEventListener("DOMContentLoaded", () => {
@@ -13,18 +23,77 @@ window.addEventListener("DOMContentLoaded", () => {
         window.location.href = "/"; return;
     }
     document.getElementById("user-name").textContent = userName;
-    socket.emit("register_name", { name: userName });
 });
 
+// nombre y token se quedan en sessionStorage: una recarga reanuda la conversación y, si la
+// pestaña se cierra, el servidor expira la sesión por su TTL
 window.addEventListener("beforeunload", () => {
-  sessionStorage.removeItem("user_name");
+  flushSelections();
 });
 
 socket.on("connected", (data) => {
     userId = data.user_id;
-    socket.emit("join");
+    // sesión reanudada: el servidor ya mandó sólo lo que faltaba
+    if (data.resumed) return;
+    // sin sesión (primera conexión, o expiró): se registra otra vez
+    sessionToken = null;
+    sessionStorage.removeItem("session_token");
+    socket.emit("join", lastMessageId ? { since: lastMessageId } : {});
+    if (userName) socket.emit("register_name", { name: userName });
 });
 
+socket.on("session", (data) => {
+    if (!data?.token) return;
+    userId = data.user_id;
+    sessionToken = data.token;
+    sessionStorage.setItem("session_token", data.token);
+});
+
+// === Menú local ===
+// El árbol compilado se descarga de /menu.json (revalidado por ETag) y la
+// navegación se resuelve en el navegador; al servidor sólo se le envían
+// las selecciones por lotes para el panel del admin.
+let menuBundle = null;
+let pendingSelections = [];
+let telemetryTimer = null;
+const TELEMETRY_FLUSH_MS = 2000;
+const TELEMETRY_MAX_BATCH = 20;
+
+function loadMenuBundle() {
+    return fetch("/menu.json", { cache: "no-cache" })
+        .then(r => r.ok ? r.json() : null)
+        .then(bundle => { if (bundle) menuBundle = bundle; })
+        .catch(() => { /* sin bundle se navega por el servidor */ });
+}
+loadMenuBundle();
+
+function flushSelections() {
+    if (telemetryTimer) {
+        clearTimeout(telemetryTimer);
+        telemetryTimer = null;
+    }
+    if (pendingSelections.length === 0) return;
+    socket.emit("menu_telemetry", { selections: pendingSelections });
+    pendingSelections = [];
+}
+
+function recordSelection(id) {
+    pendingSelections.push({ id, timestamp: getCurrentTimestamp() });
+    if (pendingSelections.length >= TELEMETRY_MAX_BATCH) flushSelections();
+    else if (!telemetryTimer) telemetryTimer = setTimeout(flushSelections, TELEMETRY_FLUSH_MS);
+}
+
+function selectMenuOption(id, eventName) {
+    const entry = menuBundle && menuBundle.options[id];
+    const render = entry && menuRenderers[entry.event];
+    if (!render) {
+        socket.emit(eventName, { id });
+        return;
+    }
+    render(entry.payload);
+    recordSelection(id);
+}
+
 // === Utilidades ===
 function getCurrentTimestamp() {
     return new Date().toISOString();
@@ -65,8 +134,85 @@ function sendMessage() {
     const timestamp = getCurrentTimestamp();
     socket.emit("message", { text: message, timestamp });
     messageInput.value = "";
+    cancelAutocomplete();
+}
+
+// === Autocompletado del menú ===
+// Mientras se escribe se piden sugerencias como máximo cada AUTOCOMPLETE_THROTTLE_MS
+// (siempre con el último texto); cada consulta lleva un `seq` y sólo se muestra la
+// respuesta de la más reciente, así una respuesta lenta nunca pisa a otra nueva.
+const AUTOCOMPLETE_THROTTLE_MS = 150;
+const AUTOCOMPLETE_MIN_CHARS = 2;
+let autocompleteSeq = 0;
+let autocompleteTimer = null;
+let autocompleteLastSent = 0;
+let autocompleteLastQuery = "";
+
+const suggestionsBox = document.createElement("div");
+suggestionsBox.classList.add("autocomplete-list");
+suggestionsBox.hidden = true;
+messageInput.parentNode.insertBefore(suggestionsBox, messageInput.nextSibling);
+
+function cancelAutocomplete() {
+    if (autocompleteTimer) {
+        clearTimeout(autocompleteTimer);
+        autocompleteTimer = null;
+    }
+    autocompleteSeq++;          // invalida las respuestas en camino
+    autocompleteLastQuery = "";
+    suggestionsBox.hidden = true;
+    suggestionsBox.replaceChildren();
 }
 
+function requestSuggestions() {
+    autocompleteTimer = null;
+    const q = messageInput.value.trim();
+    if (q.length < AUTOCOMPLETE_MIN_CHARS) {
+        cancelAutocomplete();
+        return;
+    }
+    if (q === autocompleteLastQuery) return;
+    autocompleteLastQuery = q;
+    autocompleteLastSent = Date.now();
+    socket.emit("menu_autocomplete", { q, seq: ++autocompleteSeq });
+}
+
+messageInput.addEventListener("input", () => {
+    if (autocompleteTimer) return;  // ya hay una consulta programada; tomará el texto más nuevo
+    const wait = Math.max(0, AUTOCOMPLETE_THROTTLE_MS - (Date.now() - autocompleteLastSent));
+    autocompleteTimer = setTimeout(requestSuggestions, wait);
+});
+
+messageInput.addEventListener("keydown", (e) => {
+    if (e.key === "Escape") cancelAutocomplete();
+});
+
+messageInput.addEventListener("blur", () => {
+    // se deja tiempo para que el click en una sugerencia llegue antes de ocultarlas
+    setTimeout(cancelAutocomplete, 150);
+});
+
+socket.on("menu_autocomplete_results", (data) => {
+    if (!data || data.seq !== autocompleteSeq) return;  // respuesta vieja
+    if (data.version && data.version !== menuBundle?.version) loadMenuBundle();
+    suggestionsBox.replaceChildren();
+    const results = Array.isArray(data.results) ? data.results : [];
+    results.forEach(item => {
+        const option = document.createElement("button");
+        option.type = "button";
+        option.classList.add("autocomplete-item");
+        option.textContent = item.path || item.label;
+        option.addEventListener("mousedown", (e) => e.preventDefault());  // no quita el foco
+        option.addEventListener("click", () => {
+            messageInput.value = "";
+            cancelAutocomplete();
+            selectMenuOption(item.id, "menu_option_selected");
+        });
+        suggestionsBox.appendChild(option);
+    });
+    suggestionsBox.hidden = results.length === 0;
+});
+
 // === Recepción ===
 socket.on("message", (data) => {
     if (!data) return;
@@ -75,9 +221,65 @@ socket.on("message", (data) => {
     addMessageToChat(data);
 });
 
+// === Historial paginado ===
+// 'chat_history' trae la última página (o lo perdido desde 'since');
+// las páginas anteriores se piden con 'load_older' y se insertan arriba.
+socket.on("chat_history", (page) => {
+    if (!page) return;
+    const fragment = document.createDocumentFragment();
+    (page.messages || []).forEach(msg => {
+        if (msg.message_id && renderedMessageIds.has(msg.message_id)) return;
+        addMessageToChat(msg, fragment);
+    });
+    chatBox.appendChild(fragment);
+    const messages = page.messages || [];
+    if (messages.length) {
+        if (!oldestMessageId) oldestMessageId = messages[0].message_id;
+        lastMessageId = messages[messages.length - 1].message_id;
+    }
+    // una respuesta a 'since' nunca trae has_more; el botón se retira sólo con 'chat_history_older'
+    if (page.has_more) setLoadOlderButton(true);
+    chatBox.scrollTop = chatBox.scrollHeight;
+});
+
+socket.on("chat_history_older", (page) => {
+    if (!page || page.reset) return;
+    const messages = (page.messages || []).filter(m => !renderedMessageIds.has(m.message_id));
+    if (messages.length) oldestMessageId = messages[0].message_id;
+
+    const prevHeight = chatBox.scrollHeight;
+    const fragment = document.createDocumentFragment();
+    messages.forEach(msg => addMessageToChat(msg, fragment));
+    const loadBtn = chatBox.querySelector(".load-older");
+    if (loadBtn) loadBtn.after(fragment);
+    else chatBox.prepend(fragment);
+    setLoadOlderButton(page.has_more);
+    chatBox.scrollTop += chatBox.scrollHeight - prevHeight;
+});
+
+function setLoadOlderButton(show) {
+    let loadBtn = chatBox.querySelector(".load-older");
+    if (!show) {
+        if (loadBtn) loadBtn.remove();
+        return;
+    }
+    if (loadBtn) return;
+    loadBtn = document.createElement("button");
+    loadBtn.className = "load-older";
+    loadBtn.textContent = "Cargar mensajes anteriores";
+    loadBtn.addEventListener("click", () => {
+        if (oldestMessageId) socket.emit("load_older", { before: oldestMessageId });
+    });
+    chatBox.prepend(loadBtn);
+}
+
 // === Renderizado ===
-function addMessageToChat(data) {
-    if (data.message_id) renderedMessageIds.add(data.message_id);
+function addMessageToChat(data, target = chatBox) {
+    if (data.message_id) {
+        renderedMessageIds.add(data.message_id);
+        // los mensajes de páginas anteriores no mueven el cursor 'since'
+        if (target === chatBox) lastMessageId = data.message_id;
+    }
 
     // AUDIO
     if (data.audio_url) {
@@ -105,8 +307,8 @@ function addMessageToChat(data) {
             wrapper.appendChild(tsSpan);
         }
 
-        chatBox.appendChild(wrapper);
-        chatBox.scrollTop = chatBox.scrollHeight;
+        target.appendChild(wrapper);
+        if (target === chatBox) chatBox.scrollTop = chatBox.scrollHeight;
         return;
     }
 
@@ -135,12 +337,14 @@ function addMessageToChat(data) {
     wrapper.appendChild(bubble);
     wrapper.appendChild(ts);
 
-    chatBox.appendChild(wrapper);
-    chatBox.scrollTop = chatBox.scrollHeight;
+    target.appendChild(wrapper);
+    if (target === chatBox) chatBox.scrollTop = chatBox.scrollHeight;
 }
 
 // === MENÚ PRINCIPAL ===
 socket.on("show_menu", (data) => {
+    if (data?.version && data.version !== menuBundle?.version) loadMenuBundle();
+
     addMessageToChat({
         sender: "Tecbot",
         text: "Aquí está el menú principal. Selecciona una opción:",
@@ -157,7 +361,7 @@ socket.on("show_menu", (data) => {
             btn.dataset.id = item.id;
             btn.textContent = `🔹 ${item.label}`;
             btn.addEventListener("click", () => {
-                socket.emit("menu_option_selected", { id: item.id });
+                selectMenuOption(item.id, "menu_option_selected");
             });
             menuDiv.appendChild(btn);
         });
@@ -194,35 +398,78 @@ socket.on("show_menu", (data) => {
 });
 
 // === INFO ===
-socket.on("show_info", (data) => {
+function renderInfo(data) {
     addMessageToChat({
         sender: "Tecbot",
         text: `${data.label}: ${data.text}`,
         timestamp: getCurrentTimestamp()
     });
-});
+}
+socket.on("show_info", renderInfo);
 
 // Estado del resumen (ok / error)
+// etapas: queued → summarizing → rendering → sending → done (o error / cancelled)
 socket.on("summary_status", (data) => {
     addMessageToChat({
         sender: "Sistema",
-        text: data.message,
+        text: data.message || data.error,
         timestamp: getCurrentTimestamp()
     });
+    if (data.stage === "queued") addCancelSummaryButton();
+    if (data.ok !== null) {
+        document.querySelectorAll(".cancel-summary").forEach(el => el.remove());
+        summaryPreviews.delete(data.job_id);
+    }
 });
 
+// Entrega del correo (bandeja de salida): pending → sent, o retrying → sent / failed
+socket.on("email_status", (data) => {
+    if (data.status === "pending") return; // ya se avisó con 'summary_status'
+    addMessageToChat({
+        sender: "Sistema",
+        text: data.status === "failed" && data.error ? `${data.message} (${data.error})` : data.message,
+        timestamp: getCurrentTimestamp()
+    });
+});
+
+// Resumen en vivo: Gemma lo transmite por fragmentos ('summary_chunk') mientras lo genera
+const summaryPreviews = new Map(); // job_id -> globo del resumen
+socket.on("summary_chunk", (data) => {
+    let bubble = summaryPreviews.get(data.job_id);
+    if (!bubble) {
+        addMessageToChat({ sender: "Resumen", text: "", timestamp: getCurrentTimestamp() });
+        bubble = chatBox.lastElementChild.firstElementChild;
+        summaryPreviews.set(data.job_id, bubble);
+    }
+    bubble.textContent += data.text;
+    chatBox.scrollTop = chatBox.scrollHeight;
+});
+
+function addCancelSummaryButton() {
+    const btn = document.createElement("button");
+    btn.classList.add("menu-button", "cancel-summary");
+    btn.textContent = "✖ Cancelar resumen";
+    btn.addEventListener("click", () => {
+        socket.emit("cancel_summary");
+        btn.remove();
+    });
+    chatBox.appendChild(btn);
+    chatBox.scrollTop = chatBox.scrollHeight;
+}
+
 // === LINKS ===
-socket.on("show_link", (data) => {
+function renderLink(data) {
     addMessageToChat({
         sender: "Tecbot",
         text: `Abriendo: ${data.label}`,
         timestamp: getCurrentTimestamp()
     });
     if (data.link) window.open(data.link, "_blank");
-});
+}
+socket.on("show_link", renderLink);
 
 // === SUBMENÚ ===
-socket.on("show_submenu", (data) => {
+function renderSubmenu(data) {
     addMessageToChat({
         sender: "Tecbot",
         text: data?.parent_label ? `Submenú de ${data.parent_label}:` : "Submenú:",
@@ -239,7 +486,7 @@ socket.on("show_submenu", (data) => {
             btn.dataset.id = item.id;
             btn.textContent = `🔹 ${item.label}`;
             btn.addEventListener("click", () => {
-                socket.emit("submenu_option_selected", { id: item.id });
+                selectMenuOption(item.id, "submenu_option_selected");
             });
             menuDiv.appendChild(btn);
         });
@@ -247,10 +494,11 @@ socket.on("show_submenu", (data) => {
 
     chatBox.appendChild(menuDiv);
     chatBox.scrollTop = chatBox.scrollHeight;
-});
+}
+socket.on("show_submenu", renderSubmenu);
 
 // === IMÁGENES ===
-socket.on("show_map", (data) => {
+function renderMap(data) {
     addMessageToChat({
         sender: "Tecbot",
         text: `Mostrando: ${data.label}`,
@@ -262,4 +510,12 @@ socket.on("show_map", (data) => {
     img.classList.add("menu-image");
     chatBox.appendChild(img);
     chatBox.scrollTop = chatBox.scrollHeight;
-});
+}
+socket.on("show_map", renderMap);
+
+const menuRenderers = {
+    show_info: renderInfo,
+    show_link: renderLink,
+    show_submenu: renderSubmenu,
+    show_map: renderMap
+};
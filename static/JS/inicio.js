@@ -1,7 +1,7 @@
 // ===============================
 // Socket.IO
 // ===============================
-const socket = io();
+const socket = io({ transports: window.SOCKET_TRANSPORTS });
 let userId = null;
 let userName = sessionStorage.getItem("user_name");;
 
@@ -21,6 +21,54 @@ socket.on("connected", (data) => {
     socket.emit("join");
 });
 
+window.addEventListener("beforeunload", () => flushSelections());
+
+// ===============================
+// Menú local (bundle versionado de /menu.json)
+// — la navegación se resuelve aquí; al servidor sólo van las
+//   selecciones por lotes para el panel del admin
+// ===============================
+let menuBundle = null;
+let pendingSelections = [];
+let telemetryTimer = null;
+const TELEMETRY_FLUSH_MS = 2000;
+const TELEMETRY_MAX_BATCH = 20;
+
+function loadMenuBundle() {
+    return fetch("/menu.json", { cache: "no-cache" })
+        .then(r => r.ok ? r.json() : null)
+        .then(bundle => { if (bundle) menuBundle = bundle; })
+        .catch(() => { /* sin bundle se navega por el servidor */ });
+}
+loadMenuBundle();
+
+function flushSelections() {
+    if (telemetryTimer) {
+        clearTimeout(telemetryTimer);
+        telemetryTimer = null;
+    }
+    if (pendingSelections.length === 0) return;
+    socket.emit("menu_telemetry", { selections: pendingSelections });
+    pendingSelections = [];
+}
+
+function recordSelection(id) {
+    pendingSelections.push({ id, timestamp: getCurrentTimestamp() });
+    if (pendingSelections.length >= TELEMETRY_MAX_BATCH) flushSelections();
+    else if (!telemetryTimer) telemetryTimer = setTimeout(flushSelections, TELEMETRY_FLUSH_MS);
+}
+
+function selectMenuOption(id, eventName) {
+    const entry = menuBundle && menuBundle.options[id];
+    const render = entry && menuRenderers[entry.event];
+    if (!render) {
+        socket.emit(eventName, { id });
+        return;
+    }
+    render(entry.payload);
+    recordSelection(id);
+}
+
 // ===============================
 // DOM
 // ===============================
@@ -84,11 +132,12 @@ function createButton(label, id, className, emitEvent, extraData = null) {
         // 🔥 Comportamiento para LINKS
         if (extraData && extraData.type === "link" && extraData.link) {
             window.open(extraData.link, "_blank", "noopener");
+            recordSelection(id);
             return;
         }
 
-        // Comportamiento normal
-        socket.emit(emitEvent, { id });
+        // Comportamiento normal (local si ya tenemos el bundle)
+        selectMenuOption(id, emitEvent);
     });
 
     return btn;
@@ -99,7 +148,8 @@ function addReturnButton(container) {
     returnBtn.textContent = "Regresar al menú principal";
     returnBtn.className = "submenu-button";
     returnBtn.addEventListener("click", () => {
-        socket.emit("return_to_main_menu");
+        if (menuBundle) renderMenu({ menu: menuBundle.menu, version: menuBundle.version });
+        else socket.emit("return_to_main_menu");
     });
     container.appendChild(returnBtn);
 }
@@ -152,7 +202,8 @@ socket.on("message", (data) => {
 // ===============================
 // MENÚ PRINCIPAL
 // ===============================
-socket.on("show_menu", (data) => {
+function renderMenu(data) {
+    if (data?.version && data.version !== menuBundle?.version) loadMenuBundle();
     clearMenus();
 
     const menu = Array.isArray(data?.menu) ? data.menu : [];
@@ -177,12 +228,13 @@ socket.on("show_menu", (data) => {
 
     chatBox.appendChild(container);
     chatBox.scrollTop = chatBox.scrollHeight;
-});
+}
+socket.on("show_menu", renderMenu);
 
 // ===============================
 // SUBMENÚ
 // ===============================
-socket.on("show_submenu", (data) => {
+function renderSubmenu(data) {
     clearMenus();
 
     const submenu = Array.isArray(data?.submenu) ? data.submenu : [];
@@ -208,12 +260,13 @@ socket.on("show_submenu", (data) => {
     addReturnButton(container);
     chatBox.appendChild(container);
     chatBox.scrollTop = chatBox.scrollHeight;
-});
+}
+socket.on("show_submenu", renderSubmenu);
 
 // ===============================
 // ENLACE (versión limpia)
 // ===============================
-socket.on("show_link", (data) => {
+function renderLink(data) {
     clearMenus();
 
     const container = document.createElement("div");
@@ -232,12 +285,13 @@ socket.on("show_link", (data) => {
 
     chatBox.appendChild(container);
     chatBox.scrollTop = chatBox.scrollHeight;
-});
+}
+socket.on("show_link", renderLink);
 
 // ===============================
 // INFO
 // ===============================
-socket.on("show_info", (data) => {
+function renderInfo(data) {
     clearMenus();
 
     const container = document.createElement("div");
@@ -254,12 +308,13 @@ socket.on("show_info", (data) => {
     addReturnButton(container);
     chatBox.appendChild(container);
     chatBox.scrollTop = chatBox.scrollHeight;
-});
+}
+socket.on("show_info", renderInfo);
 
 // ===============================
 // MAPA
 // ===============================
-socket.on("show_map", (data) => {
+function renderMap(data) {
     clearMenus();
 
     const container = document.createElement("div");
@@ -281,7 +336,15 @@ socket.on("show_map", (data) => {
     addReturnButton(container);
     chatBox.appendChild(container);
     chatBox.scrollTop = chatBox.scrollHeight;
-});
+}
+socket.on("show_map", renderMap);
+
+const menuRenderers = {
+    show_info: renderInfo,
+    show_link: renderLink,
+    show_submenu: renderSubmenu,
+    show_map: renderMap
+};
 
 // ===============================
 // Enviar mensaje
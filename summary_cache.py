@@ -0,0 +1,94 @@
+# summary_cache.py
+# Cache de resúmenes por conversación. Guarda el último resumen de cada chat junto
+# con el hash de los mensajes que cubrió y el message_id del último de ellos:
+#   - mismo hash  -> se reutiliza tal cual (p. ej. reenviar a otro correo)
+#   - hash nuevo  -> se resume sólo lo nuevo partiendo del resumen previo
+import time
+import hashlib
+from collections import OrderedDict
+
+
+def summary_content_hash(messages):
+    h = hashlib.sha1()
+    for m in messages:
+        h.update(f"{m.get('message_id', '')}\x1f{m.get('sender', '')}\x1f{m.get('text', '')}\x1e".encode('utf-8'))
+    return h.hexdigest()
+
+
+def messages_after(messages, message_id):
+    """Mensajes posteriores a `message_id`; None si ese mensaje ya no está en la lista."""
+    for i in range(len(messages) - 1, -1, -1):
+        if messages[i].get('message_id') == message_id:
+            return messages[i + 1:]
+    return None
+
+
+class CachedSummary:
+    __slots__ = ('content_hash', 'summary', 'last_message_id', 'created')
+
+    def __init__(self, content_hash, summary, last_message_id, created):
+        self.content_hash = content_hash
+        self.summary = summary
+        self.last_message_id = last_message_id
+        self.created = created
+
+
+class SummaryCache:
+    """LRU por conversación con expiración por TTL."""
+
+    def __init__(self, max_entries=500, ttl=3600.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()  # { conversation_id: CachedSummary }
+        self.hits = 0
+        self.incremental = 0
+        self.misses = 0
+
+    def latest(self, conversation_id):
+        entry = self._entries.get(conversation_id)
+        if entry is None:
+            return None
+        if self._clock() - entry.created > self.ttl:
+            del self._entries[conversation_id]
+            return None
+        self._entries.move_to_end(conversation_id)
+        return entry
+
+    def lookup(self, conversation_id, messages):
+        """
+        Devuelve (content_hash, previo, nuevos):
+          previo y nuevos == []  -> el resumen previo sirve tal cual
+          previo y nuevos != []  -> resumir incrementalmente sólo `nuevos`
+          previo None            -> resumen completo
+        """
+        content_hash = summary_content_hash(messages)
+        prev = self.latest(conversation_id)
+        new_messages = None
+        if prev is not None:
+            new_messages = [] if prev.content_hash == content_hash else messages_after(messages, prev.last_message_id)
+        if new_messages is None:
+            self.misses += 1
+            return content_hash, None, None
+        if not new_messages:
+            self.hits += 1
+            if prev.content_hash != content_hash:
+                # sólo se descartaron mensajes viejos: el resumen previo sigue cubriendo todo
+                self.put(conversation_id, content_hash, prev.summary, prev.last_message_id)
+            return content_hash, prev, []
+        self.incremental += 1
+        return content_hash, prev, new_messages
+
+    def put(self, conversation_id, content_hash, summary, last_message_id):
+        self._entries[conversation_id] = CachedSummary(content_hash, summary, last_message_id, self._clock())
+        self._entries.move_to_end(conversation_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "incremental": self.incremental,
+            "misses": self.misses,
+        }
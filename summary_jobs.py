@@ -0,0 +1,251 @@
+# summary_jobs.py
+# Cola de trabajos para los resúmenes por correo. El handler del socket sólo encola;
+# un pool acotado de workers ejecuta el flujo (Gemma -> polaridad -> PDF -> Resend)
+# y va notificando cada etapa con 'summary_status'.
+import os
+import sys
+import queue
+import uuid
+import pickle
+import struct
+import logging
+import subprocess
+
+logger = logging.getLogger("build-a-chat.summary")
+
+STAGE_MESSAGES = {
+    'queued': 'Resumen en cola...',
+    'summarizing': 'Generando resumen...',
+    'rendering': 'Generando PDF...',
+    'sending': 'Enviando correo...',
+}
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class SummaryJob:
+    def __init__(self, user_id, email):
+        self.job_id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.email = email
+        self.stage = 'queued'
+        self.cancelled = False
+
+
+class SummaryJobQueue:
+    """
+    runner(job, progress) ejecuta el trabajo y devuelve {"ok": bool, "message"|"error": str};
+    progress(stage) notifica la etapa y lanza JobCancelled si el trabajo se canceló.
+    notify(user_id, payload) entrega 'summary_status' al usuario.
+    Cada usuario tiene a lo sumo un trabajo activo (deduplicación).
+    """
+
+    def __init__(self, runner, notify, workers=4, max_queue=100):
+        self._runner = runner
+        self._notify = notify
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._active = {}  # { user_id: SummaryJob }
+        self.workers = workers
+
+    def start(self, spawn):
+        for _ in range(self.workers):
+            spawn(self._work)
+
+    def submit(self, user_id, email):
+        """Encola un resumen. Devuelve (job, 'queued' | 'duplicate' | 'rejected')."""
+        current = self._active.get(user_id)
+        if current is not None:
+            return current, 'duplicate'
+
+        job = SummaryJob(user_id, email)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self._notify(user_id, {'ok': False, 'stage': 'error', 'job_id': job.job_id,
+                                   'error': 'Hay demasiados resúmenes en proceso, intenta en unos minutos.'})
+            return job, 'rejected'
+        self._active[user_id] = job
+        self._status(job, 'queued')
+        return job, 'queued'
+
+    def cancel(self, user_id):
+        job = self._active.get(user_id)
+        if job is None:
+            return False
+        job.cancelled = True
+        if job.stage == 'queued':
+            # todavía no lo toma un worker: se libera ya para que el usuario pueda reintentar
+            del self._active[user_id]
+            self._notify(user_id, {'ok': False, 'stage': 'cancelled', 'job_id': job.job_id,
+                                   'error': 'Resumen cancelado.'})
+        return True
+
+    def in_flight(self):
+        return len(self._active)
+
+    def _status(self, job, stage):
+        job.stage = stage
+        self._notify(job.user_id, {'ok': None, 'stage': stage, 'job_id': job.job_id,
+                                   'message': STAGE_MESSAGES[stage]})
+
+    def _progress(self, job):
+        def progress(stage):
+            if job.cancelled:
+                raise JobCancelled()
+            self._status(job, stage)
+        return progress
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job.cancelled:
+                continue  # cancelado en la cola; ya se notificó
+            job.stage = 'running'
+            try:
+                self._run(job)
+            finally:
+                if self._active.get(job.user_id) is job:
+                    del self._active[job.user_id]
+
+    def _run(self, job):
+        done = {'job_id': job.job_id}
+        try:
+            result = self._runner(job, self._progress(job))
+        except JobCancelled:
+            self._notify(job.user_id, dict(done, ok=False, stage='cancelled', error='Resumen cancelado.'))
+            return
+        except Exception as e:
+            logger.exception("Error en trabajo de resumen %s", job.job_id)
+            self._notify(job.user_id, dict(done, ok=False, stage='error', error=str(e)))
+            return
+
+        if result.get("ok"):
+            self._notify(job.user_id, dict(done, ok=True, stage='done', message=result.get("message")))
+        else:
+            self._notify(job.user_id, dict(done, ok=False, stage='error', error=result.get("error")))
+
+
+class ProcessOffloader:
+    """
+    Ejecuta funciones CPU-bound (reportlab) en un pool de procesos hijos para no
+    bloquear el loop de gevent. Cada hijo es un `python -m summary_jobs` persistente
+    que recibe (función, args) en pickle por stdin y responde por stdout; con gevent
+    parcheado esas pipes son cooperativas, así que el hub sigue atendiendo sockets
+    mientras el hijo trabaja. La función debe vivir en un módulo importable sin
+    efectos secundarios (p. ej. pdf_render).
+    """
+
+    def __init__(self, processes=2):
+        self.processes = processes
+        self._idle = queue.Queue()
+        self._spawned = 0
+
+    def run(self, fn, *args):
+        if self.processes <= 0:
+            return fn(*args)
+        if self._idle.empty() and self._spawned < self.processes:
+            self._spawned += 1
+            self._idle.put(None)  # hueco libre: el hijo se lanza al tomarlo
+        child = self._idle.get()
+        reusable = False
+        try:
+            if child is None:
+                child = _ChildProcess()
+            value = child.call(fn, args)
+            reusable = True
+            return value
+        except _ChildError:
+            reusable = True  # la función falló pero la respuesta se leyó completa
+            raise
+        except _ChildCrashed:
+            raise RuntimeError("El proceso de render terminó inesperadamente") from None
+        finally:
+            if reusable:
+                self._idle.put(child)
+            else:
+                # caída o interrupción a mitad de la llamada (GreenletExit, gevent.Timeout):
+                # la pipe puede guardar una respuesta sin leer, así que el hijo se descarta
+                if child is not None:
+                    child.kill()
+                self._idle.put(None)
+
+    def close(self):
+        while not self._idle.empty():
+            child = self._idle.get_nowait()
+            if child is not None:
+                child.kill()
+        self._spawned = 0
+
+
+FRAME = struct.Struct('<I')
+
+
+class _ChildCrashed(Exception):
+    pass
+
+
+class _ChildError(RuntimeError):
+    """La función lanzó una excepción dentro del hijo; el protocolo quedó en orden."""
+
+
+def _read_frame(stream):
+    header = stream.read(FRAME.size)
+    if len(header) < FRAME.size:
+        return None
+    (n,) = FRAME.unpack(header)
+    return stream.read(n)
+
+
+def _write_frame(stream, payload):
+    stream.write(FRAME.pack(len(payload)) + payload)
+    stream.flush()
+
+
+class _ChildProcess:
+    def __init__(self):
+        self.proc = subprocess.Popen(
+            [sys.executable, '-m', 'summary_jobs'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        )
+
+    def call(self, fn, args):
+        try:
+            _write_frame(self.proc.stdin, pickle.dumps((fn, args)))
+            payload = _read_frame(self.proc.stdout)
+        except (BrokenPipeError, OSError) as e:
+            raise _ChildCrashed() from e
+        if payload is None:
+            raise _ChildCrashed()
+        ok, value = pickle.loads(payload)
+        if not ok:
+            raise _ChildError(value)
+        return value
+
+    def kill(self):
+        if self.proc.poll() is None:
+            self.proc.kill()
+            self.proc.wait()
+
+
+def _child_main():
+    # stdout queda reservado para el protocolo; cualquier print va a stderr
+    out = os.fdopen(os.dup(1), 'wb')
+    os.dup2(2, 1)
+    stdin = sys.stdin.buffer
+    while True:
+        payload = _read_frame(stdin)
+        if payload is None:
+            return
+        try:
+            fn, args = pickle.loads(payload)
+            reply = (True, fn(*args))
+        except Exception as e:
+            reply = (False, f"{type(e).__name__}: {e}")
+        _write_frame(out, pickle.dumps(reply))
+
+
+if __name__ == '__main__':
+    _child_main()
@@ -0,0 +1,114 @@
+# summary_prompt.py
+# Construcción de prompts para Gemma con presupuesto de tokens. Una conversación
+# que cabe en el presupuesto se resume con una sola llamada; si no, se parte en
+# trozos que se resumen en paralelo (map) y los resúmenes parciales se combinan
+# en uno final (reduce), repitiendo el reduce si los parciales tampoco caben.
+
+SUMMARY_INSTRUCTIONS = (
+    "Resume brevemente la siguiente conversación en español (máximo 6-8 líneas). "
+    "Incluye puntos importantes y recomendaciones si aplica."
+)
+UPDATE_INSTRUCTIONS = (
+    "Actualízalo en español (máximo 6-8 líneas) incorporando los siguientes mensajes nuevos. "
+    "Incluye puntos importantes y recomendaciones si aplica."
+)
+CHUNK_INSTRUCTIONS = (
+    "Resume en español la parte {part} de {total} de una conversación larga. "
+    "Conserva datos concretos (nombres, fechas, trámites, dudas pendientes) en pocas líneas."
+)
+REDUCE_INSTRUCTIONS = (
+    "Estos son resúmenes parciales, en orden, de una misma conversación. "
+    "Combínalos en un único resumen en español (máximo 6-8 líneas). "
+    "Incluye puntos importantes y recomendaciones si aplica."
+)
+
+
+class PromptBuilder:
+    """
+    Estima tokens con una heurística de caracteres por token (no hay tokenizer de
+    Gemma disponible sin dependencias) y empaqueta mensajes hasta `budget_tokens`.
+    Un mensaje que por sí solo excede `max_message_tokens` se recorta.
+    """
+
+    def __init__(self, budget_tokens=6000, chars_per_token=3.5, max_message_tokens=800):
+        self.budget_tokens = budget_tokens
+        self.chars_per_token = chars_per_token
+        self.max_message_tokens = max_message_tokens
+        # lo que ocupan las instrucciones más largas se descuenta del espacio para mensajes
+        reserved = max(self.estimate(t) for t in (
+            SUMMARY_INSTRUCTIONS, CHUNK_INSTRUCTIONS, REDUCE_INSTRUCTIONS))
+        self.content_budget = max(budget_tokens - reserved, max_message_tokens)
+
+    def estimate(self, text):
+        return int(len(text) / self.chars_per_token) + 1
+
+    def _line(self, msg):
+        line = f"{msg.get('sender', '')}: {msg.get('text', '')}"
+        max_chars = int(self.max_message_tokens * self.chars_per_token)
+        if len(line) > max_chars:
+            line = line[:max_chars] + " [...]"
+        return line
+
+    def render(self, messages):
+        return "\n".join(self._line(m) for m in messages)
+
+    def fits(self, text, prefix=''):
+        return self.estimate(prefix) + self.estimate(text) <= self.content_budget
+
+    def pack(self, lines):
+        """Agrupa líneas consecutivas en trozos que caben en el presupuesto."""
+        chunks, current, used = [], [], 0
+        for line in lines:
+            cost = self.estimate(line)
+            if current and used + cost > self.content_budget:
+                chunks.append("\n".join(current))
+                current, used = [], 0
+            current.append(line)
+            used += cost
+        if current:
+            chunks.append("\n".join(current))
+        return chunks
+
+    def chunks(self, messages):
+        return self.pack([self._line(m) for m in messages])
+
+    # --- prompts ---
+    def summary_prompt(self, text):
+        return f"{SUMMARY_INSTRUCTIONS}\n\n{text}"
+
+    def update_prompt(self, previous, text):
+        return f"Este es el resumen previo de una conversación:\n\n{previous}\n\n{UPDATE_INSTRUCTIONS}\n\n{text}"
+
+    def chunk_prompt(self, text, part, total):
+        return f"{CHUNK_INSTRUCTIONS.format(part=part, total=total)}\n\n{text}"
+
+    def reduce_prompt(self, partials):
+        return f"{REDUCE_INSTRUCTIONS}\n\n{partials}"
+
+
+def map_reduce_summary(builder, messages, generate, map_fn=map, generate_final=None):
+    """
+    generate(prompt) -> str llama al modelo; map_fn(fn, iterable) decide la
+    concurrencia del map (p. ej. el `imap` de un gevent Pool acotado).
+    generate_final, si se da, hace la última llamada (la que produce el resumen
+    que ve el usuario), p. ej. en streaming.
+    """
+    generate_final = generate_final or generate
+    text = builder.render(messages)
+    if builder.fits(text):
+        return generate_final(builder.summary_prompt(text))
+
+    chunks = builder.chunks(messages)
+    total = len(chunks)
+    partials = list(map_fn(generate, [builder.chunk_prompt(c, i + 1, total) for i, c in enumerate(chunks)]))
+
+    while True:
+        numbered = [f"[{i + 1}] {p.strip()}" for i, p in enumerate(partials)]
+        groups = builder.pack(numbered)
+        if len(groups) >= len(partials):
+            # cada parcial excede el presupuesto por sí solo: se combinan de dos en dos
+            groups = ["\n".join(numbered[i:i + 2]) for i in range(0, len(numbered), 2)]
+        if len(groups) == 1:
+            return generate_final(builder.reduce_prompt(groups[0]))
+        # los parciales tampoco caben juntos: se reducen por grupos y se repite
+        partials = list(map_fn(generate, [builder.reduce_prompt(g) for g in groups]))
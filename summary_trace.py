@@ -0,0 +1,234 @@
+# summary_trace.py
+# Trazas por etapa del flujo del resumen. Cada solicitud recibe un trace id (el
+# job_id que ya ve el cliente en 'summary_status') y registra, por etapa, cuántas
+# llamadas hubo, su duración y el tamaño de lo que entró y salió. Las trazas
+# recientes viven en un ring buffer acotado que consulta /admin/traces.
+#
+# Etapas: prompt_build, gemma, sentiment, pdf, email_enqueue y email_send (esta
+# última la registra la bandeja de salida, una vez por intento, ya con el
+# resumen terminado).
+import json
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager, nullcontext
+
+
+def payload_size(value):
+    """Bytes aproximados de `value` (texto en UTF-8, bytes tal cual, lo demás como JSON)."""
+    if value is None:
+        return 0
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    try:
+        return len(json.dumps(value, ensure_ascii=False, default=str).encode('utf-8'))
+    except (TypeError, ValueError):
+        return 0
+
+
+def _union(intervals):
+    """Tiempo cubierto por al menos un intervalo (las llamadas del map se solapan)."""
+    total, end = 0.0, None
+    for a, b in sorted(intervals):
+        if end is None or a > end:
+            total += b - a
+            end = b
+        elif b > end:
+            total += b - end
+            end = b
+    return total
+
+
+class StageRecord:
+    __slots__ = ('name', 'intervals', 'bytes_in', 'bytes_out', 'errors', 'last_error', 'derived')
+
+    def __init__(self, name):
+        self.name = name
+        self.intervals = []    # (inicio, fin) en perf_counter por llamada
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.errors = 0
+        self.last_error = None
+        self.derived = None    # segundos, para etapas calculadas (prompt_build)
+
+    @property
+    def seconds(self):
+        """Tiempo de pared de la etapa: llamadas concurrentes cuentan una sola vez."""
+        return self.derived if self.derived is not None else _union(self.intervals)
+
+    def as_dict(self):
+        durations = [b - a for a, b in self.intervals]
+        return {
+            "seconds": round(self.seconds, 4),
+            "calls": len(durations) or None,
+            "max_call": round(max(durations), 4) if durations else None,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
+
+
+class _StageCall:
+    """Lo que recibe el bloque de una etapa para reportar el tamaño de la salida."""
+    __slots__ = ('bytes_out',)
+
+    def __init__(self):
+        self.bytes_out = None
+
+
+class RequestTrace:
+    def __init__(self, trace_id, buffer, tags):
+        self.trace_id = trace_id
+        self.tags = tags
+        self.started = time.time()
+        self.status = 'running'
+        self.error = None
+        self.duration = None
+        self.stages = OrderedDict()
+        self._buffer = buffer
+        self._start = time.perf_counter()
+
+    def _record(self, name):
+        record = self.stages.get(name)
+        if record is None:
+            record = self.stages[name] = StageRecord(name)
+        return record
+
+    @contextmanager
+    def stage(self, name, payload=None):
+        """Mide un bloque como una llamada de `name`; `call.bytes_out = n` reporta la salida."""
+        record = self._record(name)
+        record.bytes_in += payload_size(payload)
+        call = _StageCall()
+        span = self._buffer.tracer.span(f'summary.{name}', trace_id=self.trace_id) \
+            if self._buffer.tracer else nullcontext()
+        start = time.perf_counter()
+        try:
+            with span:
+                yield call
+        except Exception as e:
+            record.errors += 1
+            record.last_error = f"{type(e).__name__}: {e}"[:300]
+            raise
+        finally:
+            end = time.perf_counter()
+            record.intervals.append((start, end))
+            if call.bytes_out is not None:
+                record.bytes_out += call.bytes_out
+            self._buffer.observe(name, end - start)
+
+    def wrap(self, name, fn):
+        """fn(payload) -> resultado, medido como una llamada de `name` con ambos tamaños."""
+        def traced(payload, *args, **kwargs):
+            with self.stage(name, payload) as call:
+                result = fn(payload, *args, **kwargs)
+                call.bytes_out = payload_size(result)
+                return result
+        return traced
+
+    def derive(self, name, seconds, bytes_in=0, bytes_out=0):
+        """Etapa sin bloque propio (p. ej. el armado de prompts entre llamadas a Gemma)."""
+        record = self._record(name)
+        record.derived = max(0.0, seconds)
+        record.bytes_in += bytes_in
+        record.bytes_out += bytes_out
+        self._buffer.observe(name, record.derived)
+
+    def stage_seconds(self, name):
+        record = self.stages.get(name)
+        return record.seconds if record else 0.0
+
+    def finish(self, status, error=None):
+        self.status = status
+        self.error = error
+        self.duration = time.perf_counter() - self._start
+
+    def slowest_stage(self):
+        if not self.stages:
+            return None, 0.0
+        record = max(self.stages.values(), key=lambda r: r.seconds)
+        return record.name, record.seconds
+
+    def as_dict(self):
+        slowest, slowest_seconds = self.slowest_stage()
+        return {
+            "trace_id": self.trace_id,
+            "started": self.started,
+            "status": self.status,
+            "error": self.error,
+            "duration": round(self.duration, 4) if self.duration is not None else None,
+            "slowest_stage": slowest,
+            "slowest_stage_seconds": round(slowest_seconds, 4),
+            "tags": self.tags,
+            "stages": {name: r.as_dict() for name, r in self.stages.items()},
+        }
+
+
+class TraceBuffer:
+    """
+    Ring buffer de las últimas `keep` trazas. `links` asocia otras llaves (el id
+    del correo en la bandeja) con su traza para completarla después.
+    observer(stage, segundos) recibe cada medición (p. ej. un histograma).
+    """
+
+    def __init__(self, keep=200, tracer=None, observer=None):
+        self.tracer = tracer
+        self._observer = observer
+        self._traces = deque(maxlen=keep)
+        self._by_id = {}
+        self._links = {}
+
+    def start(self, trace_id, **tags):
+        if len(self._traces) == self._traces.maxlen:
+            evicted = self._traces[0]
+            self._by_id.pop(evicted.trace_id, None)
+            self._links = {k: v for k, v in self._links.items() if v is not evicted}
+        trace = RequestTrace(trace_id, self, tags)
+        self._traces.append(trace)
+        self._by_id[trace_id] = trace
+        return trace
+
+    def get(self, trace_id):
+        return self._by_id.get(trace_id)
+
+    def link(self, key, trace):
+        self._links[key] = trace
+
+    def linked(self, key):
+        return self._links.get(key)
+
+    def observe(self, stage, seconds):
+        if self._observer:
+            self._observer(stage, seconds)
+
+    def query(self, sort='slowest', stage=None, status=None, limit=50):
+        """
+        Trazas recientes; sort='slowest' ordena por su etapa más lenta (o por
+        `stage` si se indica), sort='recent' de la más nueva a la más vieja.
+        """
+        traces = [t for t in self._traces if status is None or t.status == status]
+        if stage:
+            traces = [t for t in traces if stage in t.stages]
+        if sort == 'recent':
+            traces.reverse()
+        elif stage:
+            traces.sort(key=lambda t: t.stage_seconds(stage), reverse=True)
+        else:
+            traces.sort(key=lambda t: t.slowest_stage()[1], reverse=True)
+        return [t.as_dict() for t in traces[:limit]]
+
+    def stage_stats(self):
+        """p50/p95/p99/max por etapa sobre el buffer: qué cola de latencia pesa más."""
+        values = {}
+        for trace in self._traces:
+            for name, record in trace.stages.items():
+                values.setdefault(name, []).append(record.seconds)
+        stats = {}
+        for name, seconds in values.items():
+            seconds.sort()
+            pick = lambda p: seconds[min(len(seconds) - 1, int(p / 100.0 * len(seconds)))]
+            stats[name] = {"count": len(seconds), "p50": round(pick(50), 4), "p95": round(pick(95), 4),
+                           "p99": round(pick(99), 4), "max": round(seconds[-1], 4)}
+        return stats
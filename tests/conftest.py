@@ -0,0 +1,11 @@
+# Las pruebas importan los módulos de la raíz del repo (App.py y compañía).
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# App.py escribe la bitácora y la bandeja de salida junto al código: en pruebas, a un temporal
+_TMP = tempfile.mkdtemp(prefix='build-a-chat-tests-')
+os.environ.setdefault('CHAT_LOG_DIR', '')
+os.environ.setdefault('OUTBOX_DB', os.path.join(_TMP, 'outbox.sqlite3'))
@@ -0,0 +1,102 @@
+# Con ADMIN_TOKEN, las acciones del panel exigen un socket autenticado en el handshake;
+# entrar a la sala de admins (admin_join) ya no basta para leer otras conversaciones.
+import pytest
+
+import App
+
+
+@pytest.fixture
+def admin_token(monkeypatch):
+    monkeypatch.setattr(App, 'ADMIN_TOKEN', 's3cret')
+    return 's3cret'
+
+
+@pytest.fixture
+def victim():
+    user_id = 'victim-user'
+    App.record_messages(user_id, *[
+        {"message_id": f"v{i}", "text": f"privado {i}", "timestamp": "t", "sender": "client"}
+        for i in range(App.HISTORY_PAGE_SIZE + 5)
+    ])
+    yield user_id
+    App.STATE.drop_chat(user_id)
+
+
+def events(client, name):
+    return [e['args'][0] if e['args'] else None for e in client.get_received() if e['name'] == name]
+
+
+def test_admin_join_requires_token(admin_token, victim):
+    intruder = App.socketio.test_client(App.app)
+    intruder.get_received()
+    intruder.emit('admin_join')
+    assert events(intruder, 'admin_auth_required') == [None]
+
+    intruder.emit('load_older', {'user_id': victim, 'before': f'v{App.HISTORY_PAGE_SIZE}'})
+    pages = events(intruder, 'chat_history_older')
+    assert not any(m['message_id'].startswith('v') for p in pages for m in p['messages'])
+
+    intruder.emit('admin_select_chat', {'user_id': victim})
+    assert events(intruder, 'chat_history') == []
+    intruder.disconnect()
+
+
+def test_authenticated_admin_reads_older_pages(admin_token, victim):
+    admin = App.socketio.test_client(App.app, auth={'admin_token': admin_token})
+    assert admin.is_connected()
+    admin.emit('admin_join')
+    assert events(admin, 'admin_auth_required') == []
+
+    admin.emit('load_older', {'user_id': victim, 'before': 'v5'})
+    (page,) = events(admin, 'chat_history_older')
+    assert page['user_id'] == victim
+    assert [m['message_id'] for m in page['messages']] == ['v0', 'v1', 'v2', 'v3', 'v4']
+    admin.disconnect()
+    assert not App.ADMIN_SIDS
+
+
+def test_wrong_admin_token_is_refused(admin_token):
+    client = App.socketio.test_client(App.app, auth={'admin_token': 'nope'})
+    assert not client.is_connected()
+
+
+def test_admin_endpoints_accept_the_token_only_in_headers(admin_token):
+    http = App.app.test_client()
+    assert http.get('/admin/blocking').status_code == 403
+    assert http.get(f'/admin/blocking?token={admin_token}').status_code == 403
+    assert http.get('/admin/blocking', headers={'Authorization': 'Bearer nope'}).status_code == 403
+    assert http.get('/admin/blocking', headers={'Authorization': f'Bearer {admin_token}'}).status_code == 200
+    assert http.get('/admin/blocking', headers={'X-Admin-Token': admin_token}).status_code == 200
+
+
+def test_metrics_require_the_token_when_configured(admin_token, monkeypatch):
+    http = App.app.test_client()
+    assert http.get('/metrics').status_code == 403
+    assert http.get('/metrics', headers={'Authorization': f'Bearer {admin_token}'}).status_code == 200
+    monkeypatch.setattr(App, 'ADMIN_TOKEN', None)
+    assert http.get('/metrics').status_code == 200
+
+
+def test_admin_select_chat_ignores_malformed_cursors(admin_token, victim):
+    admin = App.socketio.test_client(App.app, auth={'admin_token': admin_token})
+    admin.get_received()
+    admin.emit('admin_select_chat', {'user_id': victim, 'since': {'$ne': 1}})
+    (page,) = events(admin, 'chat_history')
+    assert page['messages'][-1]['message_id'] == f'v{App.HISTORY_PAGE_SIZE + 4}'
+    assert not page['reset']
+
+    admin.emit('admin_select_chat', {'user_id': ['x']})
+    admin.emit('admin_select_chat', 'victim-user')
+    assert events(admin, 'chat_history') == []
+    admin.disconnect()
+
+
+def test_healthz_is_public_but_stats_need_the_token(admin_token):
+    http = App.app.test_client()
+    health = http.get('/healthz').get_json()
+    assert set(health) == {'ok', 'status', 'breakers'}
+    assert set(health['breakers'].values()) <= {'open', 'closed'}
+
+    assert http.get('/admin/stats').status_code == 403
+    stats = http.get('/admin/stats', headers={'Authorization': f'Bearer {admin_token}'}).get_json()
+    assert 'outbox' in stats and 'upstreams' in stats
@@ -0,0 +1,40 @@
+# De dónde sale el historial que se sirve: la bitácora si está activa, si no el estado.
+import pytest
+
+import App
+from chat_log import ChatLog
+
+
+def msg(i):
+    return {"message_id": f"m{i}", "text": f"mensaje {i}", "timestamp": "t", "sender": "Ana"}
+
+
+@pytest.fixture
+def chat_log(tmp_path, monkeypatch):
+    log = ChatLog(str(tmp_path), max_records=App.CHAT_MAX_MESSAGES, fsync=False)
+    monkeypatch.setattr(App, 'CHAT_LOG', log)
+    yield log
+    log.close()
+
+
+def test_with_chat_log_messages_are_not_duplicated_in_state(chat_log):
+    App.record_messages('u-log', msg(1), msg(2))
+    assert [m['message_id'] for m in App.chat_history('u-log')] == ['m1', 'm2']
+    assert App.STATE.get_history('u-log') == []
+
+
+def test_without_chat_log_state_serves_history():
+    App.record_messages('u-mem', msg(1))
+    assert [m['message_id'] for m in App.chat_history('u-mem')] == ['m1']
+    App.STATE.drop_chat('u-mem')
+
+
+def test_summary_reads_past_the_display_cap(tmp_path, monkeypatch):
+    log = ChatLog(str(tmp_path), max_records=10, fsync=False)
+    monkeypatch.setattr(App, 'CHAT_LOG', log)
+    monkeypatch.setattr(App, 'CHAT_MAX_MESSAGES', 4)
+    App.record_messages('u-long', *[msg(i) for i in range(12)])
+    log.flush()
+    assert [m['message_id'] for m in App.chat_history('u-long')] == ['m8', 'm9', 'm10', 'm11']
+    assert [m['message_id'] for m in App.summary_history('u-long')] == [f'm{i}' for i in range(2, 12)]
+    log.close()
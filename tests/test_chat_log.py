@@ -0,0 +1,130 @@
+# ChatLog: recuperación tras reinicio, orden de la conversación y compactación.
+import os
+import subprocess
+import sys
+
+import pytest
+
+import chat_log
+from chat_log import ChatLog
+
+
+def msg(i):
+    return {"message_id": f"m{i}", "text": f"mensaje {i}", "timestamp": "t", "sender": "client"}
+
+
+def ids(messages):
+    return [m["message_id"] for m in messages]
+
+
+def test_recover_after_restart(tmp_path):
+    log = ChatLog(str(tmp_path), fsync=False)
+    log.append('u1', msg(1), msg(2))
+    log.append('u2', msg(3))
+    log.close()
+
+    log = ChatLog(str(tmp_path), fsync=False)
+    assert ids(log.read('u1')) == ['m1', 'm2']
+    assert ids(log.read('u2')) == ['m3']
+    log.append('u1', msg(4))
+    assert ids(log.read('u1')) == ['m1', 'm2', 'm4']   # pendiente aún sin volcar
+    log.close()
+
+
+def test_same_timestamp_order_survives_compaction_and_restart(tmp_path, monkeypatch):
+    # mismo milisegundo para todo: sólo la secuencia distingue el orden
+    monkeypatch.setattr(chat_log.time, 'time', lambda: 1700000000.0)
+    log = ChatLog(str(tmp_path), segment_bytes=1, fsync=False)
+    log.append('u1', msg(1))
+    log.close()                          # m1 queda en un segmento sellado
+
+    log = ChatLog(str(tmp_path), fsync=False)
+    log.append('u1', msg(2))
+    log.flush()
+    # el segmento sellado se copia al activo, detrás del mensaje más nuevo
+    assert log.compact(min_live_ratio=2.0) == 1
+    assert ids(log.read('u1')) == ['m1', 'm2']
+    log.close()
+
+    log = ChatLog(str(tmp_path), fsync=False)
+    assert ids(log.read('u1')) == ['m1', 'm2']
+    log.append('u1', msg(3))
+    log.close()
+    assert ids(ChatLog(str(tmp_path), fsync=False).read('u1')) == ['m1', 'm2', 'm3']
+
+
+def test_truncated_tail_is_discarded(tmp_path):
+    log = ChatLog(str(tmp_path), fsync=False)
+    log.append('u1', msg(1), msg(2))
+    log.close()
+    path = log._segment_path(1)
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 3)   # crash a media escritura
+
+    assert ids(ChatLog(str(tmp_path), fsync=False).read('u1')) == ['m1']
+
+
+def test_fsync_runs_through_offload(tmp_path):
+    calls = []
+
+    def offload(fn, *args):
+        calls.append(fn)
+        return fn(*args)
+
+    log = ChatLog(str(tmp_path), offload=offload)
+    log.append('u1', msg(1))
+    assert log.flush() == 1
+    assert calls == [os.fsync]
+    log.close()
+
+
+def test_second_process_cannot_share_the_directory(tmp_path):
+    if chat_log.fcntl is None:
+        pytest.skip("sin fcntl")
+    log = ChatLog(str(tmp_path), fsync=False)
+    code = ("import sys; sys.path.insert(0, sys.argv[2]); from chat_log import ChatLog, ChatLogBusy\n"
+            "try:\n    ChatLog(sys.argv[1])\nexcept ChatLogBusy:\n    sys.exit(3)\n")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    assert subprocess.run([sys.executable, '-c', code, str(tmp_path), root]).returncode == 3
+    log.close()
+    assert subprocess.run([sys.executable, '-c', code, str(tmp_path), root]).returncode == 0
+
+
+def test_expired_conversations_stay_expired(tmp_path, monkeypatch):
+    now = [1700000000.0]
+    monkeypatch.setattr(chat_log.time, 'time', lambda: now[0])
+    log = ChatLog(str(tmp_path), retention_seconds=60, fsync=False)
+    log.append('old', msg(1))
+    log.flush()
+    now[0] += 50
+    log.append('new', msg(2))
+    log.flush()
+    now[0] += 20                                     # 'old' pasó la retención, 'new' no
+
+    log.compact()
+    assert log.read('old') == [] and 'old' not in log._seq
+    log.close()
+    # el segmento sigue medio vivo, pero al reiniciar 'old' no vuelve
+    log = ChatLog(str(tmp_path), retention_seconds=60, fsync=False)
+    assert log.read('old') == []
+    assert ids(log.read('new')) == ['m2']
+    log.close()
+
+
+def test_compaction_fsync_runs_without_the_index_lock(tmp_path):
+    held = []
+
+    def offload(fn, *args):
+        held.append(log._lock.locked())
+        return fn(*args)
+
+    log = ChatLog(str(tmp_path), segment_bytes=1, offload=offload)
+    log.append('u1', msg(1))
+    log.flush()                                      # sella el segmento 1
+    log.append('u1', msg(2))
+    log.flush()
+    held.clear()
+    assert log.compact(min_live_ratio=2.0) == 2
+    assert held == [False]
+    assert ids(log.read('u1')) == ['m1', 'm2']
+    log.close()
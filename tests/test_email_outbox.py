@@ -0,0 +1,208 @@
+# Bandeja de salida: backoff entre intentos, leases tras un crash y la Idempotency-Key
+# contra un Resend falso que deduplica por llave.
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from email_outbox import EmailOutbox, PermanentDeliveryError
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'outbox.sqlite3')
+
+
+def make_outbox(db_path, clock, send, notified=None, **kwargs):
+    notify = (lambda user_id, payload: notified.append(payload['status'])) if notified is not None else \
+        (lambda user_id, payload: None)
+    return EmailOutbox(db_path, send, notify, clock=clock, **kwargs)
+
+
+def deliver_due(outbox):
+    """Lo que harían el despachador y los workers, en línea."""
+    claimed = outbox.claim_due()
+    for _ in range(claimed):
+        outbox._deliver(outbox._queue.get_nowait())
+    return claimed
+
+
+def row(outbox, email_id):
+    return dict(outbox._db.execute("SELECT * FROM outbox WHERE id=?", (email_id,)).fetchone())
+
+
+def test_retries_with_exponential_backoff(db_path, clock, monkeypatch):
+    monkeypatch.setattr('email_outbox.random.uniform', lambda a, b: 1.0)   # sin jitter
+    failures = [RuntimeError('503'), RuntimeError('timeout')]
+
+    def send(email):
+        if failures:
+            raise failures.pop(0)
+        return 'resend-1'
+
+    notified = []
+    outbox = make_outbox(db_path, clock, send, notified, backoff=2.0)
+    email_id = outbox.enqueue('u1', 'a@b.mx', 'Resumen', '<p>x</p>', 'UERG', 'summary.pdf')
+
+    assert deliver_due(outbox) == 1
+    first = row(outbox, email_id)
+    assert (first['status'], first['attempts'], first['next_attempt']) == ('pending', 1, clock.now + 2.0)
+    assert deliver_due(outbox) == 0                  # aún no vence
+
+    clock.now += 2.0
+    deliver_due(outbox)
+    assert row(outbox, email_id)['next_attempt'] == clock.now + 4.0
+
+    clock.now += 4.0
+    deliver_due(outbox)
+    done = row(outbox, email_id)
+    assert (done['status'], done['attempts'], done['provider_id']) == ('sent', 3, 'resend-1')
+    assert done['attachment'] is None and done['claimed_at'] is None
+    assert notified == ['pending', 'retrying', 'sent']
+
+
+def test_gives_up_after_max_attempts_and_on_permanent_errors(db_path, clock):
+    def send(email):
+        if email['to_email'] == 'bad':
+            raise PermanentDeliveryError('422')
+        raise RuntimeError('500')
+
+    outbox = make_outbox(db_path, clock, send, max_attempts=2, backoff=0.0)
+    bad = outbox.enqueue('u1', 'bad', 's', 'h')
+    flaky = outbox.enqueue('u1', 'ok@b.mx', 's', 'h')
+    deliver_due(outbox)
+    assert row(outbox, bad)['status'] == 'failed' and row(outbox, bad)['attempts'] == 1
+    assert row(outbox, flaky)['status'] == 'pending'
+    deliver_due(outbox)
+    assert row(outbox, flaky)['status'] == 'failed' and row(outbox, flaky)['attempts'] == 2
+
+
+def test_crashed_worker_lease_expires_without_stealing_live_ones(db_path, clock):
+    sent = []
+    crashed = make_outbox(db_path, clock, sent.append, lease_seconds=60)
+    email_id = crashed.enqueue('u1', 'a@b.mx', 's', 'h')
+    assert crashed.claim_due() == 1                  # lo toma y el proceso "muere" aquí
+
+    # un proceso que arranca mientras tanto no se lo roba
+    restarted = make_outbox(db_path, clock, lambda email: sent.append(email['id']) or 'r-1', lease_seconds=60)
+    assert deliver_due(restarted) == 0
+    assert row(restarted, email_id)['status'] == 'sending'
+
+    clock.now += 61
+    assert deliver_due(restarted) == 1
+    assert sent == [email_id]
+    assert row(restarted, email_id)['status'] == 'sent'
+
+
+def test_worker_that_lost_its_lease_does_not_overwrite(db_path, clock):
+    slow = make_outbox(db_path, clock, lambda email: 'slow', lease_seconds=60)
+    email_id = slow.enqueue('u1', 'a@b.mx', 's', 'h')
+    slow.claim_due()
+    stale = slow._queue.get_nowait()
+
+    clock.now += 61
+    other = make_outbox(db_path, clock, lambda email: 'other', lease_seconds=60)
+    other.claim_due()
+    slow._deliver(stale)                              # llega tarde: el lease ya es de otro
+    assert row(other, email_id)['status'] == 'sending'
+    other._deliver(other._queue.get_nowait())
+    assert row(other, email_id)['provider_id'] == 'other'
+
+
+def test_sqlite_calls_go_through_offload(db_path, clock):
+    calls = []
+
+    def offload(fn, *args):
+        calls.append(fn)
+        return fn(*args)
+
+    outbox = make_outbox(db_path, clock, lambda email: 'r', offload=offload)
+    outbox.enqueue('u1', 'a@b.mx', 's', 'h')
+    deliver_due(outbox)
+    assert outbox.stats() == {'sent': 1}
+    assert len(calls) == 4                            # enqueue, claim, release, stats
+
+
+class FakeResend:
+    """Guarda un correo por Idempotency-Key; `lose_responses` veces responde 500 tras guardarlo."""
+
+    def __init__(self):
+        self.emails = {}
+        self.requests = []
+        self.lose_responses = 0
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                key = self.headers.get('Idempotency-Key')
+                fake.requests.append(key)
+                if key not in fake.emails:
+                    fake.emails[key] = {"id": f"re_{len(fake.emails) + 1}", "to": payload["to"]}
+                if fake.lose_responses:
+                    fake.lose_responses -= 1
+                    status, body = 500, {"message": "internal error"}
+                else:
+                    status, body = 200, {"id": fake.emails[key]["id"]}
+                raw = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/emails'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def resend(monkeypatch):
+    import App
+    from http_client import CircuitBreaker, UpstreamClient
+
+    fake = FakeResend()
+    monkeypatch.setattr(App, 'RESEND_API_KEY', 'test-key')
+    monkeypatch.setattr(App, 'RESEND_API_URL', fake.url)
+    # un solo intento HTTP: los reintentos quedan a cargo de la bandeja
+    monkeypatch.setattr(App, 'RESEND_HTTP', UpstreamClient('resend', retries=0, breaker=CircuitBreaker(100)))
+    yield fake
+    fake.close()
+
+
+def test_idempotency_key_survives_outbox_retries(db_path, clock, resend):
+    import App
+
+    resend.lose_responses = 2                          # Resend lo guardó pero la respuesta se perdió
+    outbox = make_outbox(db_path, clock, App.deliver_outbox_email, backoff=0.0)
+    email_id = outbox.enqueue('u1', 'a@b.mx', 'Resumen', '<p>x</p>', 'UERG', 'summary.pdf')
+    for _ in range(3):
+        deliver_due(outbox)
+
+    assert resend.requests == [email_id] * 3
+    assert len(resend.emails) == 1
+    done = row(outbox, email_id)
+    assert (done['status'], done['attempts'], done['provider_id']) == ('sent', 3, 're_1')
@@ -0,0 +1,168 @@
+# UpstreamClient contra un servidor HTTP local que responde con estados guionizados.
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from http_client import CircuitBreaker, UpstreamClient, UpstreamUnavailable
+
+
+class ScriptedUpstream:
+    """Cada POST consume el siguiente (estado, headers) del guion; al agotarse responde 200."""
+
+    def __init__(self):
+        self.script = []
+        self.calls = 0
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                upstream.calls += 1
+                status, headers = upstream.script.pop(0) if upstream.script else (200, {})
+                body = json.dumps({"status": status}).encode('utf-8')
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/v1'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def upstream():
+    server = ScriptedUpstream()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def sleeps():
+    return []
+
+
+def make_client(sleeps, retries=2, breaker=None):
+    return UpstreamClient('test', retries=retries, breaker=breaker or CircuitBreaker(2, 30.0),
+                          connect_timeout=1, read_timeout=2, sleep=sleeps.append)
+
+
+def test_retries_5xx_then_succeeds(upstream, sleeps):
+    upstream.script = [(503, {}), (502, {})]
+    client = make_client(sleeps)
+    resp = client.post(upstream.url, json={"q": 1})
+    assert resp.status_code == 200
+    assert upstream.calls == 3
+    assert len(sleeps) == 2 and all(0 <= d <= client.max_backoff for d in sleeps)
+    assert client.retried == 2 and client.failed == 0
+    assert client.breaker.state == 'closed'
+
+
+def test_retry_after_is_honored_on_429(upstream, sleeps):
+    upstream.script = [(429, {'Retry-After': '3'})]
+    assert make_client(sleeps).post(upstream.url).status_code == 200
+    assert sleeps == [3.0]
+
+
+def test_retried_responses_are_closed(upstream, sleeps):
+    upstream.script = [(500, {}), (500, {})]
+    client = make_client(sleeps)
+    seen = []
+    post = client.session.post
+    client.session.post = lambda *a, **kw: seen.append(post(*a, **kw)) or seen[-1]
+
+    resp = client.post(upstream.url, stream=True)   # con stream el cuerpo no se lee solo
+    assert resp.status_code == 200
+    assert [r.status_code for r in seen] == [500, 500, 200]
+    assert all(r.raw.closed for r in seen[:-1])
+    assert not resp.raw.closed
+    resp.close()
+
+
+def test_exhausted_retries_return_last_response_and_trip_breaker(upstream, sleeps):
+    upstream.script = [(500, {})] * 6
+    client = make_client(sleeps, retries=1)
+    assert client.post(upstream.url).status_code == 500
+    assert client.failed == 1 and client.breaker.failures == 1
+    assert client.post(upstream.url).status_code == 500
+    assert client.breaker.state == 'open'
+
+    with pytest.raises(UpstreamUnavailable):
+        client.post(upstream.url)
+    assert client.rejected == 1
+    assert upstream.calls == 4
+
+
+def test_4xx_is_neither_success_nor_failure(upstream, sleeps):
+    client = make_client(sleeps, retries=0)
+    upstream.script = [(500, {}), (400, {}), (500, {})]
+    assert client.post(upstream.url).status_code == 500
+    assert client.post(upstream.url).status_code == 400
+    assert client.client_errors == 1 and not sleeps
+    # el 400 no reinició la cuenta: el segundo 500 seguido abre el circuito
+    assert client.post(upstream.url).status_code == 500
+    assert client.breaker.state == 'open'
+
+
+def test_4xx_probe_closes_half_open_breaker(upstream, sleeps):
+    now = [0.0]
+    breaker = CircuitBreaker(1, 10.0, clock=lambda: now[0])
+    client = make_client(sleeps, retries=0, breaker=breaker)
+    upstream.script = [(503, {}), (404, {})]
+    client.post(upstream.url)
+    assert breaker.state == 'open'
+    now[0] = 11.0
+    assert client.post(upstream.url).status_code == 404
+    assert breaker.state == 'closed'
+
+
+def test_connection_errors_are_retried_then_raised(sleeps):
+    server = ScriptedUpstream()
+    url = server.url
+    server.close()                       # nadie escucha en ese puerto
+    client = make_client(sleeps, retries=2)
+    with pytest.raises(requests.ConnectionError):
+        client.post(url)
+    assert len(sleeps) == 2
+    assert client.failed == 1 and client.breaker.failures == 1
+
+
+class Interrupted(BaseException):
+    """Hace las veces de GreenletExit / gevent.Timeout."""
+
+
+def test_interrupted_probe_reopens_breaker(upstream, sleeps):
+    now = [0.0]
+    breaker = CircuitBreaker(1, 10.0, clock=lambda: now[0])
+    client = make_client(sleeps, retries=1, breaker=breaker)
+    upstream.script = [(503, {}), (503, {}), (503, {})]
+    client.post(upstream.url)
+    assert breaker.state == 'open'
+
+    now[0] = 11.0
+    def interrupt(delay):
+        raise Interrupted()
+    client._sleep = interrupt            # se corta durante el backoff de la prueba
+    with pytest.raises(Interrupted):
+        client.post(upstream.url)
+    assert breaker.state == 'open' and breaker.opened_at == 11.0
+
+    now[0] = 22.0
+    client._sleep = sleeps.append
+    assert client.post(upstream.url).status_code == 200
+    assert breaker.state == 'closed'
@@ -0,0 +1,13 @@
+# La fecha impresa la fija quien llama, para que un PDF cacheado no arrastre la de su primer render.
+import pytest
+
+pytest.importorskip('reportlab')
+from reportlab import rl_config
+
+from pdf_render import create_pdf_bytes
+
+
+def test_generated_on_is_the_printed_date(monkeypatch):
+    monkeypatch.setattr(rl_config, 'pageCompression', 0)
+    pdf = create_pdf_bytes("Resumen", "texto", None, [], generated_on='2026-01-02')
+    assert b'Fecha: 2026-01-02' in pdf
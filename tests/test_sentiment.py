@@ -0,0 +1,67 @@
+# El modelo local se entrena fuera del proceso (train_sentiment.py) y se carga ya evaluado.
+import os
+import csv
+import subprocess
+import sys
+
+import joblib
+import pytest
+
+from sentiment import LocalSentiment, train_artifact
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+POSITIVE = ["muchas gracias, me ayudó bastante", "excelente servicio", "perfecto, ya quedó",
+            "genial, gracias por todo", "muy útil, lo recomiendo", "qué bien, todo claro"]
+NEUTRAL = ["¿dónde está la coordinación?", "mi número de control es 2021", "quiero el horario",
+           "estoy en quinto semestre", "¿qué documentos necesito?", "menú principal"]
+NEGATIVE = ["pésimo servicio, nadie responde", "no sirve el enlace, qué mal", "estoy muy molesto",
+            "qué horrible atención", "no me ayudó en nada", "es una pérdida de tiempo"]
+
+
+def corpus():
+    texts = POSITIVE + NEUTRAL + NEGATIVE
+    labels = [1] * len(POSITIVE) + [0] * len(NEUTRAL) + [-1] * len(NEGATIVE)
+    return texts, labels
+
+
+def test_artifact_carries_evaluation(tmp_path):
+    artifact = train_artifact(*corpus(), folds=3)
+    metrics = artifact['metrics']
+    assert metrics['samples'] == 18 and metrics['folds'] == 3
+    assert set(metrics['f1_by_class']) == {-1, 0, 1}
+    assert 0.0 <= metrics['macro_f1'] <= 1.0
+
+    path = tmp_path / 'sentiment.joblib'
+    joblib.dump(artifact, path)
+    engine = LocalSentiment.load(str(path))
+    assert engine.metrics == metrics
+    analysis = engine.analyze_conversation([
+        {"message_id": "a", "text": "muchas gracias, excelente", "sender": "Alumno"},
+        {"message_id": "b", "text": "", "sender": "Alumno"},
+    ])
+    assert analysis["engine"] == "local" and set(analysis["messages"]) == {"a"}
+
+
+def test_load_requires_a_model_path():
+    with pytest.raises(ValueError):
+        LocalSentiment.load(None)
+
+
+def test_training_script_refuses_a_weak_model(tmp_path):
+    path = tmp_path / 'corpus.csv'
+    texts, labels = corpus()
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['text', 'label'])
+        names = {1: 'positivo', 0: 'neutral', -1: 'negativo'}
+        writer.writerows((t, names[label]) for t, label in zip(texts, labels))
+
+    output = tmp_path / 'model.joblib'
+    script = [sys.executable, 'train_sentiment.py', str(path), '-o', str(output), '--folds', '3']
+    refused = subprocess.run(script + ['--min-macro-f1', '1.01'], cwd=ROOT, capture_output=True, text=True)
+    assert refused.returncode != 0 and not output.exists()
+
+    written = subprocess.run(script + ['--min-macro-f1', '0'], cwd=ROOT, capture_output=True, text=True)
+    assert written.returncode == 0, written.stderr
+    assert LocalSentiment.load(str(output)).metrics['samples'] == 18
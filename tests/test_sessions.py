@@ -0,0 +1,103 @@
+# Sesiones reanudables con dos workers (dos registros) sobre el mismo estado compartido:
+# la rueda de expiración es local, el marcador de sesión no.
+import pytest
+
+from sessions import SessionRegistry, TimerWheel
+from state_backend import InMemoryState, RedisState
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(params=['memory', 'redis'])
+def shared(request):
+    if request.param == 'memory':
+        return InMemoryState()
+    fakeredis = pytest.importorskip('fakeredis')
+    return RedisState(fakeredis.FakeRedis())
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def make_workers(shared, clock, expired):
+    def worker(owner):
+        return SessionRegistry('secret', idle_ttl=10, tick=1.0, clock=clock, shared=shared, owner=owner,
+                               on_expire=lambda user_id: expired.append((owner, user_id)))
+    return worker('w1'), worker('w2')
+
+
+def test_resume_on_another_worker_cancels_the_pending_expiry(shared, clock):
+    expired = []
+    w1, w2 = make_workers(shared, clock, expired)
+    session, token = w1.open('sid-a', 'Ana')
+    shared.set_client(session.user_id, {'name': 'Ana'})
+
+    w1.detach('sid-a')                               # w1 agenda la expiración
+    resumed = w2.resume('sid-b', token, lambda uid: (shared.get_client(uid) or {}).get('name'))
+    assert resumed.user_id == session.user_id and resumed.name == 'Ana'
+
+    clock.now += 11
+    assert w1.expire_due() == []                     # w2 la retomó: w1 sólo suelta su copia
+    assert w1.get(session.user_id) is None
+    assert expired == []
+
+    w2.detach('sid-b')
+    clock.now += 11
+    assert w2.expire_due() == [session.user_id]
+    assert expired == [('w2', session.user_id)]
+
+
+def test_live_socket_on_another_worker_keeps_the_conversation(shared, clock):
+    expired = []
+    w1, w2 = make_workers(shared, clock, expired)
+    session, token = w1.open('sid-a', 'Ana')
+    w2.resume('sid-b', token, lambda uid: 'Ana')     # segunda pestaña en otro worker
+
+    w2.detach('sid-b')
+    clock.now += 11
+    assert w2.expire_due() == []                     # w1 todavía tiene su socket
+    assert expired == []
+
+    w1.detach('sid-a')
+    clock.now += 11
+    assert w1.expire_due() == [session.user_id]
+    assert expired == [('w1', session.user_id)]
+
+
+def test_reconnect_on_the_same_worker_before_the_ttl(shared, clock):
+    expired = []
+    w1, _ = make_workers(shared, clock, expired)
+    session, token = w1.open('sid-a', 'Ana')
+    w1.detach('sid-a')
+    clock.now += 5
+    assert w1.resume('sid-c', token) is session
+    clock.now += 20
+    assert w1.expire_due() == [] and expired == []
+
+
+def test_tampered_token_is_rejected(shared, clock):
+    w1, w2 = make_workers(shared, clock, [])
+    _, token = w1.open('sid-a', 'Ana')
+    assert w2.verify(token) is not None              # mismo SESSION_SECRET en ambos
+    assert w2.resume('sid-b', token[:-1] + ('0' if token[-1] != '0' else '1'), lambda uid: 'Ana') is None
+
+
+def test_timer_wheel_cancel_and_reschedule(clock):
+    wheel = TimerWheel(tick=1.0, slots=4, clock=clock)
+    wheel.schedule('a', 2)
+    wheel.schedule('b', 9)                           # más de una vuelta de la rueda
+    wheel.schedule('c', 2)
+    wheel.cancel('c')
+    clock.now += 3
+    assert wheel.advance() == ['a']
+    clock.now += 7
+    assert wheel.advance() == ['b']
+    assert len(wheel) == 0
@@ -0,0 +1,27 @@
+# Los handlers del alumno ignoran payloads malformados en lugar de lanzar AttributeError.
+import pytest
+
+import App
+
+
+@pytest.fixture
+def client():
+    client = App.socketio.test_client(App.app)
+    client.emit('register_name', {'name': 'Ana'})
+    client.get_received()
+    yield client
+    client.disconnect()
+
+
+@pytest.mark.parametrize('payload', [None, 'hola', 42, ['q'], {'text': 5}, {'q': None}])
+def test_malformed_payloads_are_ignored(client, payload):
+    client.emit('message', payload)
+    client.emit('menu_autocomplete', payload)
+    assert client.get_received() == []
+    assert client.is_connected()
+
+
+def test_autocomplete_answers_a_valid_query(client):
+    client.emit('menu_autocomplete', {'q': 'ins', 'seq': 3})
+    (event,) = [e for e in client.get_received() if e['name'] == 'menu_autocomplete_results']
+    assert event['args'][0]['seq'] == 3
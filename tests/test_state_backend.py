@@ -0,0 +1,61 @@
+# RedisState contra fakeredis: mismo contrato que InMemoryState, así que dos
+# workers que comparten el servidor ven los mismos clientes e historiales.
+import pytest
+
+from state_backend import InMemoryState, RedisState, make_state_backend, page_history
+
+fakeredis = pytest.importorskip('fakeredis')
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+def make_worker(server, max_messages=5):
+    return RedisState(fakeredis.FakeRedis(server=server), max_messages=max_messages)
+
+
+def msg(i, sender='client'):
+    return {"message_id": f"m{i}", "from": sender, "text": f"mensaje {i}"}
+
+
+def test_clients_are_shared_between_workers(server):
+    a, b = make_worker(server), make_worker(server)
+    a.set_client('u1', {"name": "Ana"})
+    b.set_client('u2', {"name": "Beto"})
+
+    assert b.get_client('u1') == {"name": "Ana"}
+    assert sorted(a.list_clients()) == [('u1', {"name": "Ana"}), ('u2', {"name": "Beto"})]
+
+    b.remove_client('u1')
+    assert a.get_client('u1') is None
+    assert [uid for uid, _ in a.list_clients()] == ["u2"]
+
+
+def test_history_is_trimmed_to_max_messages(server):
+    a, b = make_worker(server, max_messages=5), make_worker(server, max_messages=5)
+    a.append_messages('u1', *[msg(i) for i in range(4)])
+    b.append_messages('u1', msg(4), msg(5), msg(6))
+
+    history = a.get_history('u1')
+    assert [m["message_id"] for m in history] == ['m2', 'm3', 'm4', 'm5', 'm6']
+
+    page = page_history(history, since='m4')
+    assert [m["message_id"] for m in page["messages"]] == ['m5', 'm6']
+    assert page_history(history, since='m0')["reset"] is True
+    with pytest.raises(ValueError):
+        page_history(history, before='m5', since='m3')
+
+
+def test_drop_chat(server):
+    a, b = make_worker(server), make_worker(server)
+    a.append_messages('u1', msg(1))
+    a.append_messages('u2', msg(2))
+    b.drop_chat('u1')
+    assert a.get_history('u1') == []
+    assert [m["message_id"] for m in a.get_history('u2')] == ['m2']
+
+
+def test_without_redis_url_uses_memory():
+    assert isinstance(make_state_backend(None), InMemoryState)
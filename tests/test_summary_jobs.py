@@ -0,0 +1,57 @@
+# ProcessOffloader: un hijo sólo vuelve al pool si su respuesta se leyó completa.
+import pytest
+
+import summary_jobs
+from summary_jobs import ProcessOffloader
+
+
+class Interrupted(BaseException):
+    """Hace las veces de GreenletExit / gevent.Timeout."""
+
+
+class FakeChild:
+    spawned = []
+
+    def __init__(self):
+        self.killed = False
+        self.behaviour = None
+        FakeChild.spawned.append(self)
+
+    def call(self, fn, args):
+        if self.behaviour:
+            raise self.behaviour
+        return fn(*args)
+
+    def kill(self):
+        self.killed = True
+
+
+@pytest.fixture
+def offloader(monkeypatch):
+    FakeChild.spawned = []
+    monkeypatch.setattr(summary_jobs, '_ChildProcess', FakeChild)
+    return ProcessOffloader(processes=1)
+
+
+def test_interrupted_child_is_replaced(offloader):
+    assert offloader.run(sum, [1, 2]) == 3
+    (first,) = FakeChild.spawned
+
+    first.behaviour = Interrupted()
+    with pytest.raises(Interrupted):
+        offloader.run(sum, [1, 2])
+    assert first.killed
+
+    assert offloader.run(sum, [3, 4]) == 7
+    assert len(FakeChild.spawned) == 2 and not FakeChild.spawned[1].killed
+
+
+def test_failed_function_keeps_the_child(offloader):
+    offloader.run(sum, [1])
+    (child,) = FakeChild.spawned
+    child.behaviour = summary_jobs._ChildError("ValueError: x")
+    with pytest.raises(RuntimeError):
+        offloader.run(sum, [1])
+    child.behaviour = None
+    assert offloader.run(sum, [1]) == 1
+    assert FakeChild.spawned == [child] and not child.killed
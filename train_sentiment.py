@@ -0,0 +1,60 @@
+# train_sentiment.py
+# Entrena y evalúa el modelo de polaridad local (SENTIMENT_BACKEND=local). Lee un
+# corpus etiquetado en CSV (columnas `text` y `label`: positivo / neutral /
+# negativo, o 1 / 0 / -1), mide el modelo con validación cruzada estratificada y
+# sólo escribe el artefacto joblib (pipeline + métricas) si alcanza --min-macro-f1.
+#
+#   python train_sentiment.py corpus.csv -o models/sentiment.joblib
+#   SENTIMENT_BACKEND=local SENTIMENT_MODEL_PATH=models/sentiment.joblib gunicorn ...
+import os
+import sys
+import csv
+import json
+import argparse
+
+from sentiment import LABELS, train_artifact
+
+
+def read_corpus(path):
+    texts, labels = [], []
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            text = (row.get('text') or '').strip()
+            raw = (row.get('label') or '').strip().lower()
+            label = LABELS.get(raw)
+            if label is None and raw.lstrip('-').isdigit():
+                label = int(raw)
+            if not text or label not in (1, 0, -1):
+                continue
+            texts.append(text)
+            labels.append(label)
+    return texts, labels
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Entrena y evalúa el modelo de polaridad local")
+    parser.add_argument('corpus', help="CSV con columnas text,label")
+    parser.add_argument('-o', '--output', required=True, help="ruta del artefacto joblib")
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--min-macro-f1', type=float, default=0.7,
+                        help="no escribe el artefacto si la validación cruzada queda por debajo")
+    args = parser.parse_args()
+
+    texts, labels = read_corpus(args.corpus)
+    missing = {1, 0, -1} - set(labels)
+    if missing:
+        sys.exit(f"el corpus no tiene ejemplos de las clases {sorted(missing)}")
+
+    artifact = train_artifact(texts, labels, args.folds)
+    print(json.dumps(artifact['metrics'], indent=2))
+    if artifact['metrics']['macro_f1'] < args.min_macro_f1:
+        sys.exit(f"F1 macro {artifact['metrics']['macro_f1']} < {args.min_macro_f1}: no se escribe el artefacto")
+
+    import joblib
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    joblib.dump(artifact, args.output)
+    print(f"artefacto escrito en {args.output}")
+
+
+if __name__ == '__main__':
+    main()
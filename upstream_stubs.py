@@ -0,0 +1,142 @@
+# upstream_stubs.py
+# Stand-ins locales de Gemma, la API de polaridad y Resend para correr el flujo del
+# resumen (y las pruebas de carga) sin red ni llaves reales. Latencias y tasa de
+# error configurables para ver cómo se comporta la app con upstreams lentos.
+#
+#   python upstream_stubs.py --port 8099 --gemma-latency 1.5 --fail-rate 0.1
+#
+# y la app apuntando a ellos:
+#   GEMMA_API_KEY=stub GEMMA_API_BASE=http://127.0.0.1:8099 \
+#   SENTIMENT_API_URL=http://127.0.0.1:8099/sentiment \
+#   RESEND_API_KEY=stub RESEND_API_URL=http://127.0.0.1:8099/emails python App.py
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STUB_SUMMARY = (
+    "El alumno consultó el menú de oferta educativa y revisó la retícula de su carrera. "
+    "Preguntó por fechas de inscripción y se le compartieron los enlaces oficiales. "
+    "Se recomienda revisar el calendario escolar y acudir a servicios escolares si persisten dudas."
+)
+
+
+class StubConfig:
+    def __init__(self, gemma_latency=0.8, chunk_delay=0.05, sentiment_latency=0.1,
+                 resend_latency=0.2, fail_rate=0.0):
+        self.gemma_latency = gemma_latency
+        self.chunk_delay = chunk_delay
+        self.sentiment_latency = sentiment_latency
+        self.resend_latency = resend_latency
+        self.fail_rate = fail_rate
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def count(self, name):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+
+def _candidate(text):
+    return {"candidates": [{"content": {"parts": [{"text": text}]}}]}
+
+
+def make_handler(config):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def _json(self, status, data):
+            body = json.dumps(data).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            self.rfile.read(length)
+            path = self.path.split('?', 1)[0]
+
+            if config.fail_rate and random.random() < config.fail_rate:
+                config.count('failed')
+                self._json(503, {"error": "stub: fallo simulado"})
+                return
+
+            if path.endswith(':generateContent'):
+                config.count('gemma')
+                time.sleep(config.gemma_latency)
+                self._json(200, _candidate(STUB_SUMMARY))
+            elif path.endswith(':streamGenerateContent'):
+                config.count('gemma_stream')
+                self._stream()
+            elif path == '/sentiment':
+                config.count('sentiment')
+                time.sleep(config.sentiment_latency)
+                self._json(200, {"polaridad": "positivo", "score": 0.42})
+            elif path == '/emails':
+                config.count('resend')
+                time.sleep(config.resend_latency)
+                self._json(200, {"id": uuid.uuid4().hex})
+            else:
+                self._json(404, {"error": f"stub: ruta desconocida {path}"})
+
+        def _stream(self):
+            # primer token tras la latencia de Gemma; luego una palabra por chunk
+            time.sleep(config.gemma_latency)
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            for word in STUB_SUMMARY.split(' '):
+                event = json.dumps(_candidate(word + ' '))
+                self.wfile.write(f"data: {event}\r\n\r\n".encode('utf-8'))
+                self.wfile.flush()
+                time.sleep(config.chunk_delay)
+            self.close_connection = True
+
+        def do_GET(self):
+            # GET /stats: cuántas llamadas recibió cada stand-in
+            self._json(200, config.counts)
+
+    return Handler
+
+
+def start_stubs(port=0, config=None):
+    """Arranca los stand-ins en un hilo; devuelve (server, url_base)."""
+    config = config or StubConfig()
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-ins locales de Gemma, polaridad y Resend")
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--gemma-latency', type=float, default=0.8, help="segundos hasta la respuesta / primer token")
+    parser.add_argument('--chunk-delay', type=float, default=0.05, help="segundos entre chunks del streaming")
+    parser.add_argument('--sentiment-latency', type=float, default=0.1)
+    parser.add_argument('--resend-latency', type=float, default=0.2)
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="fracción de peticiones que responden 503")
+    args = parser.parse_args()
+
+    config = StubConfig(args.gemma_latency, args.chunk_delay, args.sentiment_latency,
+                        args.resend_latency, args.fail_rate)
+    server, url = start_stubs(args.port, config)
+    print(f"Stand-ins escuchando en {url}  (Ctrl+C para salir)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()